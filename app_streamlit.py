@@ -7,13 +7,17 @@ import streamlit as st
 from datetime import datetime, timezone
 import importlib.util
 import html
-from openpyxl.utils import get_column_letter
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from openpyxl.styles import Font, Alignment, numbers
 import base64
 import json
 
+import report_cache
+from reclaim import compute_prejuizo
+from query_builder import Where
+from sqlite_pool import ConnectionPool
+from xlsx_export import write_xlsx
+
 DT_CSS = "https://cdn.datatables.net/1.13.6/css/jquery.dataTables.min.css"
 DT_JS = "https://cdn.datatables.net/1.13.6/js/jquery.dataTables.min.js"
 JQ = "https://code.jquery.com/jquery-3.5.1.js"
@@ -204,6 +208,7 @@ def render_interactive_table(df, table_id='tbl'):
     return safe
 
 DB_PATH = Path('ml_devolucoes.db')
+REPORT_CACHE_DIR = report_cache.default_dir(DB_PATH)
 
 
 def _download_db_from_env():
@@ -245,11 +250,76 @@ def _download_db_from_env():
 # fetch fails, the rest of the app will surface an explanatory error later.
 _download_db_from_env()
 
+
+@st.cache_resource
+def _db_seen():
+    # process-wide holder for the last data version seen by any session
+    return {}
+
+
+@st.cache_resource
+def _db():
+    # process-wide connection pool: reruns reuse warm read connections and
+    # writes (reviews, actions) go through one serialized writer
+    return ConnectionPool(DB_PATH)
+
+
+# tables whose run_ids change only when data is loaded: the ETL manifest
+# (etl_to_sqlite / watch_ingest) and the last normalization (migrate_normalize_db)
+LOAD_STATE_TABLES = ('etl_manifest', 'normalize_state')
+# counter bumped by every ETL load and normalization (etl_to_sqlite.bump_load_version)
+LOAD_VERSION_TABLE = 'etl_load_version'
+
+
+def _table_exists(con, table):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _data_version():
+    """Load counter plus latest run_id and file count of each load-state
+    table. Reviews and actions written by the app don't change it, unlike
+    the DB file stats. run_ids alone have one-second resolution and a
+    normalization --full doesn't touch them, hence the counter."""
+    if not DB_PATH.exists():
+        return None
+    version = []
+    with _db().reader() as con:
+        if _table_exists(con, LOAD_VERSION_TABLE):
+            version.append(con.execute(f'SELECT version FROM {LOAD_VERSION_TABLE}').fetchone())
+        else:
+            version.append(None)
+        for table in LOAD_STATE_TABLES:
+            if _table_exists(con, table):
+                version.append(tuple(con.execute(f'SELECT MAX(run_id), COUNT(*) FROM {table}').fetchone()))
+            else:
+                version.append(None)
+    return tuple(version)
+
+
+def _clear_cache_if_db_changed():
+    """Drop cached query results when new data was loaded (e.g. the
+    watch_ingest.py daemon loaded a new export or the normalization ran), so
+    fresh data shows up on the next rerun without restarting the app."""
+    version = _data_version()
+    seen = _db_seen()
+    if seen.get('version') not in (None, version):
+        st.cache_data.clear()
+    seen['version'] = version
+
+
+_clear_cache_if_db_changed()
+
+def _month_expr(con, alias=''):
+    """Year-month of an order: the indexed `ano_mes` column written by
+    migrate_normalize_db, or substr() on databases normalized before it."""
+    cols = [r[1] for r in con.execute('PRAGMA table_info(orders)')]
+    return f'{alias}ano_mes' if 'ano_mes' in cols else f'substr({alias}data_venda,1,7)'
+
+
 @st.cache_data
 def get_months():
-    con = sqlite3.connect(DB_PATH)
-    df = pd.read_sql("SELECT DISTINCT substr(data_venda,1,7) as ym FROM orders ORDER BY ym DESC", con)
-    con.close()
+    with _db().reader() as con:
+        df = pd.read_sql(f"SELECT DISTINCT {_month_expr(con)} as ym FROM orders ORDER BY ym DESC", con)
     months = df['ym'].dropna().tolist()
     return months
 
@@ -257,22 +327,21 @@ def get_months():
 @st.cache_data
 def get_return_reasons():
     """Return a sorted list of distinct motivo_resultado values from orders/returns."""
-    con = sqlite3.connect(DB_PATH)
     reasons = set()
-    try:
-        # check orders table first
-        df = pd.read_sql('SELECT DISTINCT motivo_resultado FROM orders WHERE motivo_resultado IS NOT NULL', con)
-        if not df.empty:
-            reasons.update(df['motivo_resultado'].dropna().astype(str).tolist())
-    except Exception:
-        pass
-    try:
-        df2 = pd.read_sql('SELECT DISTINCT motivo_resultado FROM returns WHERE motivo_resultado IS NOT NULL', con)
-        if not df2.empty:
-            reasons.update(df2['motivo_resultado'].dropna().astype(str).tolist())
-    except Exception:
-        pass
-    con.close()
+    with _db().reader() as con:
+        try:
+            # check orders table first
+            df = pd.read_sql('SELECT DISTINCT motivo_resultado FROM orders WHERE motivo_resultado IS NOT NULL', con)
+            if not df.empty:
+                reasons.update(df['motivo_resultado'].dropna().astype(str).tolist())
+        except Exception:
+            pass
+        try:
+            df2 = pd.read_sql('SELECT DISTINCT motivo_resultado FROM returns WHERE motivo_resultado IS NOT NULL', con)
+            if not df2.empty:
+                reasons.update(df2['motivo_resultado'].dropna().astype(str).tolist())
+        except Exception:
+            pass
     return sorted([r for r in reasons if r and str(r).strip()])
 
 # config path for persisted list of motivos considered "passíveis"
@@ -317,108 +386,151 @@ PASSIVEIS_MOTIVO_SUBSTRINGS = [
     'mercadoenvios'
 ]
 
+# SKU filter labels -> query_builder.SKU_MODES
+SKU_MATCH_MODES = {'Contém': 'contains', 'Começa com': 'prefix', 'Exato': 'exact'}
+
 @st.cache_data
-def load_financials(month=None, month_from=None, month_to=None, only_pending=False, only_loss=False, sku_filter=None, motivo_filter=None):
-    con = sqlite3.connect(DB_PATH)
+def load_financials(month=None, month_from=None, month_to=None, only_pending=False, only_loss=False, sku_filter=None, motivo_filter=None, sku_mode='contains'):
     q = 'SELECT o.order_id, o.data_venda, o.total_brl, o._valor_passivel_extorno, o._valor_pendente, o.dinheiro_liberado, oi.sku, oi.preco_unitario, oi.unidades, o.resultado, o.mes_faturamento FROM orders o JOIN order_items oi ON o.order_id=oi.order_id'
-    filters = []
+    # every value is a bound parameter, so the statement text only depends on
+    # which filters are active; months are half-open data_venda ranges
+    where = Where()
     # support either a single month (backwards-compatible) or a month range
     if month:
-        filters.append(f"substr(o.data_venda,1,7) = '{month}'")
+        where.month_range('o.data_venda', month, month)
     else:
-        if month_from:
-            filters.append(f"substr(o.data_venda,1,7) >= '{month_from}'")
-        if month_to:
-            filters.append(f"substr(o.data_venda,1,7) <= '{month_to}'")
+        where.month_range('o.data_venda', month_from, month_to)
     # filter to only rows that likely require an estorno: orders with negative total
     if only_loss:
         # ensure we return orders where the canonical total is negative
-        filters.append('o.total_brl < 0')
+        where.add('o.total_brl < 0')
     elif only_pending:
         # legacy heuristic: _valor_pendente > 0
-        filters.append('o._valor_pendente > 0')
-    if sku_filter:
-        # simple like
-        filters.append(f"oi.sku LIKE '%{sku_filter}%'")
+        where.add('o._valor_pendente > 0')
+    # case-insensitive; 'prefix' and 'exact' use the NOCASE sku index
+    where.sku('oi.sku', sku_filter, sku_mode)
     # motivo_filter can be a list of strings; match orders.motivo_resultado
-    if motivo_filter:
-        # sanitize values and build SQL IN clause
-        vals = [str(v).replace("'", "''") for v in motivo_filter]
-        if vals:
-            quoted = ','.join([f"'{v}'" for v in vals])
-            filters.append(f"o.motivo_resultado IN ({quoted})")
-    if filters:
-        q += ' WHERE ' + ' AND '.join(filters)
+    where.one_of('o.motivo_resultado', motivo_filter)
+    q += where.sql
     # order losses first (more negative totals at the top) when using the loss filter,
     # otherwise fall back to pending heuristic ordering for debugging.
     if only_loss:
         q += ' ORDER BY o.total_brl ASC'
     else:
         q += ' ORDER BY o._valor_pendente DESC'
-    df = pd.read_sql(q, con)
-    con.close()
+    with _db().reader() as con:
+        df = pd.read_sql(q, con, params=where.params)
     # post-process types
     if 'data_venda' in df.columns:
-        df['data_venda'] = pd.to_datetime(df['data_venda'], errors='coerce')
+        df['data_venda'] = pd.to_datetime(df['data_venda'], format='ISO8601', errors='coerce')
     numeric_cols = ['total_brl', '_valor_passivel_extorno', '_valor_pendente', 'dinheiro_liberado', 'preco_unitario']
     for c in numeric_cols:
         if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
-    # Derived columns for clearer business semantics
-    # 'prejuizo_real_signed' = signed total (negative when the order is a net loss)
-    # 'prejuizo_real' = absolute magnitude of that prejudice (positive number)
-    # 'prejuizo_pendente_calc' = magnitude still pending (>=0)
-    # 'prejuizo_pendente_signed' = signed pending amount (negative when there is an outstanding loss)
-    if 'total_brl' in df.columns:
-        # "Prejuízo" should reflect the signed total reported by Mercado Livre
-        # i.e. negative when the net result is a loss. Keep an explicit field
-        # for UI convenience that is exactly the ledger `total_brl`.
-        df['prejuizo_real_signed'] = df['total_brl']
-        # magnitude-only (positive) when there is a loss, zero otherwise
-        df['prejuizo_real'] = df['prejuizo_real_signed'].where(df['prejuizo_real_signed'] < 0, 0.0).abs()
-    else:
-        df['prejuizo_real_signed'] = 0.0
-        df['prejuizo_real'] = 0.0
+            # money columns are REAL in the typed schema; only legacy DBs need coercion
+            if not pd.api.types.is_float_dtype(df[c]):
+                df[c] = pd.to_numeric(df[c], errors='coerce')
+            df[c] = df[c].fillna(0.0)
+    # Derived columns for clearer business semantics (see reclaim.compute_prejuizo):
+    # 'prejuizo_real_signed' is the signed ledger total_brl, 'prejuizo_real' its
+    # loss magnitude, 'prejuizo_pendente_calc'/'_signed' the part not yet covered
+    # by dinheiro_liberado. The pending columns are internal heuristics kept for
+    # debugging; they are not the canonical "Prejuízo pendente" shown to users.
     if 'dinheiro_liberado' not in df.columns:
         df['dinheiro_liberado'] = 0.0
-    # pending magnitude (positive) and signed version (negative to match ML UI semantics)
-    # keep internal heuristics but they should NOT be presented to users as the
-    # canonical "Prejuízo pendente". We'll keep the columns for debugging and
-    # internal inspection but hide them from the main UI and exports.
-    df['prejuizo_pendente_calc'] = (df['prejuizo_real'] - df['dinheiro_liberado']).clip(lower=0.0)
-    df['prejuizo_pendente_signed'] = -df['prejuizo_pendente_calc']
+    df = compute_prejuizo(df)
+    return df
+
+
+@st.cache_data
+def load_summary(month_from=None, month_to=None, sku_filter=None, motivo_filter=None, sku_mode='contains'):
+    """Day x SKU aggregates (receita, pedidos, devolucoes) for the Metrics tab.
+
+    Reads the summary_day_sku_motivo table kept by migrate_normalize_db, so
+    the cost depends on the number of days/SKUs rather than on the number of
+    orders. Databases normalized before that table existed fall back to
+    aggregating load_financials in pandas."""
+    with _db().reader() as con:
+        has_summary = con.execute("SELECT 1 FROM sqlite_master WHERE name = 'summary_day_sku_motivo'").fetchone()
+    if not has_summary:
+        df = load_financials(month_from=month_from, month_to=month_to, sku_filter=sku_filter, motivo_filter=motivo_filter, sku_mode=sku_mode)
+        df = df.assign(dia=df['data_venda'].dt.strftime('%Y-%m-%d'), devolucoes=df['total_brl'].lt(0))
+        return df.groupby(['dia', 'sku']).agg(
+            pedidos=('order_id', 'nunique'), receita=('total_brl', 'sum'), devolucoes=('devolucoes', 'sum')
+        ).reset_index()
+    # ano_mes is indexed on the summary table, so months stay a range on it
+    where = Where()
+    if month_from:
+        where.add('ano_mes >= ?', month_from)
+    if month_to:
+        where.add('ano_mes <= ?', month_to)
+    where.sku('sku', sku_filter, sku_mode)
+    where.one_of('motivo_resultado', motivo_filter)
+    q = 'SELECT dia, sku, SUM(pedidos) AS pedidos, SUM(receita) AS receita, SUM(devolucoes) AS devolucoes FROM summary_day_sku_motivo'
+    q += where.sql
+    q += ' GROUP BY dia, sku'
+    with _db().reader() as con:
+        df = pd.read_sql(q, con, params=where.params)
+    return df
+
+
+@st.cache_data
+def load_order_counts(month_from=None, month_to=None, sku_filter=None, motivo_filter=None, sku_mode='contains'):
+    """Distinct orders and returned orders (total_brl < 0) per day for the
+    Metrics tab. `pedidos`/`devolucoes` in summary_day_sku_motivo count an
+    order once per SKU group; an order has a single data_venda and motivo,
+    so the per-day counts of summary_day_motivo add up to distinct totals.
+    That table has no SKU, so a SKU filter (or a database normalized before
+    it existed) falls back to orders JOIN order_items."""
+    with _db().reader() as con:
+        has_summary = con.execute("SELECT 1 FROM sqlite_master WHERE name = 'summary_day_motivo'").fetchone()
+    where = Where()
+    if has_summary and not sku_filter:
+        if month_from:
+            where.add('ano_mes >= ?', month_from)
+        if month_to:
+            where.add('ano_mes <= ?', month_to)
+        where.one_of('motivo_resultado', motivo_filter)
+        q = 'SELECT dia, SUM(pedidos) AS pedidos, SUM(devolucoes) AS devolucoes FROM summary_day_motivo'
+    else:
+        where.month_range('o.data_venda', month_from, month_to)
+        where.sku('oi.sku', sku_filter, sku_mode)
+        where.one_of('o.motivo_resultado', motivo_filter)
+        q = ('SELECT substr(o.data_venda, 1, 10) AS dia, COUNT(DISTINCT o.order_id) AS pedidos, '
+             'COUNT(DISTINCT CASE WHEN o.total_brl < 0 THEN o.order_id END) AS devolucoes '
+             'FROM orders o JOIN order_items oi ON o.order_id = oi.order_id')
+    q += where.sql
+    q += ' GROUP BY dia'
+    with _db().reader() as con:
+        df = pd.read_sql(q, con, params=where.params)
     return df
 
 
 def ensure_reviews_table():
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            order_id TEXT PRIMARY KEY,
-            reviewed INTEGER DEFAULT 0,
-            reviewed_by TEXT,
-            reviewed_at TEXT,
-            review_description TEXT
-        )
-    ''')
-    # Ensure older installations have the review_description column
-    cur.execute("PRAGMA table_info(reviews)")
-    cols = [r[1] for r in cur.fetchall()]
-    if 'review_description' not in cols:
-        try:
-            cur.execute("ALTER TABLE reviews ADD COLUMN review_description TEXT")
-        except Exception:
-            pass
-    con.commit()
-    con.close()
+    with _db().writer() as con:
+        cur = con.cursor()
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS reviews (
+                order_id TEXT PRIMARY KEY,
+                reviewed INTEGER DEFAULT 0,
+                reviewed_by TEXT,
+                reviewed_at TEXT,
+                review_description TEXT
+            )
+        ''')
+        # Ensure older installations have the review_description column
+        cur.execute("PRAGMA table_info(reviews)")
+        cols = [r[1] for r in cur.fetchall()]
+        if 'review_description' not in cols:
+            try:
+                cur.execute("ALTER TABLE reviews ADD COLUMN review_description TEXT")
+            except Exception:
+                pass
 
 
 def get_reviews_map():
     ensure_reviews_table()
-    con = sqlite3.connect(DB_PATH)
-    df = pd.read_sql('SELECT order_id, reviewed, reviewed_by, reviewed_at, review_description FROM reviews', con)
-    con.close()
+    with _db().reader() as con:
+        df = pd.read_sql('SELECT order_id, reviewed, reviewed_by, reviewed_at, review_description FROM reviews', con)
     if df.empty:
         return {}
     return df.set_index('order_id').to_dict(orient='index')
@@ -426,24 +538,20 @@ def get_reviews_map():
 
 def set_review(order_id: str, reviewed: bool, user: str = 'operator', description: str = None):
     ensure_reviews_table()
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
     # store timestamps in UTC to avoid server/local timezone drift
     now = datetime.now(tz=timezone.utc).isoformat()
-    # Use REPLACE so we update existing rows; include review_description
-    cur.execute('REPLACE INTO reviews (order_id, reviewed, reviewed_by, reviewed_at, review_description) VALUES (?,?,?,?,?)',
-                (order_id, 1 if reviewed else 0, user if reviewed else None, now if reviewed else None, description if reviewed else None))
     try:
-        con.commit()
-    except Exception as e:
+        with _db().writer() as con:
+            # Use REPLACE so we update existing rows; include review_description
+            con.execute('REPLACE INTO reviews (order_id, reviewed, reviewed_by, reviewed_at, review_description) VALUES (?,?,?,?,?)',
+                        (order_id, 1 if reviewed else 0, user if reviewed else None, now if reviewed else None, description if reviewed else None))
+    except sqlite3.OperationalError as e:
         # persist a small debug file to help diagnose write failures in prod
         try:
             with open('review_error.log', 'a', encoding='utf-8') as ef:
                 ef.write(f"Commit failed for set_review order_id={order_id} reviewed={reviewed} error={repr(e)}\n")
         except Exception:
             pass
-    finally:
-        con.close()
     # Audit the action so we can trace whether reviews were attempted in prod
     try:
         save_action(order_id, user or 'operator', 'set_review', f'reviewed={1 if reviewed else 0} reviewed_at={now if reviewed else None}')
@@ -456,67 +564,35 @@ def set_review(order_id: str, reviewed: bool, user: str = 'operator', descriptio
 
 
 def create_xlsx_export(df: pd.DataFrame, path: Path, display_names: dict):
-    # df already contains display columns and a 'Revisado' column
+    # df already contains display columns and a 'Revisado' column.
+    # Rows are streamed to disk (xlsx_export, openpyxl write-only): currency
+    # format and Order ID links are set per column, links as HYPERLINK formulas.
     try:
-        # use context manager to ensure compatibility with newer pandas/openpyxl
-        with pd.ExcelWriter(path, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Export')
-            wb = writer.book
-            ws = writer.sheets['Export']
-        # header style
-        header_font = Font(bold=True, color='000000')
-        for col_idx, col in enumerate(df.columns, start=1):
-            cell = ws.cell(row=1, column=col_idx)
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-            # column width
-            max_len = max(df[col].astype(str).map(len).max() if not df.empty else 10, len(col))
-            ws.column_dimensions[get_column_letter(col_idx)].width = min(max_len + 4, 50)
-            # currency formatting if column looks like currency
-            if col.lower().find('r$')!=-1 or 'valor' in col.lower() or 'receita' in col.lower() or 'preço' in col.lower() or 'preco' in col.lower():
-                for r in range(2, 2 + len(df)):
-                    try:
-                        # use a safe number format (avoid escape sequence warning)
-                        ws.cell(row=r, column=col_idx).number_format = '#,##0.00'
-                    except Exception:
-                        pass
-            # If this column looks like the Order ID display name, add an Excel hyperlink for each cell
-            try:
-                if 'order id' in col.lower() or col.lower().strip() == 'order':
-                    for r_idx, val in enumerate(df[col].astype(str), start=2):
-                        try:
-                            if val and val.strip():
-                                url = f'https://www.mercadolivre.com.br/vendas/{val}/detalhe'
-                                c = ws.cell(row=r_idx, column=col_idx)
-                                c.value = val
-                                c.hyperlink = url
-                                c.font = Font(color='0000EE', underline='single')
-                                c.alignment = Alignment(horizontal='center')
-                        except Exception:
-                            pass
-            except Exception:
-                pass
+        money_cols = [col for col in df.columns
+                      if 'r$' in col.lower() or 'valor' in col.lower() or 'receita' in col.lower()
+                      or 'preço' in col.lower() or 'preco' in col.lower()]
+        link_cols = [col for col in df.columns if 'order id' in col.lower() or col.lower().strip() == 'order']
+        write_xlsx(path, {'Export': df}, money_cols=money_cols, link_cols=link_cols,
+                   link_url='https://www.mercadolivre.com.br/vendas/{}/detalhe')
         return True, None
     except Exception as e:
         return False, str(e)
 
 def save_action(order_id: str, user: str, action: str, note: str):
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    # create actions table if it doesn't exist (simple audit table)
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS actions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id TEXT,
-            user TEXT,
-            action TEXT,
-            note TEXT,
-            created_at TEXT DEFAULT (datetime('now'))
-        )
-    ''')
-    cur.execute('INSERT INTO actions (order_id, user, action, note) VALUES (?,?,?,?)', (order_id, user, action, note))
-    con.commit()
-    con.close()
+    with _db().writer() as con:
+        cur = con.cursor()
+        # create actions table if it doesn't exist (simple audit table)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS actions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id TEXT,
+                user TEXT,
+                action TEXT,
+                note TEXT,
+                created_at TEXT DEFAULT (datetime('now'))
+            )
+        ''')
+        cur.execute('INSERT INTO actions (order_id, user, action, note) VALUES (?,?,?,?)', (order_id, user, action, note))
 
 def main():
     # page config (favicon will be set after assets are resolved below)
@@ -785,6 +861,8 @@ def main():
         month_to = st.selectbox('Mês fim (YYYY‑MM)', options=[''] + months, index=0, help='Mês final do período (vazio = sem limite superior)')
     with col2:
         sku = st.text_input('Filtro SKU (parte)', help='Filtre por parte do SKU (case-insensitive, substring).')
+        # 'começa com' and 'exato' can use the SKU index; 'contém' scans the items
+        sku_mode = SKU_MATCH_MODES[st.radio('Busca de SKU', options=list(SKU_MATCH_MODES), horizontal=True, help='"Começa com" e "Exato" são mais rápidos em bases grandes.')]
     # reasons filter (populate from DB)
     reasons = sorted(set(get_return_reasons()))
     motivos_selected = []
@@ -835,9 +913,11 @@ def main():
     # prefer explicit month range; pass through the month_from/month_to values
     mf = month_from if month_from else None
     mt = month_to if month_to else None
-    df = load_financials(month=None, month_from=mf, month_to=mt, only_pending=only_pending, only_loss=only_loss, sku_filter=sku if sku else None, motivo_filter=motivos_selected if motivos_selected else None)
-    # df_all: full dataset for the selected filters except the only_loss filter — used for Metrics
-    df_all = load_financials(month=None, month_from=mf, month_to=mt, only_pending=False, only_loss=False, sku_filter=sku if sku else None, motivo_filter=motivos_selected if motivos_selected else None)
+    df = load_financials(month=None, month_from=mf, month_to=mt, only_pending=only_pending, only_loss=only_loss, sku_filter=sku if sku else None, motivo_filter=motivos_selected if motivos_selected else None, sku_mode=sku_mode)
+    # summ: day x SKU aggregates for the selected filters except the only_loss filter — used for Metrics
+    summ = load_summary(month_from=mf, month_to=mt, sku_filter=sku if sku else None, motivo_filter=motivos_selected if motivos_selected else None, sku_mode=sku_mode)
+    # distinct orders/returns per day with the same filters (summ counts an order once per SKU)
+    order_counts = load_order_counts(month_from=mf, month_to=mt, sku_filter=sku if sku else None, motivo_filter=motivos_selected if motivos_selected else None, sku_mode=sku_mode)
 
     # helper: format currency BRL
     def fmt_brl(v):
@@ -863,12 +943,12 @@ def main():
         st.write('KPIs e métricas gerais sobre o período/filtro atual')
         # KPIs
         k1, k2, k3, k4 = st.columns(4)
-        # Use df_all for metrics so KPIs reflect the full selection (not only the loss-filtered view)
-        total_revenue = df_all['total_brl'].sum() if 'total_brl' in df_all.columns else 0.0
-        total_orders = df_all['order_id'].nunique() if 'order_id' in df_all.columns else 0
+        # Use the summary for metrics so KPIs reflect the full selection (not only the loss-filtered view)
+        total_revenue = summ['receita'].sum()
+        total_orders = int(order_counts['pedidos'].sum())
         # pending prejudice from the loss-filtered df (what is outstanding)
         total_pending = df['prejuizo_pendente_signed'].sum() if 'prejuizo_pendente_signed' in df.columns else (-df['_valor_pendente'].sum() if '_valor_pendente' in df.columns else 0.0)
-        top_skus = df_all.groupby('sku').agg(revenue=('total_brl','sum')).sort_values('revenue', ascending=False).head(10)
+        top_skus = summ.groupby('sku').agg(revenue=('receita','sum')).sort_values('revenue', ascending=False).head(10)
 
         k1.metric('Receita (seleção)', fmt_brl(total_revenue))
         k2.metric('Pedidos (seleção)', f'{total_orders:,}')
@@ -904,18 +984,19 @@ def main():
         st.subheader('Taxa de devolução e evolução diária')
         # return rate: fraction of orders with total_brl < 0
         if total_orders > 0:
-            returns_count = df_all['total_brl'].lt(0).sum()
+            returns_count = int(order_counts['devolucoes'].sum())
             return_rate = returns_count / total_orders
             st.metric('Taxa de devolução (pedidos)', f"{return_rate:.2%}", f"{returns_count} pedidos")
         else:
             st.info('Sem pedidos na seleção para calcular taxa de devolução.')
 
         # daily evolution (revenue and returns)
-        if 'data_venda' in df_all.columns and not df_all.empty:
-            daily = df_all.copy()
-            # normalize to midnight datetimes for resampling convenience
-            daily['date'] = pd.to_datetime(daily['data_venda']).dt.normalize()
-            daily_agg = daily.groupby('date').agg(total_revenue=('total_brl','sum'), orders=('order_id','nunique'), returns_count=('total_brl', lambda s: (s<0).sum())).reset_index()
+        if not summ.empty:
+            daily = summ.assign(date=pd.to_datetime(summ['dia'], errors='coerce'))
+            daily_agg = daily.groupby('date').agg(total_revenue=('receita','sum')).reset_index()
+            counts_by_day = order_counts.assign(date=pd.to_datetime(order_counts['dia'], errors='coerce')).groupby('date')[['pedidos', 'devolucoes']].sum()
+            daily_agg['orders'] = daily_agg['date'].map(counts_by_day['pedidos']).fillna(0).astype(int)
+            daily_agg['returns_count'] = daily_agg['date'].map(counts_by_day['devolucoes']).fillna(0).astype(int)
 
             # Choose aggregation level when the time series is long to avoid label overdraw.
             n_points = len(daily_agg)
@@ -1211,14 +1292,13 @@ def main():
     # action from the table can navigate here and show the detail immediately.
     detail_id = st.text_input('Abrir detalhe por Order ID (cole aqui)', value=str(detail_prefill) if detail_prefill else '')
     if detail_id:
-        con = sqlite3.connect(DB_PATH)
-        try:
-            od = pd.read_sql('SELECT * FROM orders WHERE order_id = ?', con, params=(detail_id,))
-            oi = pd.read_sql('SELECT * FROM order_items WHERE order_id = ?', con, params=(detail_id,))
-        except Exception:
-            od = pd.DataFrame()
-            oi = pd.DataFrame()
-        con.close()
+        with _db().reader() as con:
+            try:
+                od = pd.read_sql('SELECT * FROM orders WHERE order_id = ?', con, params=(detail_id,))
+                oi = pd.read_sql('SELECT * FROM order_items WHERE order_id = ?', con, params=(detail_id,))
+            except Exception:
+                od = pd.DataFrame()
+                oi = pd.DataFrame()
         st.markdown('**Resumo (visão ML-like)**')
         if not od.empty:
             o = od.iloc[0]
@@ -1263,8 +1343,7 @@ def main():
                 st.info('Sem itens encontrados para este pedido.')
 
             # --- Diagnostic: show raw review and action rows for this Order ID ---
-            try:
-                con2 = sqlite3.connect(DB_PATH)
+            with _db().reader() as con2:
                 try:
                     review_raw = pd.read_sql('SELECT * FROM reviews WHERE order_id = ?', con2, params=(detail_id,))
                 except Exception:
@@ -1273,11 +1352,6 @@ def main():
                     actions_raw = pd.read_sql('SELECT * FROM actions WHERE order_id = ? ORDER BY id DESC LIMIT 20', con2, params=(detail_id,))
                 except Exception:
                     actions_raw = pd.DataFrame()
-            finally:
-                try:
-                    con2.close()
-                except Exception:
-                    pass
 
             st.markdown('**Diagnóstico (raw) — reviews / actions para este Order ID**')
             if not review_raw.empty:
@@ -1307,12 +1381,11 @@ def main():
 
         st.markdown('---')
         st.subheader('Histórico de ações (últimas 50)')
-        con = sqlite3.connect(DB_PATH)
-        try:
-            actions = pd.read_sql('SELECT id, order_id, user, action, note, created_at FROM actions ORDER BY id DESC LIMIT 50', con)
-        except Exception:
-            actions = pd.DataFrame()
-        con.close()
+        with _db().reader() as con:
+            try:
+                actions = pd.read_sql('SELECT id, order_id, user, action, note, created_at FROM actions ORDER BY id DESC LIMIT 50', con)
+            except Exception:
+                actions = pd.DataFrame()
         if not actions.empty:
             actions_display = actions.copy()
             # converter created_at para fuso local (São Paulo) antes da exibição
@@ -1342,65 +1415,83 @@ def main():
         st.markdown('---')
         st.subheader('Relatórios e exportação')
         col_exp1, col_exp2 = st.columns(2)
+        # same filters and an unchanged DB (reviews live there too): the export
+        # buttons copy the last file from report_cache/ instead of rebuilding it
+        export_params = {'month_from': mf, 'month_to': mt, 'only_pending': only_pending, 'only_loss': only_loss,
+                         'sku': sku or None, 'sku_mode': sku_mode, 'motivos': sorted(motivos_selected) if motivos_selected else None}
         with col_exp1:
             if st.button('Exportar tabela atual para CSV'):
                 out_dir = Path('reports')
                 out_dir.mkdir(parents=True, exist_ok=True)
                 suffix = '_prejuizo' if only_loss else '_full'
                 out = out_dir / f'export{suffix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-                # include review columns
-                export_df = df.copy()
-                reviews_map = get_reviews_map()
-                export_df['Revisado'] = export_df['order_id'].apply(lambda oid: bool(reviews_map.get(str(oid), {}).get('reviewed', 0)))
-                export_df['Revisado_por'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_by'))
-                export_df['Revisado_em'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_at'))
-                # robust formatting: prefer UTC-aware parsing then fallback to naive localization
-                try:
-                    # Centralized conversion (handles aware/naive values and runtime fallbacks)
-                    export_df = _convert_ts_for_display(export_df, ts_cols='Revisado_em')
-                    export_df['Revisado_em'] = export_df['Revisado_em'].fillna('')
-                except Exception:
-                    pass
-                # add detail URL for each order so CSV consumers can open the sale detail directly
-                export_df['detail_url'] = export_df['order_id'].astype(str).apply(lambda oid: f'https://www.mercadolivre.com.br/vendas/{oid}/detalhe' if oid else '')
-                export_df.to_csv(out, index=False, encoding='utf-8-sig')
-                st.success(f'Export salvo em {out}')
+                csv_key = report_cache.cache_key(DB_PATH, 'app_csv', export_params)
+                if report_cache.fetch(REPORT_CACHE_DIR, csv_key, [out]):
+                    st.success(f'Export salvo em {out} (cache)')
+                else:
+                    # include review columns
+                    export_df = df.copy()
+                    reviews_map = get_reviews_map()
+                    export_df['Revisado'] = export_df['order_id'].apply(lambda oid: bool(reviews_map.get(str(oid), {}).get('reviewed', 0)))
+                    export_df['Revisado_por'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_by'))
+                    export_df['Revisado_em'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_at'))
+                    # robust formatting: prefer UTC-aware parsing then fallback to naive localization
+                    try:
+                        # Centralized conversion (handles aware/naive values and runtime fallbacks)
+                        export_df = _convert_ts_for_display(export_df, ts_cols='Revisado_em')
+                        export_df['Revisado_em'] = export_df['Revisado_em'].fillna('')
+                    except Exception:
+                        pass
+                    # add detail URL for each order so CSV consumers can open the sale detail directly
+                    export_df['detail_url'] = export_df['order_id'].astype(str).apply(lambda oid: f'https://www.mercadolivre.com.br/vendas/{oid}/detalhe' if oid else '')
+                    export_df.to_csv(out, index=False, encoding='utf-8-sig')
+                    report_cache.store(REPORT_CACHE_DIR, csv_key, [out], export_params)
+                    st.success(f'Export salvo em {out}')
         with col_exp2:
             if st.button('Exportar tabela atual para XLSX (formatado)'):
                 out_dir = Path('reports')
                 out_dir.mkdir(parents=True, exist_ok=True)
                 suffix = '_prejuizo' if only_loss else '_full'
                 out_x = out_dir / f'export{suffix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-                # build friendly display names (Português)
-                display_map = {
-                    'order_id':'Order ID',
-                    'data_venda':'Data da venda',
-                    'total_brl':'Total (R$)',
-                    '_valor_passivel_extorno':'Passível de estorno (R$)',
-                    'dinheiro_liberado':'Dinheiro liberado (R$)',
-                    'sku':'SKU',
-                    'preco_unitario':'Preço unitário (R$)',
-                    'unidades':'Unidades',
-                    'resultado':'Resultado'
-                }
-                export_df = df.copy()
-                reviews_map = get_reviews_map()
-                export_df['Revisado'] = export_df['order_id'].apply(lambda oid: bool(reviews_map.get(str(oid), {}).get('reviewed', 0)))
-                export_df['Revisado_por'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_by'))
-                export_df['Revisado_em'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_at'))
-                try:
-                    export_df = _convert_ts_for_display(export_df, ts_cols='Revisado_em')
-                    export_df['Revisado_em'] = export_df['Revisado_em'].fillna('')
-                except Exception:
-                    pass
-                # rename columns to Portuguese friendly names where possible
-                display_names = {c: display_map.get(c, c) for c in export_df.columns}
-                export_df.rename(columns=display_names, inplace=True)
-                ok, err = create_xlsx_export(export_df, out_x, display_names)
-                if ok:
-                    st.success(f'Export XLSX salvo em {out_x}')
+                xlsx_key = report_cache.cache_key(DB_PATH, 'app_xlsx', export_params)
+                if report_cache.fetch(REPORT_CACHE_DIR, xlsx_key, [out_x]):
+                    st.success(f'Export XLSX salvo em {out_x} (cache)')
                 else:
-                    st.error('Erro ao salvar XLSX: ' + (err or ''))
+                    # build friendly display names (Português)
+                    display_map = {
+                        'order_id':'Order ID',
+                        'data_venda':'Data da venda',
+                        'total_brl':'Total (R$)',
+                        '_valor_passivel_extorno':'Passível de estorno (R$)',
+                        'dinheiro_liberado':'Dinheiro liberado (R$)',
+                        'sku':'SKU',
+                        'preco_unitario':'Preço unitário (R$)',
+                        'unidades':'Unidades',
+                        'resultado':'Resultado'
+                    }
+                    export_df = df.copy()
+                    reviews_map = get_reviews_map()
+                    export_df['Revisado'] = export_df['order_id'].apply(lambda oid: bool(reviews_map.get(str(oid), {}).get('reviewed', 0)))
+                    export_df['Revisado_por'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_by'))
+                    export_df['Revisado_em'] = export_df['order_id'].apply(lambda oid: reviews_map.get(str(oid), {}).get('reviewed_at'))
+                    try:
+                        export_df = _convert_ts_for_display(export_df, ts_cols='Revisado_em')
+                        export_df['Revisado_em'] = export_df['Revisado_em'].fillna('')
+                    except Exception:
+                        pass
+                    # rename columns to Portuguese friendly names where possible
+                    display_names = {c: display_map.get(c, c) for c in export_df.columns}
+                    export_df.rename(columns=display_names, inplace=True)
+                    ok, err = create_xlsx_export(export_df, out_x, display_names)
+                    if ok:
+                        report_cache.store(REPORT_CACHE_DIR, xlsx_key, [out_x], export_params)
+                        st.success(f'Export XLSX salvo em {out_x}')
+                    else:
+                        st.error('Erro ao salvar XLSX: ' + (err or ''))
+
+    # Connection pool counters (opt-in, set SHOW_DB_STATS=1 in the deployment)
+    if os.environ.get('SHOW_DB_STATS', '') == '1':
+        st.caption('SQLite: ' + ', '.join(f'{k}={v}' for k, v in _db().stats().items()))
 
 # Novo: converte colunas de timestamp (ISO/UTC) para America/Sao_Paulo para exibição
 def _convert_ts_for_display(df: pd.DataFrame, ts_cols):
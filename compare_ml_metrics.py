@@ -3,6 +3,8 @@ import sqlite3
 import pandas as pd
 import sys
 
+from query_builder import Where
+
 DB = Path("ml_devolucoes.db")
 if not DB.exists():
     print("Database ml_devolucoes.db not found in current folder.")
@@ -19,7 +21,10 @@ tbl = 'devolucoes_clean' if table_exists('devolucoes_clean') else 'orders'
 
 print(f"Using table: {tbl}\n")
 
-month = '2025-09'
+# mês de venda (AAAA-MM); faixa semiaberta em data_venda, que tem índice.
+# mes_faturamento é o mês de cobrança das tarifas, não o da venda.
+month = sys.argv[1] if len(sys.argv) > 1 else '2025-09'
+where = Where().month_range('data_venda', month, month)
 q_metrics = f"""
 SELECT
   COUNT(DISTINCT order_id) AS pedidos,
@@ -30,12 +35,11 @@ SELECT
   SUM(IFNULL(quantidade_vendas_canceladas,0)) AS quantidade_vendas_canceladas,
   SUM(IFNULL(quantidade_vendas_devolvidas,0)) AS quantidade_vendas_devolvidas,
   SUM(IFNULL(_valor_pendente,0)) AS prejuizo_pendente
-FROM {tbl}
-WHERE mes_faturamento = ?
+FROM {tbl}{where.sql}
 """
 
 try:
-    df_metrics = pd.read_sql_query(q_metrics, con, params=(month,))
+    df_metrics = pd.read_sql_query(q_metrics, con, params=where.params)
 except Exception:
     # fallback for different column names: try fewer columns
     q_metrics2 = f"""
@@ -44,23 +48,21 @@ except Exception:
       SUM(total_brl) AS vendas_brutas,
       SUM(IFNULL(unidades,0)) AS unidades_vendidas,
       SUM(IFNULL(_valor_pendente,0)) AS prejuizo_pendente
-    FROM {tbl}
-    WHERE mes_faturamento = ?
+    FROM {tbl}{where.sql}
     """
-    df_metrics = pd.read_sql_query(q_metrics2, con, params=(month,))
+    df_metrics = pd.read_sql_query(q_metrics2, con, params=where.params)
 
 print(f"Métricas extraídas para {month}:\n")
 print(df_metrics.T)
 
 q_sample = f"""
 SELECT order_id, data_venda, total_brl, _valor_passivel_extorno, dinheiro_liberado, _valor_pendente, sku, preco_unitario, unidades
-FROM {tbl}
-WHERE mes_faturamento = ?
+FROM {tbl}{where.sql}
 ORDER BY data_venda DESC
 LIMIT 20
 """
 
-df_sample = pd.read_sql_query(q_sample, con, params=(month,))
+df_sample = pd.read_sql_query(q_sample, con, params=where.params)
 print('\nAmostra de pedidos (20):')
 print(df_sample.to_string(index=False))
 
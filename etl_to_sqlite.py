@@ -5,27 +5,99 @@ Uso:
   python etl_to_sqlite.py --input-dir C:\caminho\para\csvs --db ml_devolucoes.db
 
 O script tenta normalizar nomes de colunas e tipos básicos.
+
+Encoding, delimitador e linha do cabeçalho de cada CSV são detectados em uma
+única leitura dos primeiros KB (`sniff_file`) e guardados em
+`etl_sniff_cache` pelo hash do conteúdo.
+
+A carga é incremental: a tabela `etl_manifest` guarda tamanho, mtime, hash
+do conteúdo e nº de linhas de cada arquivo já importado. Em uma nova
+execução só os arquivos novos ou alterados são processados; as linhas
+antigas de um arquivo alterado (mesmo `_source_file`) são apagadas antes
+de gravar as novas, e as de um arquivo que saiu da pasta de entrada são
+apagadas junto com a entrada dele no manifesto. Use `--full` para forçar
+a reconstrução completa.
+
+Cada arquivo processado também é gravado já tipado (antes do mapeamento) em
+Parquet na pasta de staging, com o hash do conteúdo como nome. Reprocessar
+um arquivo conhecido lê o Parquet em vez do CSV, e `--rebuild-from-staging`
+regenera devolucoes_clean só a partir do staging (útil depois de mudar o
+columns_map.json). Requer pyarrow; sem ele o staging é desativado.
+
+devolucoes_clean tem esquema declarado (CLEAN_SCHEMA): valores em REAL,
+datas em texto ISO-8601, unidades em INTEGER, para que as cargas seguintes
+(migração, relatórios, app) não precisem reconverter tudo.
+
+Com `--map`, a gravação é um upsert por `n_de_venda` (índice único): a
+mesma venda em exports sobrepostos fica como uma linha só, a do export mais
+recente (data do arquivo, coluna `_export_date`). A cópia de cada arquivo
+fica em `etl_source_rows`, para que reimportar ou remover o arquivo que
+venceu devolva a venda com a linha do próximo export mais recente.
 """
 
 import argparse
+import codecs
+import hashlib
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import json
 import os
+import warnings
+import numpy as np
 import pandas as pd
 import sqlite3
+from datetime import datetime, timezone
 from pathlib import Path
 
+CLEAN_TABLE = "devolucoes_clean"
+STAGE_TABLE = "_etl_stage"
+KEY_COL = "n_de_venda"
+KEY_INDEX = "ux_devolucoes_clean_n_de_venda"
+# com o upsert, uma linha por (venda, arquivo): de onde sai a nova vencedora
+# quando o arquivo que tinha a linha de devolucoes_clean é reimportado ou removido
+SOURCE_TABLE = "etl_source_rows"
+SOURCE_INDEX = "ux_etl_source_rows_venda_arquivo"
+# filtros por período do reports.py (datas em texto ISO, comparáveis como texto)
+DATE_COL = "data_venda"
+DATE_INDEX = "ix_devolucoes_clean_data_venda"
 
-def normalize_columns(df):
+# Tipos declarados de devolucoes_clean (nomes padrão do columns_map.json):
+# valores monetários em REAL, datas em TEXT ISO-8601 ("AAAA-MM-DD HH:MM:SS"),
+# unidades em INTEGER. As demais colunas seguem o dtype do DataFrame.
+MONEY_COLS = [
+    "total_brl", "tarifas_envio_brl", "cancelamentos_reembolsos_brl", "preco_unitario_brl",
+    "receita_por_produtos_brl", "receita_por_envio_brl", "tarifa_venda_impostos_brl", "dinheiro_liberado",
+]
+CLEAN_SCHEMA = {
+    KEY_COL: "TEXT",
+    **{c: "REAL" for c in MONEY_COLS},
+    "unidades": "INTEGER",
+    "data_venda": "TEXT",
+    "data_de_revisao": "TEXT",
+    "_source_file": "TEXT",
+    "_export_date": "TEXT",
+}
+MANIFEST_TABLE = "etl_manifest"
+SNIFF_TABLE = "etl_sniff_cache"
+# contador de cargas (ETL e normalização) que o app usa para descartar o cache
+LOAD_VERSION_TABLE = "etl_load_version"
+INPUT_SUFFIXES = (".csv", ".xlsx", ".xls")
+
+
+def normalize_name(c):
     # padrão: lowercase, remove acentos simples, replace spaces
-    cols = []
-    for c in df.columns:
-        s = str(c).lower()
-        # remoção simples de acentos (cobertura mínima sem dependências externas)
-        s = s.replace("ç", "c").replace("ã", "a").replace("â", "a").replace("á", "a").replace("à", "a").replace("é", "e").replace("ê", "e").replace("í", "i").replace("ó", "o").replace("ô", "o").replace("ú", "u").replace("ü", "u").replace("ñ", "n")
-        s = s.replace("º", "o").replace("#", "num").replace("%", "pct")
-        s = s.replace(" ", "_").replace("/", "_").replace("\\", "_").replace('"', "_")
-        cols.append(s)
-    df.columns = cols
+    s = str(c).lower()
+    # remoção simples de acentos (cobertura mínima sem dependências externas)
+    s = s.replace("ç", "c").replace("ã", "a").replace("â", "a").replace("á", "a").replace("à", "a").replace("é", "e").replace("ê", "e").replace("í", "i").replace("ó", "o").replace("ô", "o").replace("ú", "u").replace("ü", "u").replace("ñ", "n")
+    s = s.replace("º", "o").replace("#", "num").replace("%", "pct")
+    s = s.replace(" ", "_").replace("/", "_").replace("\\", "_").replace('"', "_")
+    return s
+
+
+def normalize_columns(df):
+    df.columns = [normalize_name(c) for c in df.columns]
     return df
 
 
@@ -49,120 +121,1118 @@ def limpar_valor(valor):
         return 0.0
 
 
-def process_file(path, conn=None, table_name="devolucoes"):
-    # agora a função apenas retorna o DataFrame processado; a gravação
-    # agregada será feita no final para evitar conflitos de schema entre arquivos.
-    print(f"Processando: {path}")
-    ext = Path(path).suffix.lower()
-    if ext in (".xlsx", ".xls"):
-        df = pd.read_excel(path, dtype=object)
+# números já limpos que o cast para float converte exatamente como o float()
+# do Python; o que não casar aqui cai no limpar_valor escalar
+_NUMERO_LIMPO = r"-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)"
+
+try:
+    # com pyarrow as operações de string rodam em C; sem ele o caminho por
+    # célula (limpar_valor) é mais rápido que o .str sobre dtype object.
+    # Também é o que grava o staging em Parquet.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _STR_DTYPE = "string[pyarrow]"
+except ImportError:
+    pa = pq = None
+    _STR_DTYPE = None
+
+try:
+    # leitor de .xlsx em Rust; sem ele as planilhas vão pelo openpyxl read-only
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+
+def _limpar_unicos(values):
+    """Aplica as regras de `limpar_valor` a um array de valores distintos."""
+    if _STR_DTYPE is None:
+        return np.array([limpar_valor(v) for v in values], dtype=np.float64)
+    out = np.zeros(len(values), dtype=np.float64)
+    if pd.api.types.infer_dtype(values, skipna=False) == "string":
+        is_str = np.ones(len(values), dtype=bool)
     else:
-        # CSVs exportados pelo Mercado Livre frequentemente têm linhas de cabeçalho
-        # extras antes da linha real com nomes das colunas. Detectamos a linha
-        # que contém o cabeçalho (procura por "n." ou "n.º de venda") e usamos
-        # esse índice como header. Também tentamos alguns encodings comuns.
-        header_row = 0
-        encodings = ["utf-8-sig", "utf-8", "latin-1", "cp1252"]
-        df = None
-        for enc in encodings:
-            try:
-                with open(path, 'r', encoding=enc, errors='replace') as f:
-                    sample_lines = [next(f) for _ in range(20)]
-                found = None
-                for i, L in enumerate(sample_lines):
-                    low = L.lower()
-                    if ('n.' in low and 'venda' in low) or ('n.º de venda' in low) or ('n. de venda' in low) or ('nº de venda' in low):
-                        found = i
-                        break
-                if found is not None:
-                    header_row = found
-                df = pd.read_csv(path, dtype=object, header=header_row, encoding=enc)
+        is_str = np.fromiter((type(v) is str for v in values), dtype=bool, count=len(values))
+    t = pd.Series(values[is_str], dtype=_STR_DTYPE)
+    t = t.str.replace(r"R\$|\$| ", "", regex=True)
+    paren = (t.str.startswith("(") & t.str.endswith(")")).to_numpy(dtype=bool)
+    if paren.any():
+        t = t.where(~paren, "-" + t.str.slice(1, -1))
+    t = t.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    fast = t.str.fullmatch(_NUMERO_LIMPO).to_numpy(dtype=bool)
+    # vazio depois da limpeza vira 0.0, que já é o valor inicial de `out`
+    empty = (t == "").to_numpy(dtype=bool)
+
+    parsed = np.zeros(len(t), dtype=np.float64)
+    if fast.any():
+        parsed[fast] = t[fast].astype("float64").to_numpy()
+    slow = ~(fast | empty)
+    if slow.any():
+        parsed[slow] = [limpar_valor(v) for v in values[is_str][slow]]
+    out[is_str] = parsed
+    if not is_str.all():
+        out[~is_str] = [limpar_valor(v) for v in values[~is_str]]
+    return out
+
+
+def limpar_valor_series(col):
+    """Versão vetorizada de `limpar_valor` para uma coluna inteira.
+
+    Cada valor distinto é convertido uma única vez (exports repetem muito os
+    mesmos valores: tarifas fixas, zeros, brancos) e as regras de
+    `limpar_valor` (R$, $ e espaços, parênteses = negativo, ponto de milhar,
+    vírgula decimal, inválido = 0.0) rodam como operações de string em lote.
+    Valores fora do padrão comum (não-strings, notação científica, sinais ou
+    brancos exóticos) são delegados a `limpar_valor`, então o resultado é
+    sempre idêntico ao da versão por célula.
+    """
+    col = col if isinstance(col, pd.Series) else pd.Series(col, dtype=object)
+    if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+        return col.astype(np.float64).fillna(0.0)
+    codes, uniques = pd.factorize(col)
+    parsed = _limpar_unicos(np.asarray(uniques, dtype=object))
+    out = np.zeros(len(col), dtype=np.float64)
+    valid = codes >= 0
+    out[valid] = parsed[codes[valid]]
+    return pd.Series(out, index=col.index, name=col.name)
+
+
+MESES_PT = {
+    "janeiro": "01", "fevereiro": "02", "marco": "03", "março": "03", "abril": "04",
+    "maio": "05", "junho": "06", "julho": "07", "agosto": "08", "setembro": "09",
+    "outubro": "10", "novembro": "11", "dezembro": "12",
+    "jan": "01", "fev": "02", "mar": "03", "abr": "04", "mai": "05", "jun": "06",
+    "jul": "07", "ago": "08", "set": "09", "out": "10", "nov": "11", "dez": "12",
+}
+
+# Formatos de data conhecidos. Os dois formatos pt-BR são reescritos para
+# ISO-8601 com regex (uma passada vetorizada) e lidos pelo parser ISO do
+# pandas, bem mais rápido que strptime/dateutil por elemento.
+PT_LONGO = "pt_longo"      # "15 de setembro de 2025 10:32 hs." (exports do ML)
+DMY = "dd/mm/aaaa"         # "15/09/2025", "15/09/2025 10:32[:05]"
+ISO = "iso"                # "2025-09-15", "2025-09-15 10:32:05", "2025-09-15T10:32:05-03:00"
+DATE_FORMATS = [PT_LONGO, DMY, ISO, "%d-%m-%Y %H:%M", "%d-%m-%Y", "%d/%m/%y"]
+DATE_SAMPLE = 200
+
+_PT_LONGO_RE = r"^(\d{1,2}) de ([a-zç]+)\.? de (\d{4})(.*?)\s*(?:hs?\.?)?$"
+_DMY_RE = r"^(\d{1,2})/(\d{1,2})/(\d{4})(?:[ T]+(\d{1,2}:\d{2}(?::\d{2})?))?$"
+# o fuso (Z, -03:00) é descartado: fica a hora local do export, como nas
+# colunas sem fuso, em vez de uma coluna tz-aware que não casa com as outras
+_ISO_RE = r"^(\d{4}-\d{2}-\d{2})(?:([ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)(?:Z|[+-]\d{2}:?\d{2})?)?$"
+
+# formatos inferidos por (cabeçalho, coluna): os exports repetem poucos
+# layouts, então a inferência roda uma vez por layout
+_date_formats_cache = {}
+
+
+def _from_iso(t):
+    # completa dígitos soltos ("9:05" -> "09:05") e lê como ISO-8601
+    t = t.str.replace(r"\b(\d)\b", r"0\1", regex=True).str.strip()
+    return pd.to_datetime(t, format="ISO8601", errors="coerce")
+
+
+def _parse_with(s, fmt):
+    """Aplica um formato de DATE_FORMATS a uma Series de strings."""
+    if fmt == PT_LONGO:
+        low = s.str.lower()
+        mes = low.str.replace(_PT_LONGO_RE, r"\2", regex=True).map(MESES_PT).astype(s.dtype)
+        ano = low.str.replace(_PT_LONGO_RE, r"\3-", regex=True)
+        resto = low.str.replace(_PT_LONGO_RE, r"-\1\4", regex=True)
+        return _from_iso(ano + mes + resto)
+    if fmt == DMY:
+        ok = s.str.fullmatch(_DMY_RE).fillna(False)
+        return _from_iso(s.where(ok).str.replace(_DMY_RE, r"\3-\2-\1 \4", regex=True))
+    if fmt == ISO:
+        ok = s.str.fullmatch(_ISO_RE).fillna(False)
+        return pd.to_datetime(s.where(ok).str.replace(_ISO_RE, r"\1\2", regex=True), format="ISO8601", errors="coerce")
+    return pd.to_datetime(s, format=fmt, errors="coerce")
+
+
+def infer_date_formats(sample):
+    """Formatos de DATE_FORMATS que reconhecem algum valor da amostra,
+    do que mais reconhece para o que menos."""
+    hits = [(int(_parse_with(sample, fmt).notna().sum()), i, fmt) for i, fmt in enumerate(DATE_FORMATS)]
+    return [fmt for n, _, fmt in sorted(hits, key=lambda h: (-h[0], h[1])) if n > 0]
+
+
+def read_iso_dates(col):
+    """Lê datas gravadas em devolucoes_clean (texto ISO-8601). Bases geradas
+    antes do esquema tipado podem ter dd/mm/aaaa, que caem no dayfirst."""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    d = pd.to_datetime(col, format="ISO8601", errors="coerce")
+    rest = d.isna() & col.notna()
+    if rest.any():
+        d[rest] = pd.to_datetime(col[rest], dayfirst=True, errors="coerce")
+    return d
+
+
+def parse_dates_series(col, cache_key=None):
+    """Converte uma coluna de datas em texto com formatos explícitos.
+
+    Os formatos são inferidos de uma amostra (e memoizados por `cache_key`)
+    e aplicados em cascata sobre os valores distintos da coluna: o principal
+    primeiro, os demais só no que sobrou. Se nenhum formato conhecido
+    reconhece a amostra, cai no parse genérico (dayfirst). Devolve (datas,
+    nº de valores não reconhecidos, exemplos).
+    """
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col, 0, []
+    if pd.api.types.infer_dtype(col, skipna=True) in ("string", "empty"):
+        is_str = col.notna().to_numpy()
+    else:
+        is_str = np.fromiter((type(v) is str for v in col), dtype=bool, count=len(col))
+    out = np.full(len(col), np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    # valores não-texto (datetimes/números de planilha)
+    other = col.notna().to_numpy() & ~is_str
+    if other.any():
+        out[other] = pd.to_datetime(col[other], errors="coerce").to_numpy(dtype="datetime64[ns]")
+
+    s = pd.Series(col.to_numpy(dtype=object)[is_str], dtype=_STR_DTYPE or "string").str.strip()
+    codes, uniques = pd.factorize(s.where(s != ""))
+    u = pd.Series(uniques, dtype=s.dtype)
+    if len(u) == 0:
+        return pd.Series(out, index=col.index, name=col.name), 0, []
+
+    formats = _date_formats_cache.get(cache_key) if cache_key is not None else None
+    cached = formats is not None
+    if formats is None:
+        formats = infer_date_formats(u.head(DATE_SAMPLE))
+        if cache_key is not None:
+            _date_formats_cache[cache_key] = formats
+
+    parsed = pd.Series(pd.NaT, index=u.index, dtype="datetime64[ns]")
+
+    def cascade(fmts):
+        for fmt in fmts:
+            pending = parsed.isna()
+            if not pending.any():
                 break
-            except StopIteration:
-                # arquivo com poucas linhas
-                continue
-            except Exception:
+            parsed[pending] = _parse_with(u[pending], fmt).astype("datetime64[ns]")
+
+    cascade(formats)
+    if cached and parsed.isna().any():
+        # mesmo cabeçalho, outro estilo de data (outro arquivo): infere de
+        # novo só com o que sobrou e acrescenta ao cache
+        extra = [f for f in infer_date_formats(u[parsed.isna()].head(DATE_SAMPLE)) if f not in formats]
+        if extra:
+            cascade(extra)
+            formats = formats + extra
+            _date_formats_cache[cache_key] = formats
+    if not formats:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(u, dayfirst=True, errors="coerce")
+        if isinstance(parsed.dtype, pd.DatetimeTZDtype):
+            parsed = parsed.dt.tz_localize(None)
+        parsed = parsed.astype("datetime64[ns]")
+
+    vals = parsed.to_numpy()
+    text_out = np.where(codes >= 0, vals[np.maximum(codes, 0)], np.datetime64("NaT"))
+    out[is_str] = text_out
+    bad_u = parsed.isna().to_numpy()
+    bad = (codes >= 0) & bad_u[np.maximum(codes, 0)]
+    examples = u[bad_u].head(3).tolist()
+    return pd.Series(out, index=col.index, name=col.name), int(bad.sum()), examples
+
+
+# resultado da detecção de formato de um CSV; header_row é o nº de linhas a
+# pular antes do cabeçalho (None = cabeçalho não encontrado)
+Sniff = namedtuple("Sniff", "encoding delimiter header_row")
+
+SNIFF_BYTES = 64 * 1024
+DELIMITERS = (",", ";", "\t", "|")
+
+
+def is_venda_header(line):
+    """Linha de cabeçalho dos exports de vendas ("n.º de venda")."""
+    low = line.lower()
+    return ('n.' in low and 'venda' in low) or ('n.º de venda' in low) or ('n. de venda' in low) or ('nº de venda' in low)
+
+
+def _decode_sample(sample):
+    # BOM -> utf-8-sig; senão utf-8 estrito (tolerando um caractere cortado
+    # no fim da amostra); senão cp1252, ou latin-1 se houver bytes que o
+    # cp1252 não define
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig", sample[len(codecs.BOM_UTF8):].decode("utf-8", errors="replace")
+    try:
+        return "utf-8", codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        pass
+    try:
+        return "cp1252", sample.decode("cp1252")
+    except UnicodeDecodeError:
+        return "latin-1", sample.decode("latin-1")
+
+
+def sniff_bytes(sample, is_header=is_venda_header, max_lines=20, complete=True):
+    """Decide encoding, delimitador e linha do cabeçalho a partir dos
+    primeiros bytes do arquivo. `complete=False` indica que a amostra foi
+    cortada (a última linha pode estar incompleta e é descartada)."""
+    encoding, text = _decode_sample(sample)
+    lines = text.splitlines()
+    if not complete and len(lines) > 1:
+        lines = lines[:-1]
+    if max_lines:
+        lines = lines[:max_lines]
+    header_row = next((i for i, line in enumerate(lines) if is_header(line)), None)
+    ref = lines[header_row] if header_row is not None else next((line for line in lines if line.strip()), "")
+    counts = {d: ref.count(d) for d in DELIMITERS}
+    delimiter = max(DELIMITERS, key=lambda d: counts[d]) if any(counts.values()) else ","
+    return Sniff(encoding, delimiter, header_row)
+
+
+def sniff_file(path, is_header=is_venda_header, nbytes=SNIFF_BYTES, max_lines=20):
+    """Lê uma única vez os primeiros `nbytes` do arquivo e aplica `sniff_bytes`."""
+    with open(path, "rb") as f:
+        sample = f.read(nbytes + 1)
+    return sniff_bytes(sample[:nbytes], is_header=is_header, max_lines=max_lines, complete=len(sample) <= nbytes)
+
+
+def ensure_sniff_cache(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SNIFF_TABLE} (
+            content_hash TEXT,
+            rule TEXT,
+            encoding TEXT,
+            delimiter TEXT,
+            header_row INTEGER,
+            PRIMARY KEY (content_hash, rule)
+        )
+    """)
+
+
+def load_sniff_cache(conn, rule="venda"):
+    """{content_hash: Sniff} das detecções já feitas com a regra `rule`."""
+    cur = conn.execute(f"SELECT content_hash, encoding, delimiter, header_row FROM {SNIFF_TABLE} WHERE rule = ?", (rule,))
+    return {r[0]: Sniff(r[1], r[2], r[3]) for r in cur.fetchall()}
+
+
+def save_sniffs(conn, items, rule="venda"):
+    """Grava [(content_hash, Sniff)] no cache de detecção."""
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {SNIFF_TABLE} (content_hash, rule, encoding, delimiter, header_row) VALUES (?,?,?,?,?)",
+        [(digest, rule, sn.encoding, sn.delimiter, sn.header_row) for digest, sn in items],
+    )
+
+
+XLSX_CHUNK = 50_000
+
+
+def _mangle_header(values):
+    # mesmos nomes que o read_csv daria: vazio -> "Unnamed: i", repetidos -> "nome.1"
+    names, seen = [], {}
+    for i, v in enumerate(values):
+        name = f"Unnamed: {i}" if v is None or str(v).strip() == "" else str(v)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _row_text(row):
+    return ",".join("" if v is None else str(v) for v in row)
+
+
+def _xlsx_cell(v):
+    # como o read_excel: vazio vira NaN, float inteiro vira int (nº de venda, unidades)
+    if v is None:
+        return np.nan
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def _xlsx_rows(path, bounded=False):
+    """Itera as linhas da primeira planilha como tuplas de valores (None nas
+    células vazias).
+
+    O modo read-only do openpyxl lê o XML linha a linha, com memória
+    limitada. O python-calamine (leitor em Rust, opcional) é cerca de 10x
+    mais rápido mas carrega a planilha inteira; é usado quando instalado,
+    exceto com `bounded` (modo --chunksize)."""
+    if CalamineWorkbook is not None and not bounded:
+        sheet = CalamineWorkbook.from_path(str(path)).get_sheet_by_index(0)
+        for row in sheet.iter_rows():
+            yield tuple(None if v == "" else v for v in row)
+        return
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def iter_xlsx_chunks(path, chunksize=XLSX_CHUNK, bounded=False, is_header=is_venda_header, max_lines=20):
+    """Lê a primeira planilha de um .xlsx com `_xlsx_rows` e gera DataFrames
+    de até `chunksize` linhas, todos os valores como objeto.
+
+    O cabeçalho é localizado como nos CSVs: a primeira das `max_lines`
+    linhas iniciais em que `is_header` reconhece o texto; se nenhuma
+    reconhece, a primeira linha não vazia. Linhas totalmente vazias são
+    descartadas."""
+    rows = _xlsx_rows(path, bounded)
+    try:
+        head = []
+        for row in rows:
+            head.append(row)
+            if len(head) >= max_lines or is_header(_row_text(row)):
+                break
+        header_idx = next((i for i, row in enumerate(head) if is_header(_row_text(row))), None)
+        if header_idx is None:
+            header_idx = next((i for i, row in enumerate(head) if any(v is not None for v in row)), None)
+        if header_idx is None:
+            return
+        columns = _mangle_header(head[header_idx])
+        width = len(columns)
+
+        buf = []
+        for row in itertools.chain(head[header_idx + 1:], rows):
+            if all(v is None for v in row):
                 continue
-        if df is None:
-            # fallback
-            df = pd.read_csv(path, dtype=object, encoding='latin-1')
+            row = [_xlsx_cell(v) for v in row[:width]]
+            if len(row) < width:
+                row += [None] * (width - len(row))
+            buf.append(row)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=columns, dtype=object)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=columns, dtype=object)
+    finally:
+        rows.close()
+
+
+def read_raw(path, chunksize=None, sniff=None):
+    """Lê o arquivo bruto (tudo como texto). Com `chunksize`, é devolvido um
+    iterador de DataFrames de até `chunksize` linhas.
+
+    CSVs exportados pelo Mercado Livre frequentemente têm linhas extras antes
+    do cabeçalho real; encoding, delimitador e linha do cabeçalho vêm de
+    `sniff` (ou de `sniff_file`, se não informado). Planilhas .xlsx vão por
+    `iter_xlsx_chunks`, com a mesma busca do cabeçalho.
+    """
+    ext = Path(path).suffix.lower()
+    if ext == ".xlsx":
+        chunks = iter_xlsx_chunks(path, chunksize or XLSX_CHUNK, bounded=bool(chunksize))
+        if chunksize:
+            return chunks
+        frames = list(chunks)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(dtype=object)
+    if ext == ".xls":
+        df = pd.read_excel(path, dtype=object)
+        return iter([df]) if chunksize else df
+
+    if sniff is None:
+        sniff = sniff_file(path)
+    kw = dict(dtype=object, skiprows=sniff.header_row or 0, header=0, sep=sniff.delimiter)
+    if chunksize:
+        # em blocos não dá para recomeçar com outro encoding depois de gravar
+        # os primeiros blocos: um byte inválido lá no fim vira U+FFFD
+        return pd.read_csv(path, encoding=sniff.encoding, encoding_errors="replace", chunksize=chunksize, **kw)
+    try:
+        return pd.read_csv(path, encoding=sniff.encoding, **kw)
+    except UnicodeDecodeError:
+        # a amostra parecia utf-8 mas o resto do arquivo não é
+        return pd.read_csv(path, encoding="latin-1", **kw)
 
-    df = normalize_columns(df)
 
+MONEY_KEYWORDS = ["valor", "preco", "preco_unitario", "total", "tarifa", "taxa", "frete", "cancelamento", "reembolso"]
+DATE_KEYWORDS = ["data", "date"]
+
+
+def convert_money(df):
     # tentar detectar colunas monetárias e normalizar
-    money_keys = [c for c in df.columns if any(x in c for x in ["valor", "preco", "preco_unitario", "total", "tarifa", "taxa", "frete", "cancelamento", "reembolso"]) ]
+    money_keys = [c for c in df.columns if any(x in c for x in MONEY_KEYWORDS) ]
     for c in money_keys:
-        df[c] = df[c].apply(limpar_valor)
+        df[c] = limpar_valor_series(df[c])
+    return df
 
-    # tenta converter colunas de data se existirem
-    date_keys = [c for c in df.columns if any(x in c for x in ["data", "date"]) ]
+
+def convert_dates(df, source_name):
+    # tenta converter colunas de data se existirem; o que não for
+    # reconhecido é contado e avisado em vez de virar NaT em silêncio
+    date_keys = [c for c in df.columns if any(x in c for x in DATE_KEYWORDS) ]
+    header = tuple(df.columns)
     for c in date_keys:
         try:
-            df[c] = pd.to_datetime(df[c], dayfirst=True, errors='coerce')
+            df[c], n_bad, examples = parse_dates_series(df[c], cache_key=(header, c))
         except Exception:
-            pass
+            continue
+        if n_bad:
+            print(f"Aviso: {source_name}: {n_bad} valor(es) não reconhecido(s) como data em '{c}' (ex.: {examples})")
+    return df
+
+
+def transform_frame(df, source_name):
+    """Normaliza nomes, valores monetários e datas de um DataFrame bruto
+    (arquivo inteiro ou um bloco dele) e marca a origem."""
+    df = normalize_columns(df)
+    df = convert_money(df)
+    df = convert_dates(df, source_name)
 
     # adiciona coluna de origem
-    df["_source_file"] = os.path.basename(path)
+    df["_source_file"] = source_name
+    return df
+
+
+def process_file(path, conn=None, table_name="devolucoes", sniff=None):
+    # agora a função apenas retorna o DataFrame processado; a gravação
+    # agregada será feita no final para evitar conflitos de schema entre arquivos.
+    print(f"Processando: {path}")
+    return transform_frame(read_raw(path, sniff=sniff), os.path.basename(path))
+
+
+def iter_file_chunks(path, chunksize, sniff=None):
+    """Como `process_file`, mas gera blocos já normalizados de até
+    `chunksize` linhas, sem carregar o arquivo inteiro."""
+    print(f"Processando (em blocos de {chunksize}): {path}")
+    name = os.path.basename(path)
+    for chunk in read_raw(path, chunksize=chunksize, sniff=sniff):
+        yield transform_frame(chunk, name)
+
+
+def _parse_one(item):
+    # wrapper usado pelo pool: devolve o erro em vez de propagar, para que
+    # um arquivo ruim não derrube o lote inteiro (como texto: nem toda
+    # exceção é serializável entre processos)
+    path, sniff = item
+    try:
+        return process_file(path, sniff=sniff), None
+    except Exception as e:
+        return None, str(e)
+
+
+def parse_files(items, workers=1):
+    """Processa [(path, sniff)] com `process_file` e devolve [(df, erro)] na
+    mesma ordem, independentemente de qual worker terminou primeiro.
+
+    Com workers > 1 usa um pool de processos (o parse é CPU-bound, o GIL
+    impede ganho com threads). A ordem fixa garante que o consolidado seja
+    idêntico ao da execução serial.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [_parse_one(it) for it in items]
+    with ProcessPoolExecutor(max_workers=min(workers, len(items))) as ex:
+        return list(ex.map(_parse_one, items))
+
+
+def compile_mapping(mapping):
+    """Compila o dict de columns_map.json em ((std_name, candidatos), ...).
+
+    Os candidatos passam pela mesma normalização dos nomes de coluna, então
+    tanto "n.º de venda" quanto "n.o_de_venda" casam com o cabeçalho já
+    normalizado. O resultado é imutável para servir de chave de cache.
+    """
+    return tuple(
+        (std_name, tuple(dict.fromkeys(normalize_name(c) for c in candidates)))
+        for std_name, candidates in mapping.items()
+    )
+
+
+@lru_cache(maxsize=256)
+def resolve_mapping(compiled, header):
+    """Renomeações {coluna: std_name} para um cabeçalho (tupla de nomes).
+
+    Para cada nome padrão vale o primeiro candidato presente no cabeçalho.
+    Memoizado: os exports do ML repetem poucos layouts, então a resolução
+    roda uma vez por layout e não por arquivo/bloco.
+    """
+    by_name = {}
+    for col in header:
+        by_name.setdefault(str(col).lower(), col)
+    new_cols = {}
+    for std_name, candidates in compiled:
+        for cand in candidates:
+            col = by_name.get(cand)
+            if col is not None:
+                new_cols[col] = std_name
+                break
+    return new_cols
+
+
+def apply_mapping(df, compiled):
+    # aplica mapeamento heurístico para esquema limpo (por arquivo, antes do
+    # concat, para que layouts diferentes caiam nas mesmas colunas)
+    return df.rename(columns=resolve_mapping(compiled, tuple(df.columns)))
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """sha256 do conteúdo do arquivo, lido em blocos."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def table_exists(conn, name):
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,))
+    return cur.fetchone() is not None
+
+
+def ensure_manifest(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            file_path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime REAL,
+            content_hash TEXT,
+            row_count INTEGER,
+            run_id TEXT
+        )
+    """)
+
+
+def bump_load_version(conn):
+    """Incrementa o contador de cargas (sem commit). Diferente dos run_id
+    (resolução de segundos), muda a cada carga, inclusive duas no mesmo
+    segundo ou uma normalização --full sem ETL antes."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {LOAD_VERSION_TABLE} (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+    conn.execute(f"INSERT INTO {LOAD_VERSION_TABLE} (id, version) VALUES (1, 1) ON CONFLICT (id) DO UPDATE SET version = version + 1")
+
+
+def load_manifest(conn):
+    """Retorna {file_path: {size, mtime, content_hash, row_count, run_id}}."""
+    cur = conn.execute(f"SELECT file_path, size, mtime, content_hash, row_count, run_id FROM {MANIFEST_TABLE}")
+    return {r[0]: {"size": r[1], "mtime": r[2], "content_hash": r[3], "row_count": r[4], "run_id": r[5]} for r in cur.fetchall()}
+
+
+def plan_files(files, manifest):
+    """Separa os arquivos de entrada em (alterados_ou_novos, inalterados).
+
+    Tamanho + mtime iguais ao manifesto bastam para considerar o arquivo
+    inalterado; caso contrário o hash do conteúdo decide (um `touch` ou uma
+    cópia não forçam reprocessamento). Cada item de `alterados_ou_novos` é
+    (path, stat, content_hash).
+    """
+    changed, unchanged = [], []
+    for path in files:
+        st = path.stat()
+        entry = manifest.get(path.name)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            unchanged.append(path)
+            continue
+        digest = file_hash(path)
+        if entry and entry["content_hash"] == digest:
+            unchanged.append(path)
+            continue
+        changed.append((path, st, digest))
+    return changed, unchanged
+
+
+def declared_type(name):
+    # "unidades.1", "unidades.2": colunas repetidas do export
+    base = name.split(".")[0] if name.startswith("unidades.") else name
+    return CLEAN_SCHEMA.get(base)
+
+
+def sql_type(name, dtype):
+    declared = declared_type(name)
+    if declared:
+        return declared
+    if pd.api.types.is_bool_dtype(dtype):
+        return "TEXT"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def conform_to_schema(df):
+    """Converte as colunas com tipo declarado que ainda não estão no tipo
+    certo (ex.: colunas de valor cujo nome não tem as palavras-chave de
+    dinheiro, unidades lidas como texto)."""
+    for c in df.columns:
+        declared = declared_type(c)
+        if declared == "REAL" and not pd.api.types.is_float_dtype(df[c]):
+            # células ausentes (coluna que o export não trazia) seguem NULL
+            df[c] = limpar_valor_series(df[c]).where(df[c].notna())
+        elif declared == "INTEGER" and not pd.api.types.is_integer_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors="coerce").round().astype("Int64")
     return df
 
 
+def create_clean_table(conn, df, table=CLEAN_TABLE):
+    """(Re)cria devolucoes_clean (ou `table`, com o mesmo esquema) com os
+    tipos de `sql_type` e grava `df`."""
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    cols = ", ".join(f'"{c}" {sql_type(c, df[c].dtype)}' for c in df.columns)
+    conn.execute(f"CREATE TABLE {table} ({cols})")
+    df.to_sql(table, conn, if_exists="append", index=False)
+
+
+def ensure_columns(conn, table, df):
+    """Adiciona em `table` as colunas de `df` que ainda não existem
+    (exports de meses diferentes nem sempre trazem o mesmo cabeçalho)."""
+    existing = {r[1] for r in conn.execute(f'PRAGMA table_info("{table}")').fetchall()}
+    for c in df.columns:
+        if c not in existing:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{c}" {sql_type(c, df[c].dtype)}')
+            existing.add(c)
+
+
+def export_date(mtime):
+    """Data do export (mtime do arquivo, UTC) usada no "export mais recente vence"."""
+    return datetime.fromtimestamp(mtime, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _key_text(v):
+    # n_de_venda como texto canônico: planilhas trazem o número como int ou
+    # float (900001.0) e CSVs como string; todos precisam colidir no índice
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    s = str(v).strip()
+    return s or None
+
+
+def dedupe_latest(df, by=(KEY_COL,)):
+    """Uma linha por n_de_venda (ou pelas colunas `by`): fica a do export mais
+    recente (em empate, a que aparece por último). Linhas sem n_de_venda são
+    mantidas."""
+    df[KEY_COL] = df[KEY_COL].map(_key_text)
+    df = df.sort_values("_export_date", kind="stable")
+    keyed = df[KEY_COL].notna()
+    dup = df.duplicated(list(by), keep="last") & keyed
+    return df[~dup].sort_index()
+
+
+def has_key_index(conn):
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (KEY_INDEX,))
+    return cur.fetchone() is not None
+
+
+def schema_outdated(conn):
+    """Colunas declaradas em CLEAN_SCHEMA gravadas com outro tipo (tabela de
+    uma versão anterior do ETL)."""
+    info = {r[1]: (r[2] or "").upper() for r in conn.execute(f'PRAGMA table_info("{CLEAN_TABLE}")').fetchall()}
+    return any(declared_type(c) and t != declared_type(c) for c, t in info.items())
+
+
+def needs_rebuild(conn):
+    """Base criada por uma versão anterior do ETL: tem n_de_venda mas não o
+    índice único (e provavelmente duplicatas entre exports), ou colunas
+    com outro tipo (`schema_outdated`). Só uma reconstrução resolve."""
+    cols = {r[1] for r in conn.execute(f'PRAGMA table_info("{CLEAN_TABLE}")').fetchall()}
+    if KEY_COL in cols and not has_key_index(conn):
+        return True
+    # upsert de antes do etl_source_rows: não há de onde tirar a nova vencedora
+    if KEY_COL in cols and "_source_file" in cols and not table_exists(conn, SOURCE_TABLE):
+        return True
+    return schema_outdated(conn)
+
+
+def write_rows(conn, df, replace=False):
+    """Grava `df` em devolucoes_clean.
+
+    Com a coluna n_de_venda (ou seja, com --map) é um upsert: índice único em
+    n_de_venda e, se a venda já existe, a linha só é substituída quando o
+    export novo é tão ou mais recente (`_export_date`). Exports que se
+    sobrepõem (mensal x "últimos 90 dias") ficam com uma linha por venda.
+    Com `_source_file`, cada (venda, arquivo) também é gravado em
+    etl_source_rows, de onde `remove_sources` tira a nova vencedora.
+    Sem n_de_venda, apenas anexa.
+    """
+    df = conform_to_schema(df)
+    keyed = KEY_COL in df.columns
+    tracked = keyed and "_source_file" in df.columns
+    if keyed:
+        by_source = dedupe_latest(df, by=(KEY_COL, "_source_file")) if tracked else df
+        df = dedupe_latest(by_source)
+    if replace or not table_exists(conn, CLEAN_TABLE):
+        create_clean_table(conn, df)
+        conn.execute(f"DROP TABLE IF EXISTS {SOURCE_TABLE}")
+        if keyed:
+            conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {KEY_INDEX} ON {CLEAN_TABLE} ("{KEY_COL}")')
+        if tracked:
+            create_clean_table(conn, by_source[by_source[KEY_COL].notna()], table=SOURCE_TABLE)
+            conn.execute(f'CREATE UNIQUE INDEX {SOURCE_INDEX} ON {SOURCE_TABLE} ("{KEY_COL}", "_source_file")')
+        if DATE_COL in df.columns:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {DATE_INDEX} ON {CLEAN_TABLE} ("{DATE_COL}")')
+        conn.commit()
+        return
+    ensure_columns(conn, CLEAN_TABLE, df)
+    if DATE_COL in df.columns:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {DATE_INDEX} ON {CLEAN_TABLE} ("{DATE_COL}")')
+    if not keyed or not has_key_index(conn):
+        df.to_sql(CLEAN_TABLE, conn, if_exists="append", index=False)
+        return
+    if tracked and table_exists(conn, SOURCE_TABLE):
+        by_source = by_source[by_source[KEY_COL].notna()]
+        ensure_columns(conn, SOURCE_TABLE, by_source)
+        by_source.to_sql(STAGE_TABLE, conn, if_exists="replace", index=False)
+        cols = ", ".join(f'"{c}"' for c in by_source.columns)
+        # a cópia anterior do mesmo arquivo sai inteira (REPLACE = DELETE + INSERT)
+        conn.execute(f"INSERT OR REPLACE INTO {SOURCE_TABLE} ({cols}) SELECT {cols} FROM {STAGE_TABLE}")
+    df.to_sql(STAGE_TABLE, conn, if_exists="replace", index=False)
+    cols = ", ".join(f'"{c}"' for c in df.columns)
+    # a linha vencedora substitui a anterior por inteiro: colunas que o
+    # export novo não traz ficam NULL, como no caminho sem upsert
+    table_cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{CLEAN_TABLE}")').fetchall()]
+    updates = ", ".join(
+        f'"{c}" = excluded."{c}"' if c in df.columns else f'"{c}" = NULL'
+        for c in table_cols if c != KEY_COL
+    )
+    # o "WHERE true" desfaz a ambiguidade do parser do SQLite entre
+    # INSERT ... SELECT e a cláusula ON CONFLICT
+    conn.execute(f"""
+        INSERT INTO {CLEAN_TABLE} ({cols})
+        SELECT {cols} FROM {STAGE_TABLE} WHERE true
+        ON CONFLICT ("{KEY_COL}") DO UPDATE SET {updates}
+        WHERE excluded."_export_date" >= COALESCE({CLEAN_TABLE}."_export_date", '')
+    """)
+    conn.execute(f"DROP TABLE {STAGE_TABLE}")
+    conn.commit()
+
+
+def remove_sources(conn, names):
+    """Apaga de devolucoes_clean as linhas dos arquivos `names` (sem commit).
+
+    Com o upsert, uma venda que um desses arquivos tinha vencido volta com a
+    linha do export mais recente entre os arquivos que ficaram (em empate, a
+    gravada por último), tirada de etl_source_rows."""
+    if not names or not table_exists(conn, CLEAN_TABLE):
+        return
+    params = [(n,) for n in names]
+    if not table_exists(conn, SOURCE_TABLE):
+        conn.executemany(f'DELETE FROM {CLEAN_TABLE} WHERE "_source_file" = ?', params)
+        return
+    conn.execute("DROP TABLE IF EXISTS temp._removed_keys")
+    conn.execute("CREATE TEMP TABLE _removed_keys (k TEXT PRIMARY KEY)")
+    conn.executemany(f'INSERT OR IGNORE INTO _removed_keys SELECT "{KEY_COL}" FROM {CLEAN_TABLE} '
+                     f'WHERE "_source_file" = ? AND "{KEY_COL}" IS NOT NULL', params)
+    conn.executemany(f'DELETE FROM {CLEAN_TABLE} WHERE "_source_file" = ?', params)
+    conn.executemany(f'DELETE FROM {SOURCE_TABLE} WHERE "_source_file" = ?', params)
+    source_cols = {r[1] for r in conn.execute(f'PRAGMA table_info("{SOURCE_TABLE}")').fetchall()}
+    cols = ", ".join(f'"{r[1]}"' for r in conn.execute(f'PRAGMA table_info("{CLEAN_TABLE}")').fetchall() if r[1] in source_cols)
+    conn.execute(f"""
+        INSERT INTO {CLEAN_TABLE} ({cols})
+        SELECT {cols} FROM {SOURCE_TABLE} s
+        WHERE s."{KEY_COL}" IN (SELECT k FROM _removed_keys)
+          AND s.rowid = (SELECT s2.rowid FROM {SOURCE_TABLE} s2 WHERE s2."{KEY_COL}" = s."{KEY_COL}"
+                         ORDER BY s2."_export_date" DESC, s2.rowid DESC LIMIT 1)
+    """)
+    conn.execute("DROP TABLE _removed_keys")
+
+
+def staging_path(staging_dir, digest):
+    return Path(staging_dir) / f"{digest}.parquet"
+
+
+def stage_frame(df, path):
+    """Grava o DataFrame já tipado (antes do mapeamento) em Parquet. O
+    staging é só cache: qualquer falha (ex.: coluna de planilha com tipos
+    misturados) vira aviso e o arquivo simplesmente não fica em staging."""
+    tmp = path.with_suffix(".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"Aviso: staging de {df['_source_file'].iat[0] if len(df) else path.name} ignorado: {e}")
+        tmp.unlink(missing_ok=True)
+
+
+def stage_chunks(chunks, path):
+    """Repassa os blocos de `chunks` gravando cada um como row group de
+    `path`; o arquivo só aparece (rename atômico) se todos os blocos entrarem."""
+    tmp = path.with_suffix(".tmp")
+    writer = None
+    ok = True
+    done = False
+    try:
+        for chunk in chunks:
+            if ok:
+                try:
+                    if writer is None:
+                        table = pa.Table.from_pandas(chunk, preserve_index=False)
+                        # coluna toda vazia no 1º bloco vira texto, não "null"
+                        schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        writer = pq.ParquetWriter(tmp, schema)
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+                except Exception as e:
+                    print(f"Aviso: staging de {path.name} ignorado: {e}")
+                    ok = False
+            yield chunk
+        done = True
+    finally:
+        if writer is not None:
+            writer.close()
+        if ok and done and writer is not None:
+            os.replace(tmp, path)
+        else:
+            tmp.unlink(missing_ok=True)
+
+
+def read_staged(path, chunksize=0):
+    """Lê um arquivo de staging: DataFrame inteiro ou, com `chunksize`, um
+    iterador de blocos."""
+    if not chunksize:
+        return pd.read_parquet(path)
+    return (b.to_pandas() for b in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+
+
+def stream_files(conn, changed, chunksize, mapping=None, replace=False, sniffs=None, staging_dir=None):
+    """Modo de memória limitada: lê cada arquivo em blocos e grava cada bloco
+    direto em devolucoes_clean (um commit por bloco), sem montar o
+    consolidado em memória. `mapping` é o resultado de `compile_mapping`.
+    Devolve [(path, stat, hash, nº de linhas)] dos arquivos gravados por
+    completo.
+
+    Se um arquivo falhar no meio, as linhas já gravadas dele são apagadas e
+    ele fica fora do manifesto, então a próxima execução tenta de novo.
+    Com `staging_dir`, arquivos já em staging são lidos de lá e os demais
+    são gravados em staging enquanto são processados.
+    """
+    parsed = []
+    for file, st, digest in changed:
+        n = 0
+        try:
+            if not replace:
+                remove_sources(conn, [file.name])
+            staged = staging_path(staging_dir, digest) if staging_dir else None
+            if staged is not None and staged.exists():
+                print(f"Usando staging: {file}")
+                chunks = read_staged(staged, chunksize)
+            else:
+                chunks = iter_file_chunks(file, chunksize, sniff=(sniffs or {}).get(file))
+                if staged is not None:
+                    chunks = stage_chunks(chunks, staged)
+            for chunk in chunks:
+                # o staging é por hash: uma cópia renomeada traz o nome do
+                # primeiro arquivo com esse conteúdo
+                chunk["_source_file"] = file.name
+                if mapping:
+                    chunk = apply_mapping(chunk, mapping)
+                chunk["_export_date"] = export_date(st.st_mtime)
+                write_rows(conn, chunk, replace=replace)
+                replace = False
+                n += len(chunk)
+        except Exception as e:
+            print(f"Erro processando {file}: {e}")
+            conn.rollback()
+            remove_sources(conn, [file.name])
+            conn.commit()
+            continue
+        parsed.append((file, st, digest, n))
+    return parsed
+
+
+def export_csv(conn, out_csv):
+    # em blocos para não carregar a base toda
+    if not table_exists(conn, CLEAN_TABLE):
+        return
+    with open(out_csv, "w", encoding="utf-8-sig", newline="") as f:
+        for i, chunk in enumerate(pd.read_sql(f"SELECT * FROM {CLEAN_TABLE}", conn, chunksize=50000)):
+            chunk.to_csv(f, index=False, header=(i == 0))
+
+
+def rebuild_from_staging(conn, staging_dir, mapping=None, chunksize=0):
+    """Regenera devolucoes_clean só a partir do staging dos arquivos do
+    manifesto atual, sem abrir nenhum CSV/XLSX (ex.: depois de alterar o
+    columns_map.json)."""
+    manifest = load_manifest(conn)
+    frames = []
+    replace = True
+    for name, entry in sorted(manifest.items()):
+        path = staging_path(staging_dir, entry["content_hash"])
+        if not path.exists():
+            print(f"Sem staging para {name}; rode o ETL normal (--full) para reprocessá-lo")
+            continue
+        print(f"Usando staging: {name}")
+        for df in (read_staged(path, chunksize) if chunksize else [read_staged(path)]):
+            # o staging é por hash: vale o nome registrado no manifesto
+            df["_source_file"] = name
+            if mapping:
+                df = apply_mapping(df, mapping)
+            df["_export_date"] = export_date(entry["mtime"])
+            if chunksize:
+                write_rows(conn, df, replace=replace)
+                replace = False
+            else:
+                frames.append(df)
+    if frames:
+        write_rows(conn, pd.concat(frames, ignore_index=True), replace=True)
+    # novo run_id: a normalização incremental trata todos os arquivos como alterados
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    conn.execute(f"UPDATE {MANIFEST_TABLE} SET run_id = ?", (run_id,))
+    bump_load_version(conn)
+    conn.commit()
+
+
+def list_input_files(input_dir):
+    return [f for f in sorted(Path(input_dir).glob("*")) if f.suffix.lower() in INPUT_SUFFIXES]
+
+
+def load_mapping(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return compile_mapping(json.load(f).get("mappings", {}))
+
+
+def ingest(conn, input_dir, mapping=None, full=False, workers=1, chunksize=0, staging_dir=None, files=None):
+    """Carga incremental de `input_dir` em devolucoes_clean (manifesto, sniff,
+    staging, upsert). `files` restringe a carga a esses arquivos (o
+    watch_ingest.py passa só os que já terminaram de ser gravados), exceto
+    numa reconstrução completa, que sempre lê todo o `input_dir`. Sem
+    `files`, os arquivos do manifesto que não estão mais em `input_dir` têm
+    as linhas e a entrada no manifesto apagadas. Devolve
+    [(arquivo, stat, hash, nº de linhas)] dos arquivos (re)processados."""
+    # sem tabela (ou sem manifesto de uma base antiga) não há como saber o que
+    # já foi importado: reconstrói tudo
+    manifest = load_manifest(conn)
+    full = full or not table_exists(conn, CLEAN_TABLE) or not manifest or needs_rebuild(conn)
+    if full:
+        manifest = {}
+        # a reconstrução apaga a tabela e o manifesto: vale a pasta inteira,
+        # não só o lote pedido em `files`
+        files = None
+
+    removed = []
+    if files is None:
+        files = list_input_files(input_dir)
+        # arquivos do manifesto que saíram da pasta: as linhas deles saem da
+        # base (um lote parcial em `files` não diz nada sobre os outros)
+        present = {f.name for f in files}
+        removed = sorted(name for name in manifest if name not in present)
+    changed, unchanged = plan_files(files, manifest)
+    print(f"Arquivos: {len(changed)} novos/alterados, {len(unchanged)} inalterados, {len(removed)} removidos")
+    if removed:
+        remove_sources(conn, removed)
+        conn.executemany(f"DELETE FROM {MANIFEST_TABLE} WHERE file_path = ?", [(n,) for n in removed])
+        conn.commit()
+
+    # detecção de encoding/delimitador/cabeçalho: reaproveita o cache por
+    # hash de conteúdo e só lê o início dos arquivos nunca vistos
+    sniff_cache = load_sniff_cache(conn)
+    sniffs = {}
+    for file, _, digest in changed:
+        if file.suffix.lower() == ".csv":
+            sniffs[file] = sniff_cache.get(digest) or sniff_file(file)
+    save_sniffs(conn, [(digest, sniffs[file]) for file, _, digest in changed if file in sniffs and digest not in sniff_cache])
+
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    all_dfs = []
+    parsed = []
+    if chunksize > 0:
+        parsed = stream_files(conn, changed, chunksize, mapping, replace=full, sniffs=sniffs, staging_dir=staging_dir)
+    else:
+        # arquivos já em staging (mesmo hash) não são reprocessados
+        staged = {}
+        if staging_dir is not None:
+            staged = {file: staging_path(staging_dir, digest) for file, _, digest in changed if staging_path(staging_dir, digest).exists()}
+        to_parse = [(file, sniffs.get(file)) for file, _, _ in changed if file not in staged]
+        results = dict(zip([file for file, _ in to_parse], parse_files(to_parse, workers=workers)))
+        for file, st, digest in changed:
+            if file in staged:
+                print(f"Usando staging: {file}")
+                df, err = read_staged(staged[file]), None
+                # o staging é por hash: uma cópia renomeada traz o nome do
+                # primeiro arquivo com esse conteúdo
+                df["_source_file"] = file.name
+            else:
+                df, err = results[file]
+                if err is None and staging_dir is not None:
+                    stage_frame(df, staging_path(staging_dir, digest))
+            if err is not None:
+                print(f"Erro processando {file}: {err}")
+                continue
+            if mapping:
+                df = apply_mapping(df, mapping)
+            df["_export_date"] = export_date(st.st_mtime)
+            all_dfs.append(df)
+            parsed.append((file, st, digest, len(df)))
+
+    # cria consolidado (apenas dos arquivos novos/alterados)
+    if all_dfs:
+        consolidado = pd.concat(all_dfs, ignore_index=True)
+
+        if not full:
+            # remove as linhas antigas dos arquivos reprocessados antes do upsert
+            remove_sources(conn, [f.name for f, _, _, _ in parsed])
+        write_rows(conn, consolidado, replace=full)
+
+    # arquivos inalterados só com mtime diferente: atualiza para o atalho
+    # tamanho+mtime funcionar na próxima execução
+    conn.executemany(
+        f"UPDATE {MANIFEST_TABLE} SET size = ?, mtime = ? WHERE file_path = ?",
+        [(f.stat().st_size, f.stat().st_mtime, f.name) for f in unchanged],
+    )
+    if full and parsed:
+        conn.execute(f"DELETE FROM {MANIFEST_TABLE}")
+    if parsed:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {MANIFEST_TABLE} (file_path, size, mtime, content_hash, row_count, run_id) VALUES (?,?,?,?,?,?)",
+            [(f.name, st.st_size, st.st_mtime, digest, n, run_id) for f, st, digest, n in parsed],
+        )
+    if parsed or removed:
+        bump_load_version(conn)
+    conn.commit()
+
+    return parsed
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input-dir", required=True)
+    parser.add_argument("--input-dir", required=False)
     parser.add_argument("--db", required=True)
     parser.add_argument("--map", required=False, help="path para columns_map.json")
     parser.add_argument("--out-csv", required=False, help="path para consolidado.csv")
+    parser.add_argument("--full", action="store_true", help="ignora o manifesto e reconstrói devolucoes_clean do zero")
+    parser.add_argument("--workers", type=int, default=1, help="nº de processos para o parse dos arquivos (padrão: 1, serial)")
+    parser.add_argument("--chunksize", type=int, default=0, help="lê CSVs em blocos de N linhas e grava cada bloco direto no SQLite (memória limitada; ignora --workers)")
+    parser.add_argument("--staging-dir", required=False, help="pasta do staging em Parquet (padrão: staging/ ao lado do banco)")
+    parser.add_argument("--no-staging", action="store_true", help="não lê nem grava o staging em Parquet")
+    parser.add_argument("--rebuild-from-staging", action="store_true", help="regenera devolucoes_clean só a partir do staging, sem ler os arquivos de entrada")
     args = parser.parse_args()
+    if not args.input_dir and not args.rebuild_from_staging:
+        parser.error("--input-dir é obrigatório (exceto com --rebuild-from-staging)")
 
-    input_dir = Path(args.input_dir)
     db_path = Path(args.db)
     db_path.parent.mkdir(parents=True, exist_ok=True)
 
     conn = sqlite3.connect(str(db_path))
+    ensure_manifest(conn)
+    ensure_sniff_cache(conn)
 
     # load mapping if provided
     mapping = None
     if args.map:
-        with open(args.map, "r", encoding="utf-8") as f:
-            mapping = json.load(f).get("mappings", {})
+        mapping = load_mapping(args.map)
 
-    all_dfs = []
-    for file in sorted(input_dir.glob("*")):
-        if file.suffix.lower() in (".csv", ".xlsx", ".xls"):
-            try:
-                df = process_file(file, conn)
-                all_dfs.append(df)
-            except Exception as e:
-                print(f"Erro processando {file}: {e}")
-
-    # cria consolidado
-    if all_dfs:
-        consolidado = pd.concat(all_dfs, ignore_index=True)
+    staging_dir = None
+    if not args.no_staging:
+        if pq is None:
+            print("Aviso: pyarrow não instalado; staging em Parquet desativado")
+        else:
+            staging_dir = Path(args.staging_dir) if args.staging_dir else db_path.parent / "staging"
 
-        # aplica mapeamento heurístico para esquema limpo
-        if mapping:
-            new_cols = {}
-            lower_cols = {c: c for c in consolidado.columns}
-            for std_name, candidates in mapping.items():
-                found = None
-                for cand in candidates:
-                    for col in consolidado.columns:
-                        if cand.lower() == col.lower():
-                            found = col
-                            break
-                    if found:
-                        break
-                if found:
-                    new_cols[found] = std_name
-            consolidado = consolidado.rename(columns=new_cols)
-
-        # salva consolidado em CSV se solicitado
+    if args.rebuild_from_staging:
+        if staging_dir is None:
+            parser.error("--rebuild-from-staging precisa do staging (pyarrow instalado, sem --no-staging)")
+        rebuild_from_staging(conn, staging_dir, mapping, args.chunksize)
         if args.out_csv:
-            consolidado.to_csv(args.out_csv, index=False, encoding="utf-8-sig")
+            export_csv(conn, args.out_csv)
+        conn.close()
+        print("Concluído (a partir do staging). Base gerada em:", db_path)
+        return
+
+    ingest(conn, Path(args.input_dir), mapping, full=args.full, workers=args.workers,
+           chunksize=args.chunksize, staging_dir=staging_dir)
 
-        # grava tabela limpa no sqlite
-        consolidado.to_sql("devolucoes_clean", conn, if_exists="replace", index=False)
+    # salva consolidado em CSV se solicitado (tabela inteira, não só o lote novo)
+    if args.out_csv:
+        export_csv(conn, args.out_csv)
 
     conn.close()
     print("Concluído. Base gerada em:", db_path)
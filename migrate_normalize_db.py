@@ -4,318 +4,577 @@
 Cria tabelas: orders, order_items, buyers, shipments, returns, complaints, fees, actions
 Cria view: view_orders_financials
 Gera relatório top 50 pendências em Excel
+
+Incremental: a tabela normalize_state guarda o manifesto do ETL da última
+execução; só as vendas dos arquivos reimportados desde então são refeitas.
+Use --full para recriar tudo. A reconstrução completa monta tabelas-sombra
+e troca por RENAME em uma transação curta: o app lendo o banco ao mesmo
+tempo vê sempre as tabelas antigas ou as novas, completas.
 """
+import argparse
 import sqlite3
 import pandas as pd
 from pathlib import Path
 
+from etl_to_sqlite import (
+    DATE_COL,
+    DATE_INDEX,
+    KEY_COL,
+    KEY_INDEX,
+    MANIFEST_TABLE,
+    bump_load_version,
+    conform_to_schema,
+    create_clean_table,
+    has_key_index,
+    read_iso_dates,
+    schema_outdated,
+    table_exists,
+)
+from reclaim import passivel_extorno_sql, pendente_sql, prejuizo_pendente_sql
+
 DB = Path('ml_devolucoes.db')
 OUT_DIR = Path('reports')
 OUT_DIR.mkdir(exist_ok=True)
 
-RECLAIM_COLS = ['cancelamentos_reembolsos_brl', 'tarifas_envio_brl', 'tarifa_venda_impostos_brl']
-
-
-def to_num(s):
-    try:
-        return float(s)
-    except Exception:
-        return 0.0
-
-
-def main():
-    if not DB.exists():
-        print('Banco não encontrado:', DB)
-        return
-
-    con = sqlite3.connect(str(DB))
+FEE_COLS = ['tarifa_venda_impostos_brl', 'tarifas_envio_brl', 'cancelamentos_reembolsos_brl']
+
+# tabelas derivadas de devolucoes_clean (por order_id)
+CHILD_TABLES = ['orders', 'order_items', 'shipments', 'returns', 'complaints', 'fees']
+# tudo que a reconstrução completa monta em tabelas-sombra ("<tabela>__new")
+# e troca de uma vez; actions e reviews guardam dados do usuário e ficam fora
+DERIVED_TABLES = CHILD_TABLES + ['buyers', 'summary_day_sku_motivo', 'summary_day_motivo']
+SHADOW = '__new'
+OLD = '__old'
+
+# {s}: sufixo do nome da tabela ('' ou SHADOW)
+TABLES_SQL = '''
+CREATE TABLE orders{s} (
+    order_id TEXT PRIMARY KEY,
+    data_venda TIMESTAMP,
+    ano_mes TEXT,
+    estado TEXT,
+    descricao_status TEXT,
+    total_brl REAL,
+    receita_produtos_brl REAL,
+    receita_envio_brl REAL,
+    tarifa_venda_impostos_brl REAL,
+    tarifas_envio_brl REAL,
+    cancelamentos_reembolsos_brl REAL,
+    dinheiro_liberado REAL,
+    resultado TEXT,
+    motivo_resultado TEXT,
+    mes_faturamento TEXT,
+    source_file TEXT,
+    _valor_passivel_extorno REAL,
+    _valor_pendente REAL
+);
+
+CREATE TABLE order_items{s} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    sku TEXT,
+    anuncio_id TEXT,
+    titulo TEXT,
+    variacao TEXT,
+    preco_unitario REAL,
+    unidades INTEGER
+);
+
+CREATE TABLE buyers{s} (
+    buyer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    comprador TEXT,
+    cpf TEXT,
+    endereco TEXT,
+    cidade TEXT,
+    estado TEXT,
+    cep TEXT,
+    pais TEXT
+);
+
+CREATE TABLE shipments{s} (
+    shipment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    forma_de_entrega TEXT,
+    data_a_caminho TIMESTAMP,
+    data_de_entrega TIMESTAMP,
+    motorista TEXT,
+    numero_de_rastreamento TEXT,
+    url_acompanhamento TEXT
+);
+
+CREATE TABLE returns{s} (
+    return_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    revisado_pelo_mercado_livre TEXT,
+    data_de_revisao TIMESTAMP,
+    dinheiro_liberado REAL,
+    resultado TEXT,
+    destino TEXT,
+    motivo_resultado TEXT
+);
+
+CREATE TABLE complaints{s} (
+    complaint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    unidades INTEGER,
+    reclamacao_aberta TEXT,
+    reclamacao_encerrada TEXT,
+    em_mediacao TEXT
+);
+
+CREATE TABLE fees{s} (
+    fee_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    fee_type TEXT,
+    amount REAL
+);
+
+CREATE TABLE summary_day_sku_motivo{s} (
+    dia TEXT,
+    ano_mes TEXT,
+    sku TEXT,
+    motivo_resultado TEXT,
+    linhas INTEGER,
+    pedidos INTEGER,
+    receita REAL,
+    devolucoes INTEGER,
+    prejuizo REAL,
+    prejuizo_pendente REAL,
+    valor_pendente REAL,
+    linhas_pendentes INTEGER,
+    receita_pendentes REAL
+);
+
+CREATE TABLE summary_day_motivo{s} (
+    dia TEXT,
+    ano_mes TEXT,
+    motivo_resultado TEXT,
+    pedidos INTEGER,
+    devolucoes INTEGER
+);
+'''
+
+META_SQL = '''
+CREATE TABLE IF NOT EXISTS normalize_state (
+    file_path TEXT PRIMARY KEY,
+    content_hash TEXT,
+    run_id TEXT
+);
+
+CREATE TABLE IF NOT EXISTS actions (
+    action_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    user TEXT,
+    action TEXT,
+    note TEXT,
+    ts TIMESTAMP DEFAULT (datetime('now'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_actions_order_id ON actions (order_id);
+'''
+
+VIEW_SQL = '''
+DROP VIEW IF EXISTS view_orders_financials;
+DROP VIEW IF EXISTS summary_month_sku;
+
+CREATE VIEW view_orders_financials AS
+SELECT
+  o.order_id,
+  o.data_venda,
+  o.total_brl,
+  o.receita_produtos_brl,
+  o.receita_envio_brl,
+  o.tarifa_venda_impostos_brl,
+  o.tarifas_envio_brl,
+  o.cancelamentos_reembolsos_brl,
+  o.dinheiro_liberado,
+  o._valor_passivel_extorno,
+  o._valor_pendente
+FROM orders o;
+
+CREATE VIEW summary_month_sku AS
+SELECT ano_mes, sku, SUM(linhas) AS linhas, SUM(pedidos) AS pedidos, SUM(receita) AS receita,
+  SUM(devolucoes) AS devolucoes, SUM(prejuizo) AS prejuizo, SUM(prejuizo_pendente) AS prejuizo_pendente,
+  SUM(valor_pendente) AS valor_pendente, SUM(linhas_pendentes) AS linhas_pendentes,
+  SUM(receita_pendentes) AS receita_pendentes
+FROM summary_day_sku_motivo
+GROUP BY ano_mes, sku;
+'''
+
+# agregados por dia x SKU x motivo sobre orders JOIN order_items (as mesmas
+# linhas que o load_financials do app lê): receita e devoluções (total < 0),
+# prejuízo e prejuízo pendente como no app, _valor_pendente como no top 50.
+# Uma venda com mais de um SKU conta em `pedidos` de cada grupo.
+SUMMARY_SELECT = f'''
+SELECT substr(o.data_venda, 1, 10), o.ano_mes, oi.sku, o.motivo_resultado,
+  COUNT(*), COUNT(DISTINCT o.order_id), SUM(o.total_brl),
+  SUM(o.total_brl < 0),
+  SUM(CASE WHEN o.total_brl < 0 THEN -o.total_brl ELSE 0.0 END),
+  SUM(CASE WHEN o.total_brl < 0 THEN {prejuizo_pendente_sql('o.total_brl', 'o.dinheiro_liberado')} ELSE 0.0 END),
+  SUM(o._valor_pendente),
+  SUM(o._valor_pendente > 0),
+  SUM(CASE WHEN o._valor_pendente > 0 THEN o.total_brl ELSE 0.0 END)
+FROM orders{{s}} o JOIN order_items{{s}} oi ON oi.order_id = o.order_id
+WHERE {{where}}
+GROUP BY 1, 2, 3, 4
+'''
+
+# pedidos distintos por dia x motivo (sem SKU): a contagem de pedidos e de
+# devoluções do app sem filtro de SKU, sem repetir a venda de vários SKUs
+SUMMARY_MOTIVO_SELECT = '''
+SELECT substr(o.data_venda, 1, 10), o.ano_mes, o.motivo_resultado,
+  COUNT(DISTINCT o.order_id),
+  COUNT(DISTINCT CASE WHEN o.total_brl < 0 THEN o.order_id END)
+FROM orders{s} o JOIN order_items{s} oi ON oi.order_id = o.order_id
+WHERE {where}
+GROUP BY 1, 2, 3
+'''
+
+
+# criados depois da carga (mais rápido que manter durante os INSERTs) e
+# mantidos pelo SQLite nas execuções incrementais. ano_mes ('AAAA-MM') serve
+# a lista de meses do app; os filtros de mês (query_builder) viram faixa
+# semiaberta em data_venda, que também usa índice; sku usa NOCASE
+# para o LIKE 'prefixo%' (case-insensitive) poder usar o índice.
+# {g}: '' ou '_b'. Nomes de índice não mudam com ALTER TABLE RENAME, então
+# cada reconstrução completa usa a geração que não está em uso.
+INDEX_SQL = '''
+CREATE INDEX IF NOT EXISTS ix_orders_ano_mes{g} ON orders{s} (ano_mes);
+CREATE INDEX IF NOT EXISTS ix_orders_data_venda{g} ON orders{s} (data_venda);
+CREATE INDEX IF NOT EXISTS ix_orders_motivo_resultado{g} ON orders{s} (motivo_resultado);
+CREATE INDEX IF NOT EXISTS ix_orders_valor_pendente{g} ON orders{s} (_valor_pendente);
+CREATE INDEX IF NOT EXISTS ix_orders_total_brl{g} ON orders{s} (total_brl);
+CREATE INDEX IF NOT EXISTS ix_orders_source_file{g} ON orders{s} (source_file);
+CREATE INDEX IF NOT EXISTS ix_order_items_order_id{g} ON order_items{s} (order_id);
+CREATE INDEX IF NOT EXISTS ix_order_items_sku{g} ON order_items{s} (sku COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ix_buyers_comprador_cpf{g} ON buyers{s} (comprador, cpf);
+CREATE INDEX IF NOT EXISTS ix_shipments_order_id{g} ON shipments{s} (order_id);
+CREATE INDEX IF NOT EXISTS ix_returns_order_id{g} ON returns{s} (order_id);
+CREATE INDEX IF NOT EXISTS ix_complaints_order_id{g} ON complaints{s} (order_id);
+CREATE INDEX IF NOT EXISTS ix_fees_order_id{g} ON fees{s} (order_id);
+CREATE INDEX IF NOT EXISTS ix_summary_ano_mes{g} ON summary_day_sku_motivo{s} (ano_mes);
+CREATE INDEX IF NOT EXISTS ix_summary_day_motivo_ano_mes{g} ON summary_day_motivo{s} (ano_mes);
+'''
+
+
+def run_script(cur, script):
+    # executescript faria COMMIT antes; aqui tudo fica na mesma transação
+    for stmt in script.split(';'):
+        if stmt.strip():
+            cur.execute(stmt)
+
+
+def upgrade_clean_table(con):
+    """Converte uma única vez um devolucoes_clean de antes do esquema tipado
+    (valores em texto, datas dd/mm/aaaa) para os tipos de CLEAN_SCHEMA, para
+    que a normalização possa ser feita só em SQL. Devolve True se converteu."""
+    if not schema_outdated(con):
+        return False
+    print('Convertendo devolucoes_clean para o esquema tipado...')
+    had_index = has_key_index(con)
     df = pd.read_sql('select * from devolucoes_clean', con)
-    print('Linhas originais:', len(df))
-
-    # Normalizar nomes de colunas (já estão em snake_case na tabela)
-
-    # Garantir colunas numéricas
-    num_cols = ['total_brl', 'receita_por_produtos_brl', 'receita_por_envio_brl',
-                'tarifas_envio_brl', 'tarifa_venda_impostos_brl', 'cancelamentos_reembolsos_brl',
-                'preco_unitario_brl', 'dinheiro_liberado']
-    for c in num_cols:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
-        else:
-            df[c] = 0.0
-
-    # datas
+    df = conform_to_schema(df)
     for c in df.columns:
         if 'data' in c:
             try:
-                df[c] = pd.to_datetime(df[c], dayfirst=True, errors='coerce')
+                df[c] = read_iso_dates(df[c])
             except Exception:
                 pass
+    create_clean_table(con, df)
+    if had_index:
+        con.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {KEY_INDEX} ON devolucoes_clean ("{KEY_COL}")')
+    if DATE_COL in df.columns:
+        con.execute(f'CREATE INDEX IF NOT EXISTS {DATE_INDEX} ON devolucoes_clean ("{DATE_COL}")')
+    con.commit()
+    return True
+
+
+def insert_statements(cols, scope=None, suffix=''):
+    """INSERT ... SELECT de cada tabela normalizada a partir de devolucoes_clean.
+
+    `cols` são as colunas existentes em devolucoes_clean; as que faltam entram
+    como NULL (ou 0.0 nos valores). Linhas sem n_de_venda não geram venda.
+    `scope` (condição SQL sobre `d`) restringe às vendas a renormalizar; nesse
+    caso só entram compradores que ainda não estão em buyers. `suffix` é o
+    sufixo das tabelas de destino (SHADOW na reconstrução completa)."""
+    def c(name, default='NULL'):
+        return f'd."{name}"' if name in cols else default
+
+    def num(name):
+        return f'COALESCE({c(name)}, 0.0)'
+
+    def iso(name):
+        return f"strftime('%Y-%m-%dT%H:%M:%S', {c(name)})"
+
+    # valor passível de extorno e pendente: regra de reclaim.py, em SQL
+    reclaim = passivel_extorno_sql(ref=num)
+    pendente = pendente_sql(ref=num)
+    oid = c('n_de_venda')
+    valid = f"{oid} IS NOT NULL AND {oid} != ''"
+    if scope:
+        valid = f'{valid} AND {scope}'
+    buyers_where = 'WHERE ' + scope if scope else ''
+    buyers_new = (f"AND NOT EXISTS (SELECT 1 FROM buyers{suffix} b WHERE b.comprador IS {c('comprador')} AND b.cpf IS {c('cpf')})"
+                  if scope else '')
+    endereco = c('endereco.1') if 'endereco.1' in cols else c('endereco')
+    uf = c('estado.1') if 'estado.1' in cols else c('estado')
+    anuncio = c('anuncio_id') if 'anuncio_id' in cols else c('# de anúncio')
+    unidades = f"COALESCE(CAST({c('unidades')} AS INTEGER), CAST({c('unidades.1')} AS INTEGER), 1)"
+    reclamacao_un = c('unidades.2') if 'unidades.2' in cols else c('unidades')
+    fees = ' UNION ALL '.join(
+        f"SELECT d.rowid AS r, {k} AS k, {oid} AS order_id, '{x}' AS fee_type, {num(x)} AS amount "
+        f"FROM devolucoes_clean d WHERE {valid} AND {num(x)} != 0"
+        for k, x in enumerate(FEE_COLS))
+
+    return [
+        # buyers: primeira ocorrência de cada (comprador, cpf)
+        f'''INSERT INTO buyers{suffix} (comprador, cpf, endereco, cidade, estado, cep, pais)
+            SELECT {c('comprador')}, {c('cpf')}, {endereco}, {c('cidade')}, {uf}, {c('cep')}, {c('pais')}
+            FROM devolucoes_clean d
+            WHERE d.rowid IN (SELECT MIN(rowid) FROM devolucoes_clean d {buyers_where} GROUP BY {c('comprador')}, {c('cpf')})
+            {buyers_new}
+            ORDER BY d.rowid''',
+        # orders: se a venda aparece mais de uma vez, vale a última linha
+        f'''INSERT INTO orders{suffix} (order_id, data_venda, ano_mes, estado, descricao_status, total_brl, receita_produtos_brl,
+                receita_envio_brl, tarifa_venda_impostos_brl, tarifas_envio_brl, cancelamentos_reembolsos_brl,
+                dinheiro_liberado, resultado, motivo_resultado, mes_faturamento, source_file,
+                _valor_passivel_extorno, _valor_pendente)
+            SELECT {oid}, {iso('data_venda')}, strftime('%Y-%m', {c('data_venda')}), {c('estado')}, {c('descricao_do_status')}, {num('total_brl')},
+                {num('receita_por_produtos_brl')}, {num('receita_por_envio_brl')}, {num('tarifa_venda_impostos_brl')},
+                {num('tarifas_envio_brl')}, {num('cancelamentos_reembolsos_brl')}, {num('dinheiro_liberado')},
+                {c('resultado')}, {c('motivo_resultado')}, {c('mes_de_faturamento_das_suas_tarifas')},
+                {c('_source_file')}, {reclaim}, {pendente}
+            FROM devolucoes_clean d
+            WHERE {valid} AND d.rowid IN (SELECT MAX(rowid) FROM devolucoes_clean d WHERE {valid} GROUP BY {oid})''',
+        f'''INSERT INTO order_items{suffix} (order_id, sku, anuncio_id, titulo, variacao, preco_unitario, unidades)
+            SELECT {oid}, {c('sku')}, {anuncio}, {c('titulo_do_anuncio')}, {c('variacao')},
+                {num('preco_unitario_brl')}, {unidades}
+            FROM devolucoes_clean d WHERE {valid} ORDER BY d.rowid''',
+        f'''INSERT INTO shipments{suffix} (order_id, forma_de_entrega, data_a_caminho, data_de_entrega, motorista,
+                numero_de_rastreamento, url_acompanhamento)
+            SELECT {oid}, {c('forma_de_entrega')}, {iso('data_a_caminho')}, {iso('data_de_entrega')},
+                {c('motorista')}, {c('numero_de_rastreamento')}, {c('url_acompanhamento')}
+            FROM devolucoes_clean d WHERE {valid} ORDER BY d.rowid''',
+        f'''INSERT INTO returns{suffix} (order_id, revisado_pelo_mercado_livre, data_de_revisao, dinheiro_liberado,
+                resultado, destino, motivo_resultado)
+            SELECT {oid}, {c('revisado_pelo_mercado_livre')}, {iso('data_de_revisao')}, {num('dinheiro_liberado')},
+                {c('resultado')}, {c('destino')}, {c('motivo_resultado')}
+            FROM devolucoes_clean d WHERE {valid} ORDER BY d.rowid''',
+        f'''INSERT INTO complaints{suffix} (order_id, unidades, reclamacao_aberta, reclamacao_encerrada, em_mediacao)
+            SELECT {oid}, {reclamacao_un}, {c('reclamacao_aberta')}, {c('reclamacao_encerrada')}, {c('em_mediacao')}
+            FROM devolucoes_clean d WHERE {valid} ORDER BY d.rowid''',
+        # fees: uma linha por tarifa não-zero, na ordem venda -> tipo de tarifa
+        f'''INSERT INTO fees{suffix} (order_id, fee_type, amount)
+            SELECT order_id, fee_type, amount FROM ({fees}) ORDER BY r, k''',
+    ]
+
+
+def refresh_summary(cur, months=None, suffix=''):
+    """Recalcula summary_day_sku_motivo e summary_day_motivo inteiras ou só
+    os meses que satisfazem `months` (condição sobre {col}, ex.: "{col} IS NULL")."""
+    months = months or '1'
+    for table, select in (('summary_day_sku_motivo', SUMMARY_SELECT), ('summary_day_motivo', SUMMARY_MOTIVO_SELECT)):
+        cur.execute(f'DELETE FROM {table}{suffix} WHERE {months.format(col="ano_mes")}')
+        cur.execute(f'INSERT INTO {table}{suffix} {select.format(where=months.format(col="o.ano_mes"), s=suffix)}')
+
+
+def manifest_snapshot(con):
+    """{arquivo: (hash, run_id)} do manifesto do ETL ({} se não houver)."""
+    if not table_exists(con, MANIFEST_TABLE):
+        return {}
+    return {r[0]: (r[1], r[2]) for r in con.execute(f'SELECT file_path, content_hash, run_id FROM {MANIFEST_TABLE}')}
+
+
+def schema_current(con):
+    """As tabelas normalizadas existem e foram criadas com o TABLES_SQL atual.
+    O SQLite guarda o CREATE TABLE original em sqlite_master (o RENAME da
+    troca só reescreve o nome), então basta comparar as colunas."""
+    expected = {}
+    for stmt in TABLES_SQL.format(s='').split(';'):
+        stmt = stmt.strip()
+        if stmt:
+            expected[stmt.split()[2]] = stmt[stmt.index('('):]
+    found = dict(con.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'"))
+    return all(found.get(name, '').endswith(cols) for name, cols in expected.items())
+
+
+def index_generation(con):
+    """Sufixo ('' ou '_b') dos índices das tabelas em uso."""
+    return '_b' if con.execute("SELECT 1 FROM sqlite_master WHERE name = 'ix_orders_ano_mes_b'").fetchone() else ''
+
+
+def bulk_pragmas(con):
+    """WAL: quem lê (o app) continua vendo o último commit, sem bloquear nem
+    ser bloqueado pela carga; synchronous=NORMAL é seguro em WAL."""
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    con.execute('PRAGMA temp_store=MEMORY')
+    con.execute('PRAGMA cache_size=-131072')  # 128 MB
+
+
+def build_shadow(con, cols):
+    """Monta as tabelas derivadas completas em <tabela>__new, ao lado das que
+    estão em uso. Cada etapa é uma transação curta, para o app conseguir
+    gravar (reviews, actions) entre elas."""
+    for t in DERIVED_TABLES:
+        con.execute(f'DROP TABLE IF EXISTS {t}{SHADOW}')  # sobra de execução interrompida
+        con.execute(f'DROP TABLE IF EXISTS {t}{OLD}')
+    cur = con.cursor()
+    run_script(cur, TABLES_SQL.format(s=SHADOW))
+    for stmt in insert_statements(cols, suffix=SHADOW):
+        cur.execute(stmt)
+        con.commit()
+    refresh_summary(cur, suffix=SHADOW)
+    con.commit()
+    gen = '' if index_generation(con) == '_b' else '_b'
+    run_script(cur, INDEX_SQL.format(g=gen, s=SHADOW))
+    con.commit()
 
-    # indicadores financeiros
-    def row_reclaim(r):
-        s = 0.0
-        for c in RECLAIM_COLS:
-            if c in r.index and pd.notna(r[c]):
-                val = to_num(r[c])
-                if val < 0:
-                    s += -val
-        return s
-
-    df['_valor_passivel_extorno'] = df.apply(row_reclaim, axis=1)
-    df['_valor_pendente'] = (df['_valor_passivel_extorno'] - df['dinheiro_liberado']).clip(lower=0.0)
 
-    # criar tabelas normalizadas
+def swap_shadow(con, snapshot):
+    """Troca as tabelas em uso pelas de build_shadow em uma única transação
+    curta (só RENAMEs); quem lê vê as tabelas antigas ou as novas, nunca
+    uma metade. As antigas são apagadas depois do COMMIT."""
     cur = con.cursor()
-
-    # drop se existirem (safe for reruns)
-    cur.executescript('''
-    DROP TABLE IF EXISTS orders;
-    DROP TABLE IF EXISTS order_items;
-    DROP TABLE IF EXISTS buyers;
-    DROP TABLE IF EXISTS shipments;
-    DROP TABLE IF EXISTS returns;
-    DROP TABLE IF EXISTS complaints;
-    DROP TABLE IF EXISTS fees;
-    DROP TABLE IF EXISTS actions;
-    DROP VIEW IF EXISTS view_orders_financials;
-    ''')
-
-    cur.executescript('''
-    CREATE TABLE orders (
-        order_id TEXT PRIMARY KEY,
-        data_venda TIMESTAMP,
-        estado TEXT,
-        descricao_status TEXT,
-        total_brl NUMERIC,
-        receita_produtos_brl NUMERIC,
-        receita_envio_brl NUMERIC,
-        tarifa_venda_impostos_brl NUMERIC,
-        tarifas_envio_brl NUMERIC,
-        cancelamentos_reembolsos_brl NUMERIC,
-        dinheiro_liberado NUMERIC,
-        resultado TEXT,
-        motivo_resultado TEXT,
-        mes_faturamento TEXT,
-        source_file TEXT,
-        _valor_passivel_extorno NUMERIC,
-        _valor_pendente NUMERIC
-    );
-
-    CREATE TABLE order_items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        sku TEXT,
-        anuncio_id TEXT,
-        titulo TEXT,
-        variacao TEXT,
-        preco_unitario NUMERIC,
-        unidades INTEGER
-    );
-
-    CREATE TABLE buyers (
-        buyer_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        comprador TEXT,
-        cpf TEXT,
-        endereco TEXT,
-        cidade TEXT,
-        estado TEXT,
-        cep TEXT,
-        pais TEXT
-    );
-
-    CREATE TABLE shipments (
-        shipment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        forma_de_entrega TEXT,
-        data_a_caminho TIMESTAMP,
-        data_de_entrega TIMESTAMP,
-        motorista TEXT,
-        numero_de_rastreamento TEXT,
-        url_acompanhamento TEXT
-    );
-
-    CREATE TABLE returns (
-        return_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        revisado_pelo_mercado_livre TEXT,
-        data_de_revisao TIMESTAMP,
-        dinheiro_liberado NUMERIC,
-        resultado TEXT,
-        destino TEXT,
-        motivo_resultado TEXT
-    );
-
-    CREATE TABLE complaints (
-        complaint_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        unidades INTEGER,
-        reclamacao_aberta TEXT,
-        reclamacao_encerrada TEXT,
-        em_mediacao TEXT
-    );
-
-    CREATE TABLE fees (
-        fee_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        fee_type TEXT,
-        amount NUMERIC
-    );
-
-    CREATE TABLE actions (
-        action_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        user TEXT,
-        action TEXT,
-        note TEXT,
-        ts TIMESTAMP DEFAULT (datetime('now'))
-    );
-    ''')
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        # views que apontam para tabelas renomeadas impediriam o RENAME
+        cur.execute('DROP VIEW IF EXISTS view_orders_financials')
+        cur.execute('DROP VIEW IF EXISTS summary_month_sku')
+        for t in DERIVED_TABLES:
+            if table_exists(con, t):
+                cur.execute(f'ALTER TABLE {t} RENAME TO {t}{OLD}')
+            cur.execute(f'ALTER TABLE {t}{SHADOW} RENAME TO {t}')
+        run_script(cur, META_SQL)
+        run_script(cur, VIEW_SQL)
+        save_state(cur, snapshot)
+    except Exception:
+        con.rollback()
+        raise
     con.commit()
-
-    # popular buyers (unique by comprador + cpf)
-    buyers = {}
-    for idx, r in df.iterrows():
-        key = (str(r.get('comprador', '')), str(r.get('cpf', '')))
-        if key not in buyers:
-            buyers[key] = (r.get('comprador'), r.get('cpf'), r.get('endereco.1') if 'endereco.1' in df.columns else r.get('endereco'), r.get('cidade'), r.get('estado.1') if 'estado.1' in df.columns else r.get('estado'), r.get('cep'), r.get('pais'))
-    for v in buyers.values():
-        cur.execute('INSERT INTO buyers (comprador, cpf, endereco, cidade, estado, cep, pais) VALUES (?,?,?,?,?,?,?)', v)
+    for t in DERIVED_TABLES:
+        con.execute(f'DROP TABLE IF EXISTS {t}{OLD}')
     con.commit()
 
-    # popular orders, items, shipments, returns, complaints
-    for idx, r in df.iterrows():
-        order_id = str(r.get('n_de_venda'))
-        if not order_id:
-            continue
-        data_venda = r.get('data_venda')
-        if hasattr(data_venda, 'isoformat'):
-            data_venda_val = data_venda.isoformat()
-        else:
-            data_venda_val = None if pd.isna(data_venda) else str(data_venda)
-
-        cur.execute('INSERT OR REPLACE INTO orders (order_id, data_venda, estado, descricao_status, total_brl, receita_produtos_brl, receita_envio_brl, tarifa_venda_impostos_brl, tarifas_envio_brl, cancelamentos_reembolsos_brl, dinheiro_liberado, resultado, motivo_resultado, mes_faturamento, source_file, _valor_passivel_extorno, _valor_pendente) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', (
-            order_id,
-            data_venda_val,
-            r.get('estado'),
-            r.get('descricao_do_status'),
-            r.get('total_brl'),
-            r.get('receita_por_produtos_brl'),
-            r.get('receita_por_envio_brl'),
-            r.get('tarifa_venda_impostos_brl'),
-            r.get('tarifas_envio_brl'),
-            r.get('cancelamentos_reembolsos_brl'),
-            r.get('dinheiro_liberado'),
-            r.get('resultado'),
-            r.get('motivo_resultado'),
-            r.get('mes_de_faturamento_das_suas_tarifas'),
-            r.get('_source_file'),
-            r.get('_valor_passivel_extorno'),
-            r.get('_valor_pendente')
-        ))
-
-        # items
-        sku = r.get('sku')
-        anuncio = r.get('anuncio_id') if 'anuncio_id' in r else r.get('# de anúncio')
-        titulo = r.get('titulo_do_anuncio')
-        variacao = r.get('variacao')
-        preco = r.get('preco_unitario_brl') if 'preco_unitario_brl' in r else 0.0
-        def parse_unidades(val):
-            try:
-                if pd.isna(val):
-                    return 1
-                s = str(val).strip()
-                if s == '':
-                    return 1
-                return int(float(s))
-            except Exception:
-                return 1
-        unidades = parse_unidades(r.get('unidades') if r.get('unidades') not in (None, '') else (r.get('unidades.1') if 'unidades.1' in r else 1))
-        cur.execute('INSERT INTO order_items (order_id, sku, anuncio_id, titulo, variacao, preco_unitario, unidades) VALUES (?,?,?,?,?,?,?)', (order_id, sku, anuncio, titulo, variacao, preco, unidades))
-
-        # shipments (principal)
-        dac = r.get('data_a_caminho')
-        dde = r.get('data_de_entrega')
-        if hasattr(dac, 'isoformat'):
-            dac_v = dac.isoformat()
-        else:
-            dac_v = None if pd.isna(dac) else str(dac)
-        if hasattr(dde, 'isoformat'):
-            dde_v = dde.isoformat()
-        else:
-            dde_v = None if pd.isna(dde) else str(dde)
-
-        cur.execute('INSERT INTO shipments (order_id, forma_de_entrega, data_a_caminho, data_de_entrega, motorista, numero_de_rastreamento, url_acompanhamento) VALUES (?,?,?,?,?,?,?)', (
-            order_id,
-            r.get('forma_de_entrega'),
-            dac_v,
-            dde_v,
-            r.get('motorista'),
-            r.get('numero_de_rastreamento'),
-            r.get('url_acompanhamento')
-        ))
-
-        # returns
-        ddr = r.get('data_de_revisao')
-        if hasattr(ddr, 'isoformat'):
-            ddr_v = ddr.isoformat()
-        else:
-            ddr_v = None if pd.isna(ddr) else str(ddr)
-
-        cur.execute('INSERT INTO returns (order_id, revisado_pelo_mercado_livre, data_de_revisao, dinheiro_liberado, resultado, destino, motivo_resultado) VALUES (?,?,?,?,?,?,?)', (
-            order_id,
-            r.get('revisado_pelo_mercado_livre'),
-            ddr_v,
-            r.get('dinheiro_liberado'),
-            r.get('resultado'),
-            r.get('destino'),
-            r.get('motivo_resultado')
-        ))
-
-        # complaints
-        cur.execute('INSERT INTO complaints (order_id, unidades, reclamacao_aberta, reclamacao_encerrada, em_mediacao) VALUES (?,?,?,?,?)', (
-            order_id,
-            r.get('unidades.2') if 'unidades.2' in r else r.get('unidades'),
-            r.get('reclamacao_aberta'),
-            r.get('reclamacao_encerrada'),
-            r.get('em_mediacao')
-        ))
-
-        # fees: gravar linhas se existirem valores não-zero
-        for fee_name in ['tarifa_venda_impostos_brl', 'tarifas_envio_brl', 'cancelamentos_reembolsos_brl']:
-            if fee_name in r and r.get(fee_name) not in (None, 0, 0.0, '0'):
-                cur.execute('INSERT INTO fees (order_id, fee_type, amount) VALUES (?,?,?)', (order_id, fee_name, r.get(fee_name)))
 
-    con.commit()
+def changed_files(con, snapshot):
+    """Arquivos importados, reimportados ou removidos pelo ETL desde a última
+    normalização; None se não dá para normalizar de forma incremental."""
+    if not snapshot or not schema_current(con) or not table_exists(con, 'normalize_state'):
+        return None
+    state = {r[0]: (r[1], r[2]) for r in con.execute('SELECT file_path, content_hash, run_id FROM normalize_state')}
+    if not state:
+        return None
+    changed = {f for f, v in snapshot.items() if state.get(f) != v} | (set(state) - set(snapshot))
+    if changed >= set(snapshot):
+        return None  # ETL --full/--rebuild-from-staging: tudo mudou
+    return changed
+
+
+def save_state(cur, snapshot):
+    cur.execute('DELETE FROM normalize_state')
+    cur.executemany('INSERT INTO normalize_state (file_path, content_hash, run_id) VALUES (?,?,?)',
+                    [(f, h, r) for f, (h, r) in snapshot.items()])
+
+
+def normalize_changed(cur, cols, changed):
+    """Apaga e reinsere só as vendas dos arquivos em `changed` (dentro da
+    transação de quem chama) e recalcula os agregados dos meses afetados."""
+    # vendas atingidas: as que estavam nos arquivos alterados e as que estão neles agora
+    cur.execute('CREATE TEMP TABLE _changed_orders (order_id TEXT PRIMARY KEY)')
+    marks = ','.join('?' * len(changed))
+    cur.execute(f'INSERT OR IGNORE INTO _changed_orders SELECT order_id FROM orders WHERE source_file IN ({marks})', list(changed))
+    if '_source_file' in cols and KEY_COL in cols:
+        cur.execute(f'INSERT OR IGNORE INTO _changed_orders SELECT "{KEY_COL}" FROM devolucoes_clean '
+                    f'WHERE "_source_file" IN ({marks}) AND "{KEY_COL}" IS NOT NULL', list(changed))
+    # meses cujos agregados mudam: os das vendas antes e depois
+    changed_months = 'SELECT DISTINCT ano_mes FROM orders WHERE order_id IN (SELECT order_id FROM _changed_orders)'
+    cur.execute(f'CREATE TEMP TABLE _changed_months AS {changed_months}')
+    for t in CHILD_TABLES:
+        cur.execute(f'DELETE FROM {t} WHERE order_id IN (SELECT order_id FROM _changed_orders)')
+    scope = f'd."{KEY_COL}" IN (SELECT order_id FROM _changed_orders)'
+    for stmt in insert_statements(cols, scope):
+        cur.execute(stmt)
+    cur.execute(f'INSERT INTO _changed_months {changed_months}')
+    refresh_summary(cur, '{col} IN (SELECT ano_mes FROM _changed_months)')
+    if cur.execute('SELECT 1 FROM _changed_months WHERE ano_mes IS NULL').fetchone():
+        refresh_summary(cur, '{col} IS NULL')
+    cur.execute('DROP TABLE _changed_months')
+    # compradores que não aparecem mais em nenhuma venda
+    if 'comprador' in cols and 'cpf' in cols:
+        cur.execute('CREATE TEMP TABLE _pairs AS SELECT DISTINCT comprador, cpf FROM devolucoes_clean')
+        cur.execute('CREATE INDEX _ix_pairs ON _pairs (comprador, cpf)')
+        cur.execute('DELETE FROM buyers WHERE NOT EXISTS (SELECT 1 FROM _pairs p '
+                    'WHERE p.comprador IS buyers.comprador AND p.cpf IS buyers.cpf)')
+        cur.execute('DROP TABLE _pairs')
+    n = cur.execute('SELECT count(*) FROM _changed_orders').fetchone()[0]
+    cur.execute('DROP TABLE _changed_orders')
+    print(f'Incremental: {len(changed)} arquivo(s), {n} venda(s) renormalizada(s)')
+
+
+def normalize(db_path=DB, out_dir=OUT_DIR, reports=True, full=False):
+    """Atualiza as tabelas normalizadas a partir de devolucoes_clean, com
+    INSERT ... SELECT dentro do SQLite, com o banco em WAL.
+
+    Incremental por padrão: só as vendas dos arquivos que o ETL (re)importou
+    desde a última execução (manifesto) têm as linhas apagadas e
+    reinseridas, em uma única transação. Sem manifesto, na primeira execução
+    ou com full=True, as tabelas são remontadas em tabelas-sombra e trocadas
+    por RENAME (build_shadow/swap_shadow). `actions` (ações registradas pelo
+    app) nunca é apagada. Com reports=False não gera as planilhas top 50/100 (uso pelo
+    watch_ingest.py)."""
+    db_path = Path(db_path)
+    if not db_path.exists():
+        print('Banco não encontrado:', db_path)
+        return
 
-    # criar view financeira
-    cur.executescript('''
-    CREATE VIEW view_orders_financials AS
-    SELECT
-      o.order_id,
-      o.data_venda,
-      o.total_brl,
-      o.receita_produtos_brl,
-      o.receita_envio_brl,
-      o.tarifa_venda_impostos_brl,
-      o.tarifas_envio_brl,
-      o.cancelamentos_reembolsos_brl,
-      o.dinheiro_liberado,
-      o._valor_passivel_extorno,
-      o._valor_pendente
-    FROM orders o;
-    ''')
-    con.commit()
+    con = sqlite3.connect(str(db_path))
+    upgraded = upgrade_clean_table(con)
+    print('Linhas originais:', con.execute('select count(*) from devolucoes_clean').fetchone()[0])
+    cols = {r[1] for r in con.execute('PRAGMA table_info(devolucoes_clean)')}
+    snapshot = manifest_snapshot(con)
+    changed = None if full or upgraded or KEY_COL not in cols else changed_files(con, snapshot)
+    bulk_pragmas(con)
+
+    if changed is None:
+        build_shadow(con, cols)
+        swap_shadow(con, snapshot)
+    else:
+        cur = con.cursor()
+        cur.execute('BEGIN')
+        try:
+            if changed:
+                normalize_changed(cur, cols, changed)
+            else:
+                print('Nada mudou desde a última normalização')
+            run_script(cur, INDEX_SQL.format(g=index_generation(con), s=''))
+            save_state(cur, snapshot)
+        except Exception:
+            con.rollback()
+            con.close()
+            raise
+        con.commit()
+    if changed != set():
+        # estatísticas para o planejador escolher os índices
+        con.execute('ANALYZE')
+        # o app descarta o cache mesmo quando o manifesto não mudou (--full)
+        bump_load_version(con)
+        con.commit()
+
+    if not reports:
+        print('Normalização concluída:', db_path)
+        con.close()
+        return
 
     # relatório top50 pendências por SKU
-    q = '''SELECT oi.sku, sum(o._valor_pendente) as prejuizo, count(*) as vendas
-           FROM orders o JOIN order_items oi ON o.order_id = oi.order_id
-           WHERE o._valor_pendente > 0
-           GROUP BY oi.sku
+    q = '''SELECT sku, sum(valor_pendente) as prejuizo, sum(linhas_pendentes) as vendas
+           FROM summary_day_sku_motivo
+           WHERE linhas_pendentes > 0
+           GROUP BY sku
            ORDER BY prejuizo DESC
            LIMIT 50'''
     top50 = pd.read_sql(q, con)
-    top50.to_excel(OUT_DIR / '50_mais_pendentes.xlsx', index=False)
+    top50.to_excel(out_dir / '50_mais_pendentes.xlsx', index=False)
 
     # relatório detalhado top 50 ordens (ordenado)
     q2 = '''SELECT o.order_id, o.data_venda, oi.sku, oi.preco_unitario, oi.unidades, o._valor_passivel_extorno, o._valor_pendente, o.dinheiro_liberado, o.total_brl, o.resultado
@@ -324,10 +583,19 @@ def main():
             ORDER BY o._valor_pendente DESC
             LIMIT 100'''
     det = pd.read_sql(q2, con)
-    det.to_excel(OUT_DIR / '100_mais_pendentes_detalhado.xlsx', index=False)
+    det.to_excel(out_dir / '100_mais_pendentes_detalhado.xlsx', index=False)
 
-    print('Migração concluída. Tabelas criadas e relatórios gerados em', OUT_DIR)
+    print('Migração concluída. Tabelas criadas e relatórios gerados em', out_dir)
     con.close()
 
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=str(DB))
+    parser.add_argument('--full', action='store_true', help='recria todas as tabelas normalizadas (ignora o estado incremental)')
+    parser.add_argument('--no-reports', action='store_true', help='não gera as planilhas top 50/100')
+    args = parser.parse_args()
+    normalize(args.db, reports=not args.no_reports, full=args.full)
+
+
 if __name__ == '__main__':
     main()
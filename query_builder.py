@@ -0,0 +1,103 @@
+"""Filtros SQL parametrizados e que aproveitam os índices (Where).
+
+Valores colados no texto do SQL geram um comando diferente para cada
+combinação de filtros (o cache de comandos do sqlite3 não reaproveita
+nada), e expressões como substr(data_venda,1,7) = '...' não usam índice.
+Aqui todo valor vai como parâmetro e:
+
+- meses e dias viram faixas semiabertas na coluna de data
+  (`col >= ? AND col < ?`), que usam o índice em data_venda e valem para
+  texto ISO com ou sem hora ('2025-03-01', '2025-03-01T10:00:00');
+- SKU tem três modos (SKU_MODES), todos sem diferenciar maiúsculas e com
+  % e _ literais: 'contains' (LIKE '%x%', sem índice possível), 'prefix'
+  (LIKE 'x%', que o SQLite resolve como faixa no índice sku COLLATE
+  NOCASE) e 'exact' (= ? COLLATE NOCASE);
+- listas (motivos) vão num único parâmetro JSON, `IN (SELECT value FROM
+  json_each(?))`: o texto do comando não muda com a quantidade de valores.
+
+Usado pelo load_financials do app, pelo reports.py e pelo
+compare_ml_metrics.py.
+"""
+import json
+from datetime import date, timedelta
+
+SKU_MODES = ('contains', 'prefix', 'exact')
+
+
+def like_escape(text):
+    """Texto para LIKE com ESCAPE '\\' casando % e _ literalmente."""
+    return str(text).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def month_start(month):
+    """'AAAA-MM' -> 'AAAA-MM-01'."""
+    year, mon = (int(p) for p in str(month)[:7].split('-'))
+    return date(year, mon, 1).isoformat()
+
+
+def next_month_start(month):
+    """'AAAA-MM' -> primeiro dia do mês seguinte."""
+    year, mon = (int(p) for p in str(month)[:7].split('-'))
+    return date(year + mon // 12, mon % 12 + 1, 1).isoformat()
+
+
+def day(value):
+    """Data (date, datetime, Timestamp ou texto ISO) -> 'AAAA-MM-DD'."""
+    if hasattr(value, 'date') and callable(value.date):
+        value = value.date()
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value).strip()[:10]).isoformat()
+
+
+class Where:
+    """Condições com parâmetros; `sql` é ' WHERE ...' (ou '') e `params` a
+    lista na mesma ordem. Os métodos devolvem o próprio Where e ignoram
+    filtros vazios (None, '' ou lista vazia)."""
+
+    def __init__(self):
+        self.clauses = []
+        self.params = []
+
+    def add(self, clause, *params):
+        self.clauses.append(clause)
+        self.params.extend(params)
+        return self
+
+    def month_range(self, col, month_from=None, month_to=None):
+        """Vendas de month_from a month_to ('AAAA-MM', inclusive) em `col`."""
+        if month_from:
+            self.add(f'{col} >= ?', month_start(month_from))
+        if month_to:
+            self.add(f'{col} < ?', next_month_start(month_to))
+        return self
+
+    def date_range(self, col, date_from=None, date_to=None):
+        """Vendas de date_from a date_to (inclusive, o dia inteiro) em `col`."""
+        if date_from is not None:
+            self.add(f'{col} >= ?', day(date_from))
+        if date_to is not None:
+            end = date.fromisoformat(day(date_to)) + timedelta(days=1)
+            self.add(f'{col} < ?', end.isoformat())
+        return self
+
+    def sku(self, col, text, mode='contains'):
+        if text is None or str(text) == '':
+            return self
+        if mode == 'exact':
+            return self.add(f'{col} = ? COLLATE NOCASE', str(text))
+        if mode == 'prefix':
+            return self.add(f"{col} LIKE ? ESCAPE '\\'", like_escape(text) + '%')
+        if mode == 'contains':
+            return self.add(f"{col} LIKE ? ESCAPE '\\'", '%' + like_escape(text) + '%')
+        raise ValueError(f'modo de busca de SKU inválido: {mode!r} (use {", ".join(SKU_MODES)})')
+
+    def one_of(self, col, values):
+        if values:
+            self.add(f'{col} IN (SELECT value FROM json_each(?))',
+                     json.dumps([str(v) for v in values], ensure_ascii=False))
+        return self
+
+    @property
+    def sql(self):
+        return ' WHERE ' + ' AND '.join(self.clauses) if self.clauses else ''
@@ -0,0 +1,91 @@
+"""Regra do valor "passível de extorno" e do prejuízo pendente.
+
+Um único lugar para a heurística usada pelo reports.py, pelo
+migrate_normalize_db.py (dentro do SQLite) e pelo load_financials do app:
+
+- _valor_passivel_extorno: soma dos valores negativos (em módulo) das
+  colunas de RECLAIM_COLS;
+- _valor_pendente: passível de extorno menos o dinheiro já liberado, nunca
+  negativo;
+- prejuizo_*: a partir do total da venda (total_brl), como o app mostra.
+
+Cada regra tem a versão vetorizada (pandas/NumPy) e a versão em expressão
+SQL, com os mesmos resultados.
+"""
+import numpy as np
+import pandas as pd
+
+RECLAIM_COLS = [
+    'cancelamentos_reembolsos_brl',
+    'tarifas_envio_brl',
+    'tarifa_venda_impostos_brl'
+]
+
+
+def _numeric(df, col):
+    """Coluna como float64 (ausente, texto inválido e NaN viram 0.0)."""
+    if col not in df.columns:
+        return np.zeros(len(df))
+    s = df[col]
+    if not pd.api.types.is_float_dtype(s):
+        s = pd.to_numeric(s, errors='coerce')
+    return np.nan_to_num(s.to_numpy(dtype='float64', na_value=np.nan))
+
+
+def passivel_extorno(df, cols=None):
+    """Soma de -min(valor, 0) nas colunas `cols` (padrão RECLAIM_COLS)."""
+    cols = RECLAIM_COLS if cols is None else cols
+    total = np.zeros(len(df))
+    for c in cols:
+        total += np.clip(-_numeric(df, c), 0.0, None)
+    return pd.Series(total, index=df.index)
+
+
+def compute_reclaim(df, cols=None):
+    """Acrescenta _valor_passivel_extorno e _valor_pendente ao `df`."""
+    df['_valor_passivel_extorno'] = passivel_extorno(df, cols)
+    liberado = _numeric(df, 'dinheiro_liberado')
+    df['dinheiro_liberado'] = liberado
+    df['_valor_pendente'] = np.clip(df['_valor_passivel_extorno'].to_numpy() - liberado, 0.0, None)
+    return df
+
+
+def compute_prejuizo(df, total_col='total_brl'):
+    """Acrescenta as colunas prejuizo_* a partir do total da venda:
+
+    - prejuizo_real_signed: o próprio total (negativo quando houve prejuízo)
+    - prejuizo_real: módulo do prejuízo (0 quando o total não é negativo)
+    - prejuizo_pendente_calc: prejuízo ainda não coberto pelo dinheiro liberado (>= 0)
+    - prejuizo_pendente_signed: o mesmo com sinal negativo
+    """
+    total = _numeric(df, total_col)
+    liberado = _numeric(df, 'dinheiro_liberado')
+    df['prejuizo_real_signed'] = total
+    df['prejuizo_real'] = np.clip(-total, 0.0, None)
+    df['prejuizo_pendente_calc'] = np.clip(df['prejuizo_real'].to_numpy() - liberado, 0.0, None)
+    df['prejuizo_pendente_signed'] = -df['prejuizo_pendente_calc']
+    return df
+
+
+def _sql_num(col):
+    return f'COALESCE("{col}", 0.0)'
+
+
+def passivel_extorno_sql(cols=None, ref=_sql_num):
+    """Expressão SQL de _valor_passivel_extorno. `ref(coluna)` devolve a
+    expressão de cada valor (padrão: COALESCE("coluna", 0.0))."""
+    cols = RECLAIM_COLS if cols is None else cols
+    if not cols:
+        return '0.0'
+    return ' + '.join(f'MAX(-{ref(c)}, 0.0)' for c in cols)
+
+
+def pendente_sql(cols=None, ref=_sql_num):
+    """Expressão SQL de _valor_pendente."""
+    return f"MAX(({passivel_extorno_sql(cols, ref)}) - {ref('dinheiro_liberado')}, 0.0)"
+
+
+def prejuizo_pendente_sql(total, liberado):
+    """Expressão SQL de prejuizo_pendente_calc; `total` e `liberado` são
+    expressões SQL (sem NULL)."""
+    return f'MAX(MAX(-{total}, 0.0) - {liberado}, 0.0)'
@@ -4,6 +4,9 @@ import pandas as pd
 import csv
 import sys
 
+from etl_to_sqlite import (ensure_sniff_cache, file_hash, limpar_valor_series,
+                           load_sniff_cache, save_sniffs, sniff_file)
+
 ML_CSV = Path(r"C:\Users\Pichau\Downloads\Planilha sem título - Negócio.csv")
 DB = Path(r"c:\Users\Pichau\analise_progress\ml_devolucoes.db")
 OUT = Path("reports")
@@ -17,42 +20,45 @@ if not DB.exists():
     print(f"Database not found at {DB}")
     sys.exit(1)
 
+def is_data_header(line):
+    # header row of the ML aggregates export starts with a 'Data' column
+    return line.strip().startswith('Data,') or line.strip().split(',')[0].strip() == 'Data'
+
 def find_header_row(path):
-    # find the row index where header starts (first column 'Data' expected)
-    with path.open('r', encoding='utf-8', errors='ignore') as f:
-        for i, line in enumerate(f):
-            if line.strip().startswith('Data,') or line.strip().split(',')[0].strip() == 'Data':
-                return i
-    return None
-
-hdr_row = find_header_row(ML_CSV)
+    # single read of the first bytes via the ETL sniffer; the result is cached
+    # in the DB (etl_sniff_cache) by content hash so re-runs skip the sniff
+    digest = file_hash(path)
+    con = sqlite3.connect(str(DB))
+    try:
+        ensure_sniff_cache(con)
+        sniff = load_sniff_cache(con, rule='data').get(digest)
+        if sniff is None:
+            sniff = sniff_file(path, is_header=is_data_header, nbytes=1 << 20, max_lines=None)
+            if sniff.header_row is not None:
+                save_sniffs(con, [(digest, sniff)], rule='data')
+                con.commit()
+    finally:
+        con.close()
+    return sniff
+
+sniff = find_header_row(ML_CSV)
+hdr_row = sniff.header_row
 if hdr_row is None:
     print('Could not find header row in ML CSV; open the file and confirm it contains the expected header starting with "Data"')
     sys.exit(1)
 
 # read with pandas using located header row
-df_ml = pd.read_csv(ML_CSV, header=hdr_row, skip_blank_lines=True, encoding='utf-8', dtype=str)
-
-def to_number(s):
-    if pd.isna(s):
-        return 0.0
-    s = str(s).strip()
-    if s == '':
-        return 0.0
-    # remove percent
-    if s.endswith('%'):
-        try:
-            return float(s.replace('%','').replace(',','.'))/100.0
-        except:
-            return 0.0
-    # normalize thousands/decimals: assume pt-BR style '.' thousands and ',' decimals
-    s2 = s.replace('.', '').replace(',', '.')
-    # remove currency R$
-    s2 = s2.replace('R$', '').replace('\xa0','').strip()
-    try:
-        return float(s2)
-    except:
-        return 0.0
+df_ml = pd.read_csv(ML_CSV, skiprows=hdr_row, header=0, skip_blank_lines=True, encoding=sniff.encoding, sep=sniff.delimiter, dtype=str)
+
+def to_number(col):
+    # pt-BR money ('.' thousands, ',' decimals, R$) via the vectorized ETL
+    # parser; percentages become fractions
+    s = col.str.replace('\xa0', '', regex=False).str.strip()
+    pct = s.str.endswith('%').fillna(False)
+    out = limpar_valor_series(s.where(~pct))
+    if pct.any():
+        out[pct] = pd.to_numeric(s[pct].str.replace('%', '', regex=False).str.replace(',', '.', regex=False), errors='coerce').fillna(0.0) / 100.0
+    return out
 
 # relevant ML columns (as in the provided CSV)
 ml_cols_map = {
@@ -68,7 +74,7 @@ ml_cols_map = {
 ml_aggr = {}
 for k, col in ml_cols_map.items():
     if col in df_ml.columns:
-        ml_aggr[k] = df_ml[col].apply(to_number).sum()
+        ml_aggr[k] = to_number(df_ml[col]).sum()
     else:
         ml_aggr[k] = 0.0
 
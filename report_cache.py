@@ -0,0 +1,118 @@
+"""Cache de relatórios/exports já gerados, por versão do banco e parâmetros.
+
+A chave junta a impressão digital do banco (db_fingerprint) com os
+parâmetros normalizados do relatório; se nada mudou no banco, o mesmo
+pedido devolve uma cópia dos arquivos gravados da última vez em vez de
+refazer consulta e planilha. Usado pelo reports.py e pelos botões de
+export do app.
+
+Cada entrada é uma pasta em `report_cache/` (ao lado do banco) com os
+arquivos e um meta.json; o mtime do meta.json marca o último uso. Quando
+o total passa de REPORT_CACHE_MAX_MB (variável de ambiente, padrão 512),
+as entradas usadas há mais tempo são apagadas.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+# muda quando o formato dos relatórios muda, invalidando o que está em cache
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = int(float(os.environ.get('REPORT_CACHE_MAX_MB', '512')) * 1024 ** 2)
+META = 'meta.json'
+
+
+def default_dir(db_path):
+    return Path(db_path).resolve().parent / 'report_cache'
+
+
+def db_fingerprint(db_path):
+    """(tamanho, mtime) do banco e do -wal mais o contador de alterações do
+    cabeçalho do SQLite. PRAGMA data_version não serve aqui: só compara
+    versões dentro de uma mesma conexão."""
+    db_path = Path(db_path)
+    parts = []
+    for p in (db_path, Path(str(db_path) + '-wal')):
+        try:
+            st = p.stat()
+            parts.append([st.st_size, st.st_mtime_ns])
+        except OSError:
+            parts.append(None)
+    try:
+        with open(db_path, 'rb') as f:
+            header = f.read(100)
+        parts.append(int.from_bytes(header[24:28], 'big') if len(header) == 100 else None)
+    except OSError:
+        parts.append(None)
+    return parts
+
+
+def cache_key(db_path, kind, params):
+    """Chave da entrada: banco (caminho + impressão digital), tipo do
+    relatório e parâmetros (dict serializável em JSON)."""
+    payload = json.dumps([CACHE_VERSION, str(Path(db_path).resolve()), db_fingerprint(db_path), kind, params],
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def fetch(cache_dir, key, targets):
+    """Copia os arquivos da entrada `key` para `targets` (mesma ordem do
+    store). Devolve False se não há entrada."""
+    entry = Path(cache_dir) / key
+    try:
+        with open(entry / META, 'r', encoding='utf-8') as f:
+            names = json.load(f)['files']
+        if len(names) != len(targets):
+            return False
+        for name, target in zip(names, targets):
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(entry / name, target)
+        os.utime(entry / META)
+    except (OSError, ValueError, KeyError):
+        # entrada incompleta ou apagada por outro processo: trata como miss
+        return False
+    return True
+
+
+def store(cache_dir, key, files, params=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Guarda cópias de `files` na entrada `key` e aplica o limite de bytes."""
+    cache_dir = Path(cache_dir)
+    entry = cache_dir / key
+    tmp = cache_dir / f'{key}.tmp-{os.getpid()}'
+    try:
+        tmp.mkdir(parents=True, exist_ok=True)
+        names = []
+        for i, src in enumerate(files):
+            name = f'{i}{Path(src).suffix}'
+            shutil.copyfile(src, tmp / name)
+            names.append(name)
+        with open(tmp / META, 'w', encoding='utf-8') as f:
+            json.dump({'files': names, 'params': params}, f, ensure_ascii=False, default=str)
+        os.rename(tmp, entry)
+    except OSError:
+        # outro processo gravou a mesma entrada antes (ou disco cheio)
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    evict(cache_dir, max_bytes)
+
+
+def entry_size(entry):
+    return sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """Apaga as entradas usadas há mais tempo até o total caber em max_bytes."""
+    entries = []
+    for entry in Path(cache_dir).iterdir():
+        try:
+            if entry.is_dir() and (entry / META).exists():
+                entries.append(((entry / META).stat().st_mtime_ns, entry_size(entry), entry))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
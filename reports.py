@@ -11,27 +11,39 @@ Uso:
 Opções úteis:
   --date-from YYYY-MM-DD --date-to YYYY-MM-DD  (filtrar por data de venda)
   --sku SKU                                     (filtrar por SKU)
+  --sku-mode contains|prefix|exact              (como casar o SKU; padrão contains)
   --only-pending                                 (apenas casos com valor pendente)
   --top N                                        (no resumo por SKU, mostrar top N)
+  --columns c1,c2,...                            (colunas da aba detalhes)
+  --batch spec.json [--workers N]                (vários recortes numa execução)
+  --no-cache                                     (não reaproveita relatório de report_cache/)
+
+Os filtros são aplicados no SQLite (build_query, com query_builder.Where):
+só as linhas e colunas pedidas saem do banco.
 
 Observação: a definição de "valor passível de extorno" é uma heurística
 inicial que soma os valores negativos em um conjunto de colunas (por ex.:
 cancelamentos, tarifas de envio, tarifa de venda). Ajuste `RECLAIM_COLS`
-se necessário e reexecute.
+em reclaim.py se necessário e reexecute.
 """
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
 from pathlib import Path
 import sqlite3
 import pandas as pd
 import datetime
 
+import reclaim
+import report_cache
+from etl_to_sqlite import DATE_COL, KEY_COL, MANIFEST_TABLE, read_iso_dates, schema_outdated, table_exists
+from query_builder import SKU_MODES, Where
+from reclaim import RECLAIM_COLS, pendente_sql
+from xlsx_export import write_xlsx
 
-RECLAIM_COLS = [
-    'cancelamentos_reembolsos_brl',
-    'tarifas_envio_brl',
-    'tarifa_venda_impostos_brl'
-]
+# chaves aceitas em cada recorte do --batch
+BATCH_KEYS = ['name', 'date_from', 'date_to', 'sku', 'sku_mode', 'only_pending', 'top']
 
 
 def load_table(db_path: str):
@@ -44,54 +56,98 @@ def load_table(db_path: str):
 def to_numeric_cols(df, cols):
     for c in cols:
         if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0)
+            if not pd.api.types.is_float_dtype(df[c]):
+                df[c] = pd.to_numeric(df[c], errors='coerce')
+            df[c] = df[c].fillna(0.0)
     return df
 
 
 def compute_reclaim(df):
     # garante colunas numéricas
     df = to_numeric_cols(df, RECLAIM_COLS + ['total_(brl)', 'dinheiro_liberado'])
-
-    # valor passível de extorno = soma dos valores negativos dessas colunas (convertidos para positivo)
-    def row_reclaim(r):
-        s = 0.0
-        for c in RECLAIM_COLS:
-            if c in r.index and pd.notna(r[c]):
-                val = float(r[c])
-                if val < 0:
-                    s += -val
-        return s
-
-    df['_valor_passivel_extorno'] = df.apply(row_reclaim, axis=1)
-
-    # dinheiro_liberado (o que já foi liberado para o vendedor) usado como proxy de reembolso
-    if 'dinheiro_liberado' in df.columns:
-        df['dinheiro_liberado'] = pd.to_numeric(df['dinheiro_liberado'], errors='coerce').fillna(0.0)
+    # _valor_passivel_extorno e _valor_pendente (regra em reclaim.py)
+    return reclaim.compute_reclaim(df, RECLAIM_COLS)
+
+
+def build_query(con, date_from=None, date_to=None, sku=None, only_pending=False, columns=None, sku_mode='contains'):
+    """SELECT parametrizado em devolucoes_clean com os filtros de período,
+    SKU e pendência aplicados no SQLite (período usa o índice de data_venda).
+
+    `columns` limita as colunas lidas às pedidas mais as necessárias para o
+    cálculo de extorno/pendente, os filtros e os resumos (a projeção final
+    fica para a aba detalhes); None lê todas. Devolve (sql, params)."""
+    available = [r[1] for r in con.execute('PRAGMA table_info(devolucoes_clean)')]
+    date_col = 'data_da_venda' if 'data_da_venda' in available else DATE_COL
+    if columns:
+        needed = list(columns) + [KEY_COL, date_col, 'sku'] + RECLAIM_COLS + ['dinheiro_liberado']
+        select = ', '.join(f'"{c}"' for c in dict.fromkeys(needed) if c in available)
     else:
-        df['dinheiro_liberado'] = 0.0
+        select = '*'
+    where = Where()
+    if date_col in available:
+        # date_to inclui o dia inteiro (datas gravadas com hora)
+        where.date_range(f'"{date_col}"', date_from, date_to)
+    if 'sku' in available:
+        where.sku('"sku"', sku, sku_mode)
+    if only_pending:
+        def ref(c):
+            return f'COALESCE("{c}", 0.0)' if c in available else '0.0'
+        where.add(f'{pendente_sql(RECLAIM_COLS, ref)} > 0')
+    # mesma ordem da tabela, como no relatório lido inteiro
+    return f'SELECT {select} FROM devolucoes_clean{where.sql} ORDER BY rowid', where.params
 
-    # pendente = valor_passivel - dinheiro_liberado (se positivo)
-    df['_valor_pendente'] = (df['_valor_passivel_extorno'] - df['dinheiro_liberado']).clip(lower=0.0)
 
+def load_filtered(db_path, date_from=None, date_to=None, sku=None, only_pending=False, columns=None, sku_mode='contains'):
+    """Só as linhas e colunas do relatório. Bancos de antes do esquema tipado
+    (datas dd/mm/aaaa em texto) ainda são filtrados em pandas."""
+    con = sqlite3.connect(db_path)
+    try:
+        if schema_outdated(con):
+            df = pd.read_sql('select * from devolucoes_clean', con)
+            df = filter_df(compute_reclaim(df), date_from, date_to, sku, sku_mode)
+            return df[df['_valor_pendente'] > 0] if only_pending else df
+        sql, params = build_query(con, date_from, date_to, sku, only_pending, columns, sku_mode)
+        df = compute_reclaim(pd.read_sql(sql, con, params=params))
+    finally:
+        con.close()
+    # com filtro de período a coluna de data sai como data, como em filter_df
+    date_col = 'data_da_venda' if 'data_da_venda' in df.columns else DATE_COL
+    if date_col in df.columns and (date_from is not None or date_to is not None):
+        df[date_col] = read_iso_dates(df[date_col])
     return df
 
 
-def filter_df(df, date_from=None, date_to=None, sku=None):
-    # filtra por data de venda se a coluna existir
-    if date_from is not None and 'data_da_venda' in df.columns:
-        df['data_da_venda'] = pd.to_datetime(df['data_da_venda'], dayfirst=True, errors='coerce')
-        df = df[df['data_da_venda'] >= pd.to_datetime(date_from)]
-    if date_to is not None and 'data_da_venda' in df.columns:
-        df = df[df['data_da_venda'] <= pd.to_datetime(date_to)]
-    if sku is not None and 'sku' in df.columns:
-        df = df[df['sku'].astype(str).str.contains(sku, na=False)]
+def filter_df(df, date_from=None, date_to=None, sku=None, sku_mode='contains'):
+    # filtra por data de venda se a coluna existir (data_venda com o columns_map.json)
+    date_col = 'data_da_venda' if 'data_da_venda' in df.columns else 'data_venda'
+    if date_col in df.columns and (date_from is not None or date_to is not None):
+        if not pd.api.types.is_datetime64_any_dtype(df[date_col]):
+            df[date_col] = read_iso_dates(df[date_col])
+    if date_from is not None and date_col in df.columns:
+        df = df[df[date_col] >= pd.to_datetime(date_from)]
+    if date_to is not None and date_col in df.columns:
+        # date_to inclui o dia inteiro
+        df = df[df[date_col] < pd.to_datetime(date_to) + pd.Timedelta(days=1)]
+    if sku is not None and sku != '' and 'sku' in df.columns:
+        # como Where.sku de build_query: texto literal, sem diferenciar maiúsculas
+        skus = df['sku'].astype(str).str.lower()
+        text = str(sku).lower()
+        if sku_mode == 'exact':
+            match = skus == text
+        elif sku_mode == 'prefix':
+            match = skus.str.startswith(text)
+        elif sku_mode == 'contains':
+            match = skus.str.contains(text, regex=False)
+        else:
+            raise ValueError(f'modo de busca de SKU inválido: {sku_mode!r} (use {", ".join(SKU_MODES)})')
+        df = df[match & df['sku'].notna()]
     return df
 
 
 def summary_by_sku(df, top=50):
     if 'sku' not in df.columns:
         return pd.DataFrame()
-    id_col = 'n_de_venda' if 'n_de_venda' in df.columns else df.columns[0]
+    id_col = KEY_COL if KEY_COL in df.columns else df.columns[0]
     total_col = 'total_brl' if 'total_brl' in df.columns else ('total_(brl)' if 'total_(brl)' in df.columns else None)
     agg_map = {
         'vendas_count': (id_col, 'count'),
@@ -107,52 +163,204 @@ def summary_by_month(df):
     if 'data_da_venda' not in df.columns and 'data_venda' not in df.columns:
         return pd.DataFrame()
     date_col = 'data_da_venda' if 'data_da_venda' in df.columns else 'data_venda'
-    # garantir tipo datetime
-    if not pd.api.types.is_datetime64_any_dtype(df[date_col]):
-        df[date_col] = pd.to_datetime(df[date_col], dayfirst=True, errors='coerce')
-    df['mes'] = df[date_col].dt.to_period('M')
-    g = df.groupby('mes').agg(
-        vendas_count=('n.o_de_venda' if 'n.o_de_venda' in df.columns else df.columns[0], 'count'),
+    # garantir tipo datetime (sem alterar o df, que no --batch é compartilhado)
+    mes = read_iso_dates(df[date_col]).dt.to_period('M').rename('mes')
+    id_col = next((c for c in ['n.o_de_venda', KEY_COL] if c in df.columns), df.columns[0])
+    g = df.groupby(mes).agg(
+        vendas_count=(id_col, 'count'),
         total_prejuizo=('_valor_pendente', 'sum')
     )
     return g.reset_index()
 
 
-def generate_reports(db_path, out_path, date_from=None, date_to=None, sku=None, only_pending=False, top=50):
-    df = load_table(db_path)
-    df = compute_reclaim(df)
-    df = filter_df(df, date_from, date_to, sku)
-
-    if only_pending:
-        df_out = df[df['_valor_pendente'] > 0].copy()
+def summary_current(con):
+    """summary_day_sku_motivo corresponde ao devolucoes_clean atual: a última
+    normalização (normalize_state) viu exatamente o manifesto do ETL. Depois
+    de uma carga sem migração a tabela está atrasada."""
+    if not all(table_exists(con, t) for t in ('summary_day_sku_motivo', 'normalize_state', MANIFEST_TABLE)):
+        return False
+    cols = 'file_path, content_hash, run_id'
+    return bool(con.execute(
+        f'SELECT NOT EXISTS (SELECT {cols} FROM {MANIFEST_TABLE} EXCEPT SELECT {cols} FROM normalize_state) '
+        f'AND NOT EXISTS (SELECT {cols} FROM normalize_state EXCEPT SELECT {cols} FROM {MANIFEST_TABLE})').fetchone()[0])
+
+
+def summaries_from_db(db_path, date_from=None, date_to=None, sku=None, only_pending=False, top=50, sku_mode='contains'):
+    """Resumos por SKU e por mês a partir de summary_day_sku_motivo (mantida
+    pelo migrate_normalize_db), sem agrupar as vendas em pandas. Devolve None
+    se o banco não tem a tabela ou ela está atrasada em relação ao ETL
+    (summary_current), para os resumos não contradizerem a aba detalhes.
+    Só considera linhas com n_de_venda."""
+    con = sqlite3.connect(db_path)
+    if not summary_current(con):
+        con.close()
+        return None
+    where = Where().date_range('dia', date_from, date_to).sku('sku', sku, sku_mode)
+    params = where.params
+    # com only_pending só entram as linhas com valor pendente
+    count, total = ('linhas_pendentes', 'receita_pendentes') if only_pending else ('linhas', 'receita')
+    having = ' HAVING SUM(linhas_pendentes) > 0' if only_pending else ''
+    sku_summary = pd.read_sql(
+        f'SELECT sku, SUM({count}) AS vendas_count, SUM(valor_pendente) AS total_prejuizo, SUM({total}) AS total_valor '
+        f'FROM summary_day_sku_motivo{where.sql} GROUP BY sku{having} ORDER BY total_prejuizo DESC LIMIT ?',
+        con, params=params + [top])
+    month_summary = pd.read_sql(
+        f'SELECT ano_mes AS mes, SUM({count}) AS vendas_count, SUM(valor_pendente) AS total_prejuizo '
+        f'FROM summary_day_sku_motivo{where.sql} GROUP BY ano_mes{having} ORDER BY ano_mes',
+        con, params=params)
+    con.close()
+    # mesmo formato de summary_by_month: mês como Period, sem as linhas sem data
+    month_summary = month_summary.dropna(subset=['mes'])
+    month_summary['mes'] = pd.PeriodIndex(month_summary['mes'], freq='M')
+    return sku_summary, month_summary.reset_index(drop=True)
+
+
+def report_sheets(db_path, df_out, date_from=None, date_to=None, sku=None, only_pending=False, top=50, columns=None,
+                  sku_mode='contains'):
+    """Abas do relatório ({nome: DataFrame}) para as linhas já filtradas."""
+    # resumo por SKU e por mês: das tabelas agregadas se existirem
+    summaries = summaries_from_db(db_path, date_from, date_to, sku, only_pending, top, sku_mode)
+    if summaries is not None:
+        sku_summary, month_summary = summaries
     else:
-        df_out = df.copy()
+        sku_summary = summary_by_sku(df_out, top=top)
+        month_summary = summary_by_month(df_out)
+    if columns:
+        extra = ['_valor_passivel_extorno', '_valor_pendente']
+        df_out = df_out[[c for c in dict.fromkeys(list(columns) + extra) if c in df_out.columns]]
 
-    # criar pasta de saída
+    sheets = {'detalhes': df_out}
+    if not sku_summary.empty:
+        sheets['resumo_por_sku'] = sku_summary
+    if not month_summary.empty:
+        sheets['resumo_por_mes'] = month_summary
+    return sheets
+
+
+def pending_csv_path(out_path):
     outp = Path(out_path)
-    outp.parent.mkdir(parents=True, exist_ok=True)
+    return outp.with_name(outp.stem + '_pendentes.csv')
 
-    # resumo por SKU e por mês
-    sku_summary = summary_by_sku(df_out, top=top)
-    month_summary = summary_by_month(df_out)
 
-    # salva Excel com múltiplas abas
-    with pd.ExcelWriter(outp, engine='openpyxl') as w:
-        df_out.to_excel(w, sheet_name='detalhes', index=False)
-        
-        if not sku_summary.empty:
-            sku_summary.to_excel(w, sheet_name='resumo_por_sku', index=False)
-        if not month_summary.empty:
-            month_summary.to_excel(w, sheet_name='resumo_por_mes', index=False)
+def report_params(date_from=None, date_to=None, sku=None, only_pending=False, top=50, columns=None,
+                  sku_mode='contains'):
+    """Parâmetros normalizados (chave do cache): datas em AAAA-MM-DD."""
+    def day(d):
+        return None if d is None else str(pd.to_datetime(d).date())
+    return {'date_from': day(date_from), 'date_to': day(date_to), 'sku': sku, 'sku_mode': sku_mode,
+            'only_pending': bool(only_pending),
+            'top': int(top), 'columns': list(columns) if columns else None}
+
+
+def write_report(out_path, sheets):
+    """Grava a planilha e, ao lado, o CSV com os casos pendentes da aba
+    detalhes. Devolve (planilha, csv). Roda também nos workers do --batch."""
+    outp = Path(out_path)
+    outp.parent.mkdir(parents=True, exist_ok=True)
+    # salva Excel com múltiplas abas (em streaming, memória constante)
+    write_xlsx(outp, sheets)
 
     # salva CSV separado com casos pendentes
-    csv_pending = outp.with_name(outp.stem + '_pendentes.csv')
+    df_out = sheets['detalhes']
+    csv_pending = pending_csv_path(outp)
     df_out[df_out['_valor_pendente'] > 0].to_csv(csv_pending, index=False, encoding='utf-8-sig')
-
+    return outp, csv_pending
+
+
+def generate_reports(db_path, out_path, date_from=None, date_to=None, sku=None, only_pending=False, top=50, columns=None,
+                     use_cache=True, sku_mode='contains'):
+    """Gera a planilha e o CSV de pendentes. Com `use_cache`, se o banco não
+    mudou desde uma execução com os mesmos parâmetros, só copia os arquivos
+    de report_cache/."""
+    targets = [Path(out_path), pending_csv_path(out_path)]
+    if use_cache:
+        params = report_params(date_from, date_to, sku, only_pending, top, columns, sku_mode)
+        key = report_cache.cache_key(db_path, 'reports', params)
+        cache_dir = report_cache.default_dir(db_path)
+        if report_cache.fetch(cache_dir, key, targets):
+            print('Relatório salvo em:', targets[0], '(cache)')
+            print('CSV pendentes salvo em:', targets[1], '(cache)')
+            return
+    df_out = load_filtered(db_path, date_from, date_to, sku, only_pending, columns, sku_mode)
+    sheets = report_sheets(db_path, df_out, date_from, date_to, sku, only_pending, top, columns, sku_mode)
+    outp, csv_pending = write_report(out_path, sheets)
+    if use_cache:
+        report_cache.store(cache_dir, key, [outp, csv_pending], params)
     print('Relatório salvo em:', outp)
     print('CSV pendentes salvo em:', csv_pending)
 
 
+def load_batch_spec(spec_path):
+    """Lê o spec do --batch. Aceita uma lista de recortes ou um objeto:
+
+    {"out_dir": "reports/lote", "top": 50, "columns": ["n_de_venda", ...],
+     "reports": [{"name": "2025-03", "date_from": "2025-03-01", "date_to": "2025-03-31"},
+                 {"name": "sku_ABC", "sku": "ABC", "sku_mode": "prefix", "only_pending": true}]}
+
+    `name` vira o nome do arquivo (padrão relatorio_001, ...)."""
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'reports': spec}
+    reports = []
+    for i, item in enumerate(spec.get('reports', []), start=1):
+        unknown = set(item) - set(BATCH_KEYS)
+        if unknown:
+            raise ValueError(f'recorte {i}: chave(s) desconhecida(s) {sorted(unknown)}')
+        reports.append({**{k: None for k in BATCH_KEYS}, 'only_pending': False, 'sku_mode': 'contains',
+                        **item, 'name': str(item.get('name') or f'relatorio_{i:03d}')})
+    spec['reports'] = reports
+    return spec
+
+
+def run_batch(db_path, spec_path, workers=1):
+    """Gera todos os recortes do spec com uma única leitura do banco.
+
+    A tabela é lida e o extorno/pendente calculado uma vez; cada recorte é
+    filtrado em memória e as planilhas são gravadas em paralelo (pool de
+    processos com `workers`). Ao final grava `indice.xlsx` em out_dir com
+    uma linha por recorte."""
+    spec = load_batch_spec(spec_path)
+    out_dir = Path(spec.get('out_dir') or Path(spec_path).with_suffix(''))
+    top = spec.get('top', 50)
+    columns = spec.get('columns')
+
+    base = load_filtered(db_path, columns=columns)
+    date_col = 'data_da_venda' if 'data_da_venda' in base.columns else DATE_COL
+    if date_col in base.columns:
+        base[date_col] = read_iso_dates(base[date_col])
+
+    index = []
+    paths = []
+    all_sheets = []
+    for item in spec['reports']:
+        df_out = filter_df(base, item['date_from'], item['date_to'], item['sku'], item['sku_mode'])
+        if item['only_pending']:
+            df_out = df_out[df_out['_valor_pendente'] > 0]
+        all_sheets.append(report_sheets(db_path, df_out, item['date_from'], item['date_to'], item['sku'],
+                                        item['only_pending'], top if item['top'] is None else item['top'], columns, item['sku_mode']))
+        paths.append(out_dir / f"{item['name']}.xlsx")
+        index.append({**{k: item[k] for k in BATCH_KEYS if k != 'top'},
+                      'linhas': len(df_out),
+                      'linhas_pendentes': int((df_out['_valor_pendente'] > 0).sum()),
+                      'valor_pendente': float(df_out['_valor_pendente'].sum())})
+
+    # gravar as planilhas é a parte cara (openpyxl, CPU-bound): pool de processos
+    if workers <= 1 or len(paths) <= 1:
+        written = [write_report(p, sh) for p, sh in zip(paths, all_sheets)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as ex:
+            written = list(ex.map(write_report, paths, all_sheets))
+    for row, (outp, csv_pending) in zip(index, written):
+        row['arquivo'] = outp.name
+        row['csv_pendentes'] = csv_pending.name
+
+    index_path = out_dir / 'indice.xlsx'
+    write_xlsx(index_path, {'indice': pd.DataFrame(index)}, money_cols=['valor_pendente'])
+    print(f'{len(index)} relatório(s) em {out_dir}; índice: {index_path}')
+    return index_path
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--db', required=False, default='ml_devolucoes.db')
@@ -160,8 +368,14 @@ def main():
     parser.add_argument('--date-from', required=False)
     parser.add_argument('--date-to', required=False)
     parser.add_argument('--sku', required=False)
+    parser.add_argument('--sku-mode', choices=SKU_MODES, default='contains',
+                        help='contains (padrão), prefix ou exact')
     parser.add_argument('--only-pending', action='store_true')
     parser.add_argument('--top', type=int, default=50)
+    parser.add_argument('--columns', required=False, help='colunas da aba detalhes, separadas por vírgula (padrão: todas)')
+    parser.add_argument('--batch', required=False, help='spec JSON com vários recortes (ver load_batch_spec); ignora --out e os filtros')
+    parser.add_argument('--workers', type=int, default=1, help='nº de processos gravando planilhas no --batch (padrão: 1)')
+    parser.add_argument('--no-cache', action='store_true', help='ignora report_cache/ e refaz o relatório')
     args = parser.parse_args()
 
     dbp = args.db
@@ -169,7 +383,13 @@ def main():
         print('Banco não encontrado:', dbp)
         return
 
-    generate_reports(dbp, args.out, args.date_from, args.date_to, args.sku, args.only_pending, args.top)
+    if args.batch:
+        run_batch(dbp, args.batch, args.workers)
+        return
+
+    columns = [c.strip() for c in args.columns.split(',') if c.strip()] if args.columns else None
+    generate_reports(dbp, args.out, args.date_from, args.date_to, args.sku, args.only_pending, args.top, columns,
+                     use_cache=not args.no_cache, sku_mode=args.sku_mode)
 
 
 if __name__ == '__main__':
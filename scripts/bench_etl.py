@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Benchmark do ETL (etl_to_sqlite) etapa por etapa.
+
+Mede, para cada arquivo da pasta de entrada, as mesmas etapas de
+`process_file` (sniff, read, normalize_columns, money, dates) e depois o
+mapeamento e a gravação no SQLite (to_sql, via write_rows) do lote inteiro.
+Registra tempo por etapa, linhas/s e pico de memória (RSS) e acrescenta o
+resultado em um histórico JSON, para comparar mudanças no ETL.
+
+Com --generate N, gera antes N linhas sintéticas (scripts/gen_ml_exports.py)
+na pasta de entrada.
+
+Uso:
+  python scripts/bench_etl.py --input-dir bench_in --generate 1000000 --map columns_map.json
+  python scripts/bench_etl.py --input-dir bench_in --map columns_map.json --label "depois do cache de datas"
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import etl_to_sqlite as etl  # noqa: E402
+from gen_ml_exports import generate  # noqa: E402
+
+STAGES = ["sniff", "read", "normalize_columns", "money", "dates", "mapping", "to_sql"]
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo até agora (None se não der para medir)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    mi = psutil.Process().memory_info()
+    return getattr(mi, "peak_wset", mi.rss) / 1024 ** 2
+
+
+def git_rev():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+class Timer:
+    def __init__(self):
+        self.stages = {s: 0.0 for s in STAGES}
+
+    def run(self, stage, fn, *args):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        self.stages[stage] += time.perf_counter() - t0
+        return out
+
+
+def run_once(files, mapping, db_path):
+    """Uma passada completa; devolve (tempos por etapa, nº de linhas)."""
+    etl._date_formats_cache.clear()
+    etl.resolve_mapping.cache_clear()
+    timer = Timer()
+    frames = []
+    rows = 0
+    for f in files:
+        sniff = timer.run("sniff", etl.sniff_file, f) if f.suffix.lower() == ".csv" else None
+        df = timer.run("read", etl.read_raw, f, None, sniff)
+        rows += len(df)
+        df = timer.run("normalize_columns", etl.normalize_columns, df)
+        df = timer.run("money", etl.convert_money, df)
+        df = timer.run("dates", etl.convert_dates, df, f.name)
+        df["_source_file"] = f.name
+        if mapping:
+            df = timer.run("mapping", etl.apply_mapping, df, mapping)
+        df["_export_date"] = etl.export_date(f.stat().st_mtime)
+        frames.append(df)
+
+    if db_path.exists():
+        db_path.unlink()
+    conn = sqlite3.connect(str(db_path))
+    try:
+        timer.run("to_sql", lambda: etl.write_rows(conn, pd.concat(frames, ignore_index=True), replace=True))
+    finally:
+        conn.close()
+    return timer.stages, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-dir", required=True)
+    parser.add_argument("--map", required=False, help="path para columns_map.json")
+    parser.add_argument("--generate", type=int, default=0, help="gera N linhas sintéticas em --input-dir antes de medir")
+    parser.add_argument("--files", type=int, default=4, help="nº de arquivos gerados com --generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="repete a medição e guarda o melhor tempo de cada etapa")
+    parser.add_argument("--history", default="bench_etl_history.json", help="arquivo JSON com o histórico de execuções")
+    parser.add_argument("--label", default="", help="descrição da execução no histórico")
+    args = parser.parse_args()
+
+    input_dir = Path(args.input_dir)
+    if args.generate:
+        generate(input_dir, args.generate, args.files, args.seed)
+    files = etl.list_input_files(input_dir)
+    if not files:
+        parser.error(f"nenhum .csv/.xlsx em {input_dir}")
+    mapping = etl.load_mapping(args.map) if args.map else None
+
+    best = None
+    rows = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        for _ in range(max(args.repeat, 1)):
+            stages, rows = run_once(files, mapping, db_path)
+            best = stages if best is None else {s: min(best[s], stages[s]) for s in STAGES}
+
+    total = sum(best.values())
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "label": args.label,
+        "git_rev": git_rev(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "pyarrow": etl.pa.__version__ if etl.pa is not None else None,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "files": len(files),
+        "bytes": sum(f.stat().st_size for f in files),
+        "rows": rows,
+        "repeat": args.repeat,
+        "stages_s": {s: round(v, 4) for s, v in best.items()},
+        "stage_rows_per_s": {s: round(rows / v) if v > 0 else None for s, v in best.items()},
+        "total_s": round(total, 4),
+        "rows_per_s": round(rows / total) if total > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+    }
+
+    history_path = Path(args.history)
+    history = []
+    if history_path.exists():
+        with open(history_path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+    history.append(record)
+    with open(history_path, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+    print(f"{rows} linhas em {len(files)} arquivo(s), {record['bytes'] / 1024 ** 2:.1f} MB")
+    for s in STAGES:
+        share = best[s] / total * 100 if total else 0
+        rps = record["stage_rows_per_s"][s]
+        print(f"  {s:<18} {best[s]:8.3f} s  {share:5.1f}%  {rps if rps else '-':>12} linhas/s")
+    print(f"  {'total':<18} {total:8.3f} s          {record['rows_per_s']:>12} linhas/s")
+    print(f"Pico de RSS: {record['peak_rss_mb']} MB. Histórico: {history_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Gera exports sintéticos no formato do relatório de vendas do Mercado Livre.
+
+Serve para medir o ETL sem compartilhar exports reais. Cada arquivo sorteia
+as variações que aparecem na prática: linhas de lixo antes do cabeçalho,
+encoding (utf-8-sig, latin-1, cp1252), delimitador, estilo dos valores em
+reais ("1.234,50", "R$ 1.234,50", "(5,00)"), estilo das datas ("13 de
+setembro de 2025 10:30 hs.", dd/mm/aaaa, ISO) e .csv ou .xlsx. Parte das
+vendas de um arquivo se repete no seguinte, como nos exports de "últimos 90
+dias". A descrição de cada arquivo gerado fica em `generated.json`.
+
+Os valores saem de pools pequenos indexados com numpy, então 5M de linhas
+levam poucos minutos (o gargalo é a escrita do CSV).
+
+Uso:
+  python scripts/gen_ml_exports.py --out-dir bench_in --rows 1000000 --files 6 --seed 1
+"""
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+HEADER = [
+    "N.º de venda", "Data da venda", "Estado", "Descrição do status", "Pacote de diversos produtos",
+    "Unidades", "Receita por produtos (BRL)", "Receita por envio (BRL)", "Tarifa de venda e impostos (BRL)",
+    "Tarifas de envio (BRL)", "Cancelamentos e reembolsos (BRL)", "Total (BRL)",
+    "Mês de faturamento das suas tarifas", "Venda por publicidade", "SKU", "# de anúncio",
+    "Título do anúncio", "Variação", "Preço unitário de venda do anúncio (BRL)", "Tipo de anúncio",
+    "Comprador", "CPF", "Endereço", "Cidade", "Estado", "CEP", "País", "Forma de entrega",
+    "Data a caminho", "Data de entrega", "Motorista", "Número de rastreamento", "URL de acompanhamento",
+    "Unidades", "Revisado pelo Mercado Livre", "Data de revisão", "Dinheiro liberado", "Resultado",
+    "Destino", "Motivo do resultado", "Unidades", "Reclamação aberta", "Reclamação encerrada", "Em mediação",
+]
+MONEY_COLS = {
+    "Receita por produtos (BRL)", "Receita por envio (BRL)", "Tarifa de venda e impostos (BRL)",
+    "Tarifas de envio (BRL)", "Cancelamentos e reembolsos (BRL)", "Total (BRL)",
+    "Preço unitário de venda do anúncio (BRL)", "Dinheiro liberado",
+}
+DATE_COLS = {"Data da venda", "Data a caminho", "Data de entrega", "Data de revisão"}
+
+ENCODINGS = ["utf-8-sig", "latin-1", "cp1252"]
+DELIMITERS = [",", ";"]
+DATE_STYLES = ["pt_longo", "dmy_hm", "dmy", "iso"]
+MONEY_STYLES = ["brl", "rs", "paren"]
+JUNK = ["Relatório de vendas", "", "Gerado em {now}", "Período: últimos 90 dias"]
+
+MESES = ["janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+         "agosto", "setembro", "outubro", "novembro", "dezembro"]
+ESTADOS = ["Entregue", "Cancelada pelo comprador", "Devolução finalizada", "Em devolução",
+           "Reclamação encerrada com reembolso para o comprador", "Venda concluída"]
+MOTIVOS = ["O comprador comprou o produto errado", "O comprador encontrou um preço melhor",
+           "O comprador se arrependeu da compra", "Houve danos devido a problemas com a transportadora",
+           "O produto chegou com defeito", "O produto é diferente do anunciado", ""]
+RESULTADOS = ["Reembolso para o comprador", "Dinheiro liberado para você", "Em análise", ""]
+FORMAS = ["Mercado Envios Full", "Mercado Envios Flex", "Coleta", "Agência Mercado Livre"]
+NOMES = ["João", "José", "Márcia", "Conceição", "Antônio", "Luíza", "Sérgio", "Cláudia", "Fábio", "Inês"]
+SOBRENOMES = ["Araújo", "Gonçalves", "Simões", "Brandão", "Magalhães", "Conceição", "Falcão", "Pereira"]
+CIDADES = [("São Paulo", "SP"), ("Belo Horizonte", "MG"), ("Goiânia", "GO"), ("Maceió", "AL"),
+           ("Florianópolis", "SC"), ("Ribeirão Preto", "SP"), ("Vitória", "ES"), ("Belém", "PA")]
+PRODUTOS = ["Compressor Embraco 1/4 HP", "Gás Refrigerante R134a 13,6 kg", "Válvula de Expansão Danfoss",
+            "Termostato Digital Full Gauge", "Capacitor de Partida 50µF", "Filtro Secador 1/4\"",
+            "Motor Ventilador 10W Bivolt", "Tubo de Cobre 3/8\" 15 m"]
+
+POOL = 4096
+
+
+def fmt_brl(v, style):
+    s = f"{abs(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    if v < 0:
+        s = f"({s})" if style == "paren" else f"-{s}"
+    return f"R$ {s}" if style == "rs" else s
+
+
+def fmt_date(ts, style):
+    if style == "pt_longo":
+        return f"{ts.day} de {MESES[ts.month - 1]} de {ts.year} {ts:%H:%M} hs."
+    if style == "dmy_hm":
+        return f"{ts:%d/%m/%Y %H:%M}"
+    if style == "dmy":
+        return f"{ts:%d/%m/%Y}"
+    return f"{ts:%Y-%m-%d %H:%M:%S}"
+
+
+def money_pool(rng, style, numeric=False):
+    mag = np.round(np.exp(rng.normal(4.0, 1.3, POOL)), 2)
+    vals = np.where(rng.random(POOL) < 0.35, -mag, mag)
+    vals[: POOL // 20] = 0.0
+    if numeric:
+        return vals.astype(object)
+    out = np.array([fmt_brl(v, style) for v in vals], dtype=object)
+    out[-POOL // 50:] = ""  # células vazias
+    return out
+
+
+def date_pool(rng, style, start, end):
+    span = int((end - start).total_seconds())
+    secs = np.sort(rng.integers(0, span, POOL))
+    out = np.array([fmt_date(start + pd.Timedelta(seconds=int(s)), style) for s in secs], dtype=object)
+    out[-POOL // 50:] = ""
+    return out
+
+
+def text_pools(rng):
+    nomes = np.array([f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)}" for _ in range(POOL)], dtype=object)
+    cidades = rng.integers(0, len(CIDADES), POOL)
+    return {
+        "Estado": np.array(ESTADOS, dtype=object),
+        "Descrição do status": np.array(["", "Devolvido ao vendedor", "Aguardando revisão"], dtype=object),
+        "Pacote de diversos produtos": np.array(["Não", "Sim"], dtype=object),
+        "Mês de faturamento das suas tarifas": np.array([f"{m} 2025" for m in MESES], dtype=object),
+        "Venda por publicidade": np.array(["Não", "Sim"], dtype=object),
+        "SKU": np.array([f"NR-{i:05d}" for i in range(2000)], dtype=object),
+        "# de anúncio": np.array([f"MLB{rng.integers(10**9, 10**10)}" for _ in range(2000)], dtype=object),
+        "Título do anúncio": np.array(PRODUTOS, dtype=object),
+        "Variação": np.array(["", "110V", "220V", "Bivolt"], dtype=object),
+        "Tipo de anúncio": np.array(["Clássico", "Premium"], dtype=object),
+        "Comprador": nomes,
+        "CPF": np.array([f"{rng.integers(10**10, 10**11)}" for _ in range(POOL)], dtype=object),
+        "Endereço": np.array([f"Rua {s} {rng.integers(1, 3000)}" for s in rng.choice(SOBRENOMES, POOL)], dtype=object),
+        "Cidade": np.array([CIDADES[i][0] for i in cidades], dtype=object),
+        "UF": np.array([CIDADES[i][1] for i in cidades], dtype=object),
+        "CEP": np.array([f"{rng.integers(10**7, 10**8)}" for _ in range(POOL)], dtype=object),
+        "País": np.array(["Brasil"], dtype=object),
+        "Forma de entrega": np.array(FORMAS, dtype=object),
+        "Motorista": np.array(["", "Carlos Simões", "Ana Falcão"], dtype=object),
+        "Revisado pelo Mercado Livre": np.array(["", "Sim", "Não"], dtype=object),
+        "Resultado": np.array(RESULTADOS, dtype=object),
+        "Destino": np.array(["", "Vendedor", "Descarte"], dtype=object),
+        "Motivo do resultado": np.array(MOTIVOS, dtype=object),
+        "Sim/Não": np.array(["Não", "Não", "Não", "Sim"], dtype=object),
+    }
+
+
+def build_rows(rng, ids, spec, pools):
+    """Colunas (na ordem de HEADER) de um bloco de vendas."""
+    n = len(ids)
+    numeric = spec["format"] == "xlsx"
+    cols = []
+    pick = lambda arr: arr[rng.integers(0, len(arr), n)]  # noqa: E731
+    city_idx = rng.integers(0, POOL, n)
+    seen = {}
+    for name in HEADER:
+        k = seen[name] = seen.get(name, 0) + 1
+        if name == "N.º de venda":
+            cols.append(ids.astype(str).astype(object))
+        elif name in DATE_COLS:
+            cols.append(pick(pools["date"]))
+        elif name in MONEY_COLS:
+            cols.append(pick(pools["money_num" if numeric else "money"]))
+        elif name == "Unidades":
+            cols.append(rng.integers(1, 4, n) if numeric or k == 1 else rng.integers(1, 4, n).astype(str).astype(object))
+        elif name == "Estado" and k == 2:
+            cols.append(pools["UF"][city_idx])
+        elif name == "Cidade":
+            cols.append(pools["Cidade"][city_idx])
+        elif name == "Número de rastreamento":
+            cols.append(np.char.add("MEL", rng.integers(10**9, 10**10, n).astype(str)).astype(object))
+        elif name == "URL de acompanhamento":
+            cols.append(np.char.add("https://envios.mercadolivre.com.br/tracking?id=", ids.astype(str)).astype(object))
+        elif name in ("Reclamação aberta", "Reclamação encerrada", "Em mediação"):
+            cols.append(pick(pools["Sim/Não"]))
+        else:
+            cols.append(pick(pools[name]))
+    return cols
+
+
+def write_csv(path, spec, row_blocks):
+    with open(path, "w", encoding=spec["encoding"], errors="replace", newline="") as f:
+        for line in spec["junk"]:
+            f.write(line + "\n")
+        f.write(spec["delimiter"].join(HEADER) + "\n")
+        for cols in row_blocks:
+            pd.DataFrame(dict(enumerate(cols))).to_csv(f, header=False, index=False, sep=spec["delimiter"])
+
+
+def write_xlsx(path, spec, row_blocks):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Vendas")
+    for line in spec["junk"]:
+        ws.append([line] if line else [])
+    ws.append(HEADER)
+    for cols in row_blocks:
+        for row in zip(*cols):
+            ws.append([v.item() if hasattr(v, "item") else v for v in row])
+    wb.save(path)
+
+
+def plan(rng, n_files, rows, xlsx_share, xlsx_max_rows):
+    kinds = ["xlsx" if rng.random() < xlsx_share else "csv" for _ in range(n_files)]
+    sizes = [0] * n_files
+    n_csv = kinds.count("csv")
+    remaining = rows
+    for i, k in enumerate(kinds):
+        if k == "xlsx":
+            # planilhas grandes são lentas de gerar e de ler; o excesso vai para os CSVs
+            sizes[i] = min(rows // n_files, xlsx_max_rows) if n_csv else rows // n_files
+            remaining -= sizes[i]
+    csv_idx = [i for i, k in enumerate(kinds) if k == "csv"]
+    for j, i in enumerate(csv_idx):
+        sizes[i] = remaining // len(csv_idx) + (1 if j < remaining % len(csv_idx) else 0)
+    now = datetime.now().strftime("%d/%m/%Y %H:%M")
+    specs = []
+    for k, n in zip(kinds, sizes):
+        n_junk = int(rng.integers(0, 4))
+        specs.append({
+            "format": k,
+            "rows": int(n),
+            "encoding": str(rng.choice(ENCODINGS)),
+            "delimiter": str(rng.choice(DELIMITERS)),
+            "junk": [JUNK[j].format(now=now) for j in sorted(rng.choice(len(JUNK), n_junk, replace=False))],
+            "date_style": str(rng.choice(DATE_STYLES)),
+            "money_style": str(rng.choice(MONEY_STYLES)),
+        })
+    return specs
+
+
+def generate(out_dir, rows, files=4, seed=0, xlsx_share=0.2, xlsx_max_rows=100_000, overlap=0.1,
+             start="2025-01-01", end="2025-12-31", block=200_000):
+    """Gera os arquivos em `out_dir` e devolve a lista de specs gravada em
+    generated.json."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    pools = text_pools(rng)
+    specs = plan(rng, files, rows, xlsx_share, xlsx_max_rows)
+    next_id = 2000000000000
+    prev_ids = np.array([], dtype=np.int64)
+    for i, spec in enumerate(specs):
+        n = spec["rows"]
+        n_rep = min(int(n * overlap), len(prev_ids))
+        ids = np.concatenate([prev_ids[-n_rep:] if n_rep else prev_ids[:0],
+                              np.arange(next_id, next_id + n - n_rep, dtype=np.int64)])
+        next_id += n - n_rep
+        prev_ids = ids
+        pools["date"] = date_pool(rng, spec["date_style"], start, end)
+        pools["money"] = money_pool(rng, spec["money_style"])
+        pools["money_num"] = money_pool(rng, spec["money_style"], numeric=True)
+        blocks = (build_rows(rng, ids[a:a + block], spec, pools) for a in range(0, n, block))
+        spec["name"] = f"vendas_{i + 1:03d}.{spec['format']}"
+        path = out_dir / spec["name"]
+        if spec["format"] == "xlsx":
+            write_xlsx(path, spec, blocks)
+        else:
+            write_csv(path, spec, blocks)
+        spec["bytes"] = path.stat().st_size
+        layout = "" if spec["format"] == "xlsx" else f"{spec['encoding']}, sep={spec['delimiter']!r}, "
+        print(f"{spec['name']}: {n} linhas, {layout}{len(spec['junk'])} linha(s) de lixo, "
+              f"datas {spec['date_style']}, valores {spec['money_style']}")
+    with open(out_dir / "generated.json", "w", encoding="utf-8") as f:
+        json.dump({"rows": rows, "seed": seed, "files": specs}, f, ensure_ascii=False, indent=2)
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out-dir", required=True)
+    parser.add_argument("--rows", type=int, default=10_000, help="total de linhas (10k a 5M)")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--xlsx-share", type=float, default=0.2, help="fração dos arquivos gerados como .xlsx")
+    parser.add_argument("--xlsx-max-rows", type=int, default=100_000, help="limite de linhas por .xlsx")
+    parser.add_argument("--overlap", type=float, default=0.1, help="fração das vendas repetidas do arquivo anterior")
+    parser.add_argument("--start", default="2025-01-01")
+    parser.add_argument("--end", default="2025-12-31")
+    args = parser.parse_args()
+    generate(args.out_dir, args.rows, args.files, args.seed, args.xlsx_share, args.xlsx_max_rows,
+             args.overlap, args.start, args.end)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Conexões SQLite reaproveitadas entre reruns do app (ConnectionPool).
+
+Em vez de abrir e fechar uma conexão por consulta (pagando a leitura do
+esquema e o cache de páginas frio a cada vez):
+
+- leituras usam conexões `query_only` mantidas num pool: a thread pega uma
+  conexão só para ela durante o bloco `with pool.reader()` e a devolve no
+  fim. O Streamlit roda cada rerun numa thread nova, então conexões presas à
+  thread seriam reabertas a cada rerun;
+- escritas passam por uma única conexão, serializada por um lock, com commit
+  no fim do bloco `with pool.writer()` (rollback se der erro);
+- stats() devolve os contadores de conexões abertas e comandos executados.
+
+O app guarda uma instância por processo com st.cache_resource.
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+BUSY_TIMEOUT_MS = 5000
+READ_PRAGMAS = {
+    'query_only': 'ON',
+    'mmap_size': 256 * 1024 ** 2,
+    'cache_size': -64 * 1024,  # KiB
+    'temp_store': 'MEMORY',
+    'busy_timeout': BUSY_TIMEOUT_MS,
+}
+WRITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': BUSY_TIMEOUT_MS,
+}
+MAX_IDLE_READERS = 4
+
+
+class ConnectionPool:
+    def __init__(self, db_path, max_idle=MAX_IDLE_READERS):
+        self.db_path = str(db_path)
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'read_connections': 0, 'write_connections': 0, 'reads': 0, 'writes': 0, 'statements': 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _connect(self, pragmas, counter):
+        con = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in pragmas.items():
+            try:
+                con.execute(f'PRAGMA {name}={value}')
+            except sqlite3.OperationalError:
+                # journal_mode=WAL precisa de acesso exclusivo; fica para a próxima
+                pass
+        con.set_trace_callback(lambda _sql: self._count('statements'))
+        self._count(counter)
+        return con
+
+    @contextmanager
+    def reader(self):
+        """Conexão só de leitura, exclusiva desta thread até o fim do bloco."""
+        try:
+            con = self._idle.get_nowait()
+        except queue.Empty:
+            con = self._connect(READ_PRAGMAS, 'read_connections')
+        self._count('reads')
+        try:
+            yield con
+        finally:
+            if self._idle.qsize() < self.max_idle:
+                self._idle.put(con)
+            else:
+                con.close()
+
+    @contextmanager
+    def writer(self):
+        """A conexão de escrita (uma por vez); commit no fim do bloco."""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(WRITE_PRAGMAS, 'write_connections')
+            con = self._writer
+            self._count('writes')
+            try:
+                yield con
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['idle_readers'] = self._idle.qsize()
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            con.close()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,63 @@
+"""Contagem de pedidos da aba Métricas (app_streamlit.load_order_counts).
+
+Rodar com: python -m pytest -q test_app_metrics.py
+"""
+import sqlite3
+
+import pytest
+
+from migrate_normalize_db import TABLES_SQL, refresh_summary, run_script
+from sqlite_pool import ConnectionPool
+
+app = pytest.importorskip('app_streamlit')
+
+
+@pytest.fixture(params=['resumo', 'join'])
+def banco(request, tmp_path, monkeypatch):
+    db = tmp_path / 'ml.db'
+    con = sqlite3.connect(db)
+    cur = con.cursor()
+    run_script(cur, TABLES_SQL.format(s=''))
+    # pedidos 1 e 2 têm dois SKUs: entram em dois grupos de summary_day_sku_motivo;
+    # o 2 é uma devolução
+    cur.executemany('INSERT INTO orders (order_id, data_venda, ano_mes, total_brl, motivo_resultado) VALUES (?,?,?,?,?)', [
+        ('1', '2025-07-01T10:00:00', '2025-07', 100.0, 'Entregue'),
+        ('2', '2025-07-01T11:00:00', '2025-07', -20.0, 'Devolvido'),
+        ('3', '2025-08-02T09:00:00', '2025-08', 50.0, 'Entregue'),
+    ])
+    cur.executemany('INSERT INTO order_items (order_id, sku) VALUES (?,?)',
+                    [('1', 'A'), ('1', 'B'), ('2', 'A'), ('2', 'B'), ('3', 'B')])
+    refresh_summary(cur)
+    if request.param == 'join':
+        # banco normalizado antes de summary_day_motivo
+        cur.execute('DROP TABLE summary_day_motivo')
+    con.commit()
+    con.close()
+    pool = ConnectionPool(db)
+    monkeypatch.setattr(app, '_db', lambda: pool)
+    app.load_order_counts.clear()
+    yield db
+    app.load_order_counts.clear()
+    pool.close()
+
+
+def test_pedido_com_varios_skus_conta_uma_vez(banco):
+    df = app.load_order_counts()
+    assert df.to_dict('records') == [
+        {'dia': '2025-07-01', 'pedidos': 2, 'devolucoes': 1},
+        {'dia': '2025-08-02', 'pedidos': 1, 'devolucoes': 0},
+    ]
+    # a soma por SKU contaria os pedidos 1 e 2 duas vezes
+    con = sqlite3.connect(banco)
+    assert con.execute('SELECT SUM(pedidos), SUM(devolucoes) FROM summary_day_sku_motivo').fetchone() == (5, 2)
+    con.close()
+
+
+def test_mesmos_filtros_do_load_financials(banco):
+    df = app.load_order_counts(month_from='2025-07', month_to='2025-07', sku_filter='b', sku_mode='exact')
+    assert df.to_dict('records') == [{'dia': '2025-07-01', 'pedidos': 2, 'devolucoes': 1}]
+    df = app.load_order_counts(month_from='2025-08')
+    assert df.to_dict('records') == [{'dia': '2025-08-02', 'pedidos': 1, 'devolucoes': 0}]
+    df = app.load_order_counts(motivo_filter=['Entregue'])
+    assert int(df['pedidos'].sum()) == 2
+    assert int(df['pedidos'].sum()) == app.load_financials(motivo_filter=['Entregue'])['order_id'].nunique()
@@ -0,0 +1,79 @@
+"""Inferência de formato de data por coluna (etl_to_sqlite.parse_dates_series).
+
+Rodar com: python -m pytest -q test_etl_dates.py
+"""
+import pandas as pd
+import pytest
+
+import etl_to_sqlite
+from etl_to_sqlite import DMY, ISO, PT_LONGO, convert_dates, infer_date_formats, parse_dates_series
+
+
+@pytest.fixture(autouse=True)
+def _cache_vazio(monkeypatch):
+    monkeypatch.setattr(etl_to_sqlite, '_date_formats_cache', {})
+
+
+def _datas(valores, **kw):
+    return parse_dates_series(pd.Series(valores, dtype=object), **kw)
+
+
+def _iso(datas):
+    return [None if pd.isna(d) else d.strftime('%Y-%m-%d %H:%M:%S') for d in datas]
+
+
+def test_pt_longo_dmy_e_iso():
+    datas, n_bad, _ = _datas(['15 de setembro de 2025 10:32 hs.', '1 de março de 2025 9:05 hs.', '2 de jan. de 2024'])
+    assert _iso(datas) == ['2025-09-15 10:32:00', '2025-03-01 09:05:00', '2024-01-02 00:00:00']
+    assert n_bad == 0
+
+    datas, n_bad, _ = _datas(['15/09/2025', '1/3/2025 9:05', '02/01/2024 23:59:58'])
+    assert _iso(datas) == ['2025-09-15 00:00:00', '2025-03-01 09:05:00', '2024-01-02 23:59:58']
+    assert n_bad == 0
+
+    datas, n_bad, _ = _datas(['2025-09-15', '2025-03-01 09:05:00', '2024-01-02T23:59'])
+    assert _iso(datas) == ['2025-09-15 00:00:00', '2025-03-01 09:05:00', '2024-01-02 23:59:00']
+    assert n_bad == 0
+
+
+def test_iso_com_fuso_fica_na_hora_local():
+    datas, n_bad, _ = _datas(['2025-09-15T10:32:05-03:00', '2025-09-16T08:00:00-03:00', None])
+    assert datas.dtype == 'datetime64[ns]'
+    assert _iso(datas) == ['2025-09-15 10:32:05', '2025-09-16 08:00:00', None]
+    assert n_bad == 0
+    # fusos diferentes e valores sem fuso na mesma coluna
+    datas, n_bad, _ = _datas(['2025-09-15T10:32:05Z', '2025-09-15 10:32:05+0100', '2025-09-16'])
+    assert _iso(datas) == ['2025-09-15 10:32:05', '2025-09-15 10:32:05', '2025-09-16 00:00:00']
+    assert n_bad == 0
+
+
+def test_coluna_mista_usa_os_formatos_em_cascata():
+    valores = ['15/09/2025 10:00', '15/09/2025 10:00', '16-09-2025 11:30', '2025-09-17', '18 de setembro de 2025']
+    assert infer_date_formats(pd.Series(valores, dtype='string')) == [DMY, PT_LONGO, ISO, '%d-%m-%Y %H:%M']
+    datas, n_bad, _ = _datas(valores)
+    assert _iso(datas) == ['2025-09-15 10:00:00', '2025-09-15 10:00:00', '2025-09-16 11:30:00',
+                           '2025-09-17 00:00:00', '2025-09-18 00:00:00']
+    assert n_bad == 0
+
+
+def test_cache_do_cabecalho_com_outro_estilo_de_data():
+    chave = (('data_da_venda',), 'data_da_venda')
+    _datas(['15/09/2025', '16/09/2025'], cache_key=chave)
+    assert etl_to_sqlite._date_formats_cache[chave] == [DMY]
+    # outro arquivo, mesmo cabeçalho, datas por extenso: infere de novo o que sobrou
+    datas, n_bad, _ = _datas(['15 de setembro de 2025 10:32 hs.', '17/09/2025'], cache_key=chave)
+    assert _iso(datas) == ['2025-09-15 10:32:00', '2025-09-17 00:00:00']
+    assert n_bad == 0
+    assert etl_to_sqlite._date_formats_cache[chave] == [DMY, PT_LONGO]
+
+
+def test_contagem_de_valores_nao_reconhecidos(capsys):
+    datas, n_bad, exemplos = _datas(['15/09/2025', 'sem data', 'sem data', '', None, '31/02/2025'])
+    assert _iso(datas) == ['2025-09-15 00:00:00', None, None, None, None, None]
+    # brancos e ausentes não contam; valores repetidos contam por linha
+    assert n_bad == 3
+    assert exemplos == ['sem data', '31/02/2025']
+
+    df = pd.DataFrame({'data_da_venda': ['15/09/2025', 'sem data'], 'sku': ['A', 'B']})
+    convert_dates(df, 'vendas.csv')
+    assert "vendas.csv: 1 valor(es) não reconhecido(s) como data em 'data_da_venda'" in capsys.readouterr().out
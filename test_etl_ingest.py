@@ -0,0 +1,203 @@
+"""Carga incremental de etl_to_sqlite.ingest (manifesto e staging em Parquet).
+
+Rodar com: python -m pytest -q test_etl_ingest.py
+"""
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import etl_to_sqlite
+from etl_to_sqlite import CLEAN_TABLE, ensure_manifest, ensure_sniff_cache, ingest, load_mapping
+
+CSV = 'N.º de venda;Data da venda;SKU;Total (BRL)\n1;01/07/2025 10:00;A;10,00\n2;02/07/2025 11:00;B;-5,00\n'
+MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'columns_map.json')
+
+# exports de meses diferentes: linhas de título antes do cabeçalho, cp1252,
+# o mesmo cabeçalho com outro estilo de data e outro layout (separador ",")
+EXPORTS = {
+    'jan.csv': ('utf-8', 'Relatório de vendas\n\nN.º de venda;Data da venda;SKU;Total (BRL)\n'
+                '1;15/01/2025 10:00;A;10,00\n2;16/01/2025;B;-5,00\n3;17/01/2025 09:05;C;1.234,50\n'),
+    'fev.csv': ('cp1252', 'N.º de venda;Data da venda;SKU;Total (BRL)\n'
+                '3;3 de fevereiro de 2025 10:32 hs.;C;1.300,00\n4;4 de fevereiro de 2025 08:00 hs.;D;(7,00)\n'
+                '5;5 de fevereiro de 2025 12:00 hs.;E;20,00\n'),
+    'mar.csv': ('utf-8-sig', 'order_id,date,seller_sku,amount\n5,2025-03-01 10:00:00,E,"21,00"\n6,2025-03-02,F,30\n'),
+}
+
+
+def _exports(pasta, nomes=None):
+    pasta.mkdir(exist_ok=True)
+    for i, nome in enumerate(nomes or EXPORTS):
+        encoding, texto = EXPORTS[nome]
+        path = pasta / nome
+        path.write_bytes(texto.encode(encoding))
+        os.utime(path, (1.7e9 + i * 86400, 1.7e9 + i * 86400))
+    return pasta
+
+
+def _tabela(con):
+    cols = [r[1] for r in con.execute(f'PRAGMA table_info("{CLEAN_TABLE}")')]
+    rows = con.execute(f'SELECT * FROM {CLEAN_TABLE} ORDER BY n_de_venda').fetchall()
+    return cols, rows
+
+
+def _conn(tmp_path):
+    con = sqlite3.connect(tmp_path / 'x.db')
+    ensure_manifest(con)
+    ensure_sniff_cache(con)
+    return con
+
+
+def _origens(con):
+    return con.execute(f'SELECT "_source_file", count(*) FROM {CLEAN_TABLE} GROUP BY 1 ORDER BY 1').fetchall()
+
+
+@pytest.mark.parametrize('chunksize', [0, 1000])
+def test_copia_do_arquivo_usa_o_proprio_nome_no_staging(tmp_path, chunksize):
+    pytest.importorskip('pyarrow')
+    entrada = tmp_path / 'in'
+    entrada.mkdir()
+    (entrada / 'vendas_001.csv').write_text(CSV, encoding='utf-8')
+    con = _conn(tmp_path)
+    ingest(con, entrada, staging_dir=tmp_path / 'staging', chunksize=chunksize)
+
+    # mesmo conteúdo (mesmo staging) com outro nome
+    copia = entrada / 'vendas_001 (1).csv'
+    shutil.copy(entrada / 'vendas_001.csv', copia)
+    os.utime(copia, (2e9, 2e9))
+    ingest(con, entrada, staging_dir=tmp_path / 'staging', chunksize=chunksize)
+    assert _origens(con) == [('vendas_001 (1).csv', 2), ('vendas_001.csv', 2)]
+
+
+def test_reconstrucao_completa_ignora_o_lote(tmp_path):
+    entrada = tmp_path / 'in'
+    entrada.mkdir()
+    (entrada / 'a.csv').write_text(CSV, encoding='utf-8')
+    (entrada / 'b.csv').write_text(CSV.replace('\n1;', '\n3;').replace('\n2;', '\n4;'), encoding='utf-8')
+    con = _conn(tmp_path)
+    ingest(con, entrada)
+    # o watch_ingest passa só os arquivos prontos; a reconstrução não pode perder os outros
+    ingest(con, entrada, full=True, files=[entrada / 'b.csv'])
+    assert _origens(con) == [('a.csv', 2), ('b.csv', 2)]
+    assert con.execute('SELECT count(*) FROM etl_manifest').fetchone()[0] == 2
+
+
+def test_arquivo_removido_sai_da_base_e_do_manifesto(tmp_path):
+    entrada = tmp_path / 'in'
+    entrada.mkdir()
+    (entrada / 'a.csv').write_text(CSV, encoding='utf-8')
+    (entrada / 'b.csv').write_text(CSV.replace('\n1;', '\n3;').replace('\n2;', '\n4;'), encoding='utf-8')
+    con = _conn(tmp_path)
+    ingest(con, entrada)
+    # lote parcial (watch_ingest): não diz nada sobre os outros arquivos
+    (entrada / 'a.csv').unlink()
+    ingest(con, entrada, files=[entrada / 'b.csv'])
+    assert _origens(con) == [('a.csv', 2), ('b.csv', 2)]
+
+    ingest(con, entrada)
+    assert _origens(con) == [('b.csv', 2)]
+    assert [r[0] for r in con.execute('SELECT file_path FROM etl_manifest')] == ['b.csv']
+
+
+def test_workers_gravam_a_mesma_tabela_que_a_execucao_serial(tmp_path, monkeypatch):
+    entrada = _exports(tmp_path / 'in')
+    tabelas = []
+    for workers in (1, 2):
+        # cada execução começa sem os formatos de data já inferidos
+        monkeypatch.setattr(etl_to_sqlite, '_date_formats_cache', {})
+        con = sqlite3.connect(tmp_path / f'w{workers}.db')
+        ensure_manifest(con)
+        ensure_sniff_cache(con)
+        ingest(con, entrada, load_mapping(MAP), workers=workers)
+        tabelas.append(_tabela(con))
+    assert tabelas[0] == tabelas[1]
+    cols, rows = tabelas[0]
+    assert [r[cols.index('n_de_venda')] for r in rows] == ['1', '2', '3', '4', '5', '6']
+    assert all(r[cols.index('data_venda')] for r in rows)
+
+
+def test_blocos_gravam_a_mesma_tabela_que_o_lote(tmp_path):
+    entrada = _exports(tmp_path / 'in')
+    # a mesma venda repetida no arquivo, em blocos diferentes com chunksize=2
+    repetido = entrada / 'abr.csv'
+    repetido.write_text('N.º de venda;Data da venda;SKU;Total (BRL)\n7;01/04/2025;G;1,00\n6;02/04/2025;F;2,00\n'
+                        '8;03/04/2025;H;3,00\n7;04/04/2025;G;4,00\n', encoding='utf-8')
+    os.utime(repetido, (1.8e9, 1.8e9))
+    tabelas = []
+    for chunksize in (0, 2):
+        con = sqlite3.connect(tmp_path / f'c{chunksize}.db')
+        ensure_manifest(con)
+        ensure_sniff_cache(con)
+        ingest(con, entrada, load_mapping(MAP), chunksize=chunksize)
+        tabelas.append(_tabela(con))
+    assert tabelas[0] == tabelas[1]
+    cols, rows = tabelas[0]
+    por_venda = {r[cols.index('n_de_venda')]: r for r in rows}
+    assert por_venda['6'][cols.index('total_brl')] == 2.0
+    assert por_venda['7'][cols.index('total_brl')] == 4.0
+    assert len(rows) == 8
+
+
+def test_cabecalhos_diferentes_caem_nas_mesmas_colunas(tmp_path):
+    entrada = _exports(tmp_path / 'in', ['jan.csv', 'mar.csv'])
+    con = _conn(tmp_path)
+    ingest(con, entrada, load_mapping(MAP))
+    cols, rows = _tabela(con)
+    # "N.º de venda"/"order_id", "Data da venda"/"date", "SKU"/"seller_sku", "Total (BRL)"/"amount"
+    assert cols == ['n_de_venda', 'data_venda', 'sku', 'total_brl', '_source_file', '_export_date']
+    assert [r[:4] for r in rows if r[4] == 'mar.csv'] == [
+        ('5', '2025-03-01 10:00:00', 'E', 21.0),
+        ('6', '2025-03-02 00:00:00', 'F', 30.0),
+    ]
+    assert len(rows) == 5
+
+
+def test_resolucao_usa_o_primeiro_candidato_presente():
+    compiled = etl_to_sqlite.compile_mapping({'n_de_venda': ['N.º de venda', 'order_id'], 'total_brl': ['total (brl)', 'total']})
+    assert etl_to_sqlite.resolve_mapping(compiled, ('total', 'order_id', 'n.o_de_venda')) == {
+        'n.o_de_venda': 'n_de_venda', 'total': 'total_brl'}
+
+
+def _vendas(con):
+    return con.execute(f'SELECT n_de_venda, "_source_file", total_brl FROM {CLEAN_TABLE} ORDER BY n_de_venda').fetchall()
+
+
+def _export(path, vendas, mtime):
+    linhas = ''.join(f'{v};01/07/2025;SKU{v};{total}\n' for v, total in vendas)
+    path.write_text('N.º de venda;Data da venda;SKU;Total (BRL)\n' + linhas, encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize('chunksize', [0, 1])
+def test_exports_sobrepostos_e_reimportacao(tmp_path, chunksize):
+    entrada = tmp_path / 'in'
+    entrada.mkdir()
+    mapping = load_mapping(MAP)
+    con = _conn(tmp_path)
+    _export(entrada / 'mensal.csv', [(1, '1,00'), (2, '2,00')], 1.7e9)
+    _export(entrada / 'ult90.csv', [(2, '20,00'), (3, '30,00')], 1.8e9)
+    ingest(con, entrada, mapping, chunksize=chunksize)
+    # o export mais recente vence a venda 2
+    assert _vendas(con) == [('1', 'mensal.csv', 1.0), ('2', 'ult90.csv', 20.0), ('3', 'ult90.csv', 30.0)]
+
+    # novo download do ult90 sem a venda 2: ela volta com a linha do mensal
+    _export(entrada / 'ult90.csv', [(3, '31,00'), (4, '40,00')], 1.9e9)
+    ingest(con, entrada, mapping, chunksize=chunksize)
+    assert _vendas(con) == [('1', 'mensal.csv', 1.0), ('2', 'mensal.csv', 2.0),
+                            ('3', 'ult90.csv', 31.0), ('4', 'ult90.csv', 40.0)]
+
+    # mensal reimportado, mais novo que o ult90: vence as vendas em comum
+    _export(entrada / 'mensal.csv', [(1, '1,50'), (3, '3,00')], 2e9)
+    ingest(con, entrada, mapping, chunksize=chunksize)
+    assert _vendas(con) == [('1', 'mensal.csv', 1.5), ('3', 'mensal.csv', 3.0), ('4', 'ult90.csv', 40.0)]
+
+    # mensal removido da pasta: a venda 3 volta para o ult90
+    (entrada / 'mensal.csv').unlink()
+    ingest(con, entrada, mapping, chunksize=chunksize)
+    assert _vendas(con) == [('3', 'ult90.csv', 31.0), ('4', 'ult90.csv', 40.0)]
+
+    # e o resultado é o mesmo de uma reconstrução completa
+    incremental = _tabela(con)
+    ingest(con, entrada, mapping, full=True, chunksize=chunksize)
+    assert _tabela(con) == incremental
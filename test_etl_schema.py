@@ -0,0 +1,38 @@
+"""Esquema tipado de devolucoes_clean (etl_to_sqlite.write_rows).
+
+Rodar com: python -m pytest -q test_etl_schema.py
+"""
+import sqlite3
+
+import pandas as pd
+
+from etl_to_sqlite import CLEAN_TABLE, needs_rebuild, write_rows
+
+
+def _tipos(conn):
+    return {r[1]: r[2] for r in conn.execute(f'PRAGMA table_info("{CLEAN_TABLE}")')}
+
+
+def test_colunas_declaradas_tipadas():
+    conn = sqlite3.connect(':memory:')
+    df = pd.DataFrame({
+        'n_de_venda': ['1', '2'],
+        'data_venda': pd.to_datetime(['2025-07-01 10:00', '2025-07-02 00:00']),
+        'total_brl': ['R$ 1.234,50', '-5,00'],
+        'unidades': ['1', '3'],
+        'estado': ['Entregue', 'Cancelada'],
+        '_export_date': ['2025-07-03', '2025-07-03'],
+    })
+    write_rows(conn, df)
+    assert _tipos(conn) == {'n_de_venda': 'TEXT', 'data_venda': 'TEXT', 'total_brl': 'REAL',
+                            'unidades': 'INTEGER', 'estado': 'TEXT', '_export_date': 'TEXT'}
+    rows = conn.execute(f'SELECT data_venda, total_brl, unidades FROM {CLEAN_TABLE} ORDER BY n_de_venda').fetchall()
+    assert rows == [('2025-07-01 10:00:00', 1234.5, 1), ('2025-07-02 00:00:00', -5.0, 3)]
+    assert not needs_rebuild(conn)
+
+
+def test_base_antiga_sem_tipos_reconstroi():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f'CREATE TABLE {CLEAN_TABLE} (n_de_venda TEXT, total_brl TEXT)')
+    conn.execute(f'CREATE UNIQUE INDEX ux ON {CLEAN_TABLE} (n_de_venda)')
+    assert needs_rebuild(conn)
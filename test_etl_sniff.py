@@ -0,0 +1,82 @@
+"""Detecção de encoding/delimitador/cabeçalho (etl_to_sqlite.sniff_file) e o
+cache por hash de conteúdo usado pelo ingest.
+
+Rodar com: python -m pytest -q test_etl_sniff.py
+"""
+import os
+import sqlite3
+
+import etl_to_sqlite
+from etl_to_sqlite import (
+    CLEAN_TABLE,
+    Sniff,
+    ensure_manifest,
+    ensure_sniff_cache,
+    file_hash,
+    ingest,
+    load_sniff_cache,
+    sniff_file,
+)
+
+HEADER = 'N.º de venda;Data da venda;SKU;Descrição'
+
+
+def _escreve(path, texto, encoding):
+    path.write_bytes(texto.encode(encoding))
+    return path
+
+
+def test_utf8_sig_e_cp1252(tmp_path):
+    texto = HEADER + '\n1;01/07/2025;A;Válvula de expansão\n'
+    assert sniff_file(_escreve(tmp_path / 'a.csv', texto, 'utf-8-sig')) == Sniff('utf-8-sig', ';', 0)
+    assert sniff_file(_escreve(tmp_path / 'b.csv', texto, 'cp1252')) == Sniff('cp1252', ';', 0)
+
+
+def test_ponto_e_virgula_e_virgula(tmp_path):
+    virgula = HEADER.replace(';', ',') + '\n1,01/07/2025,A,"Compressor; 1/4 HP"\n'
+    assert sniff_file(_escreve(tmp_path / 'a.csv', virgula, 'utf-8')).delimiter == ','
+    # vírgulas nos valores não contam: vale o cabeçalho
+    pv = HEADER + '\n1;01/07/2025;A;10,00 + 2,50 + 3,00\n'
+    assert sniff_file(_escreve(tmp_path / 'b.csv', pv, 'utf-8')).delimiter == ';'
+
+
+def test_cabecalho_depois_de_linhas_de_titulo(tmp_path):
+    texto = 'Relatório de vendas, julho\nGerado em 01/08/2025\n\n' + HEADER + '\n1;01/07/2025;A;x\n'
+    assert sniff_file(_escreve(tmp_path / 'a.csv', texto, 'utf-8')) == Sniff('utf-8', ';', 3)
+    # sem cabeçalho reconhecível: delimitador da primeira linha não vazia
+    assert sniff_file(_escreve(tmp_path / 'b.csv', '\na|b|c\n1|2|3\n', 'utf-8')) == Sniff('utf-8', '|', None)
+
+
+def test_amostra_cortada_no_meio_de_um_caractere(tmp_path):
+    texto = HEADER + '\n' + '1;01/07/2025;A;Válvula\n' * 10
+    path = _escreve(tmp_path / 'a.csv', texto, 'utf-8')
+    corte = texto.encode('utf-8').index('á'.encode('utf-8'), len(HEADER) + 2) + 1
+    assert sniff_file(path, nbytes=corte) == Sniff('utf-8', ';', 0)
+
+
+def test_cache_por_hash_de_conteudo(tmp_path, monkeypatch):
+    entrada = tmp_path / 'in'
+    entrada.mkdir()
+    arquivo = _escreve(entrada / 'vendas.csv', HEADER + '\n1;01/07/2025;A;x\n', 'utf-8')
+    con = sqlite3.connect(tmp_path / 'x.db')
+    ensure_manifest(con)
+    ensure_sniff_cache(con)
+    ingest(con, entrada)
+    assert load_sniff_cache(con) == {file_hash(arquivo): Sniff('utf-8', ';', 0)}
+
+    # arquivo alterado (outro encoding e separador): hash novo, detecta de novo
+    _escreve(arquivo, 'Relatório\n' + HEADER.replace(';', ',') + '\n2,02/07/2025,B,ção\n', 'cp1252')
+    os.utime(arquivo, (2e9, 2e9))
+    ingest(con, entrada)
+    assert load_sniff_cache(con)[file_hash(arquivo)] == Sniff('cp1252', ',', 1)
+    assert con.execute(f'SELECT sku, descricao FROM {CLEAN_TABLE}').fetchall() == [('B', 'ção')]
+
+    # cópia com o mesmo conteúdo: usa o cache, sem ler o arquivo de novo
+    def sem_sniff(path, *a, **kw):
+        raise AssertionError(f'sniff_file chamado para {path}')
+
+    monkeypatch.setattr(etl_to_sqlite, 'sniff_file', sem_sniff)
+    copia = _escreve(entrada / 'vendas (1).csv', arquivo.read_bytes().decode('cp1252'), 'cp1252')
+    os.utime(copia, (2e9, 2e9))
+    ingest(con, entrada)
+    assert con.execute(f'SELECT count(*) FROM {CLEAN_TABLE}').fetchone()[0] == 2
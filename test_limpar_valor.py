@@ -0,0 +1,58 @@
+"""Paridade entre limpar_valor (por célula) e limpar_valor_series (vetorizado).
+
+Rodar com: python -m pytest -q test_limpar_valor.py
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+from etl_to_sqlite import limpar_valor, limpar_valor_series
+
+
+def _fmt_brl(v, rng):
+    s = f"{abs(v):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    if v < 0:
+        s = rng.choice([f"-{s}", f"({s})", f"- {s}"])
+    return rng.choice([s, f"R$ {s}", f"R${s}", f"$ {s}", f" {s} ", f"R$\xa0{s}"])
+
+
+def _fuzz_corpus(n=20000, seed=42):
+    rng = random.Random(seed)
+    junk = ['', ' ', '-', '()', 'abc', 'R$', '1,2,3', '1.', ',5', '+5', '1e3', 'nan', 'inf',
+            '1_000', '\t7,5', 'R R$$5', '--1', '(1,0', '١٢', None, float('nan'), 3, 2.5, -0.0, True]
+    out = []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.7:
+            out.append(_fmt_brl(rng.uniform(-1e6, 1e6) * rng.choice([1, 0.001]), rng))
+        elif r < 0.8:
+            out.append(str(rng.randint(-10000, 10000)))
+        else:
+            out.append(rng.choice(junk))
+    return out
+
+
+def _same(a, b):
+    return a == b or (a != a and b != b)
+
+
+def test_paridade_corpus_fuzz():
+    corpus = _fuzz_corpus()
+    esperado = [limpar_valor(v) for v in corpus]
+    obtido = limpar_valor_series(pd.Series(corpus, dtype=object)).tolist()
+    diffs = [(v, e, o) for v, e, o in zip(corpus, esperado, obtido) if not _same(e, o)]
+    assert not diffs, diffs[:10]
+
+
+def test_preserva_indice_e_nome():
+    s = pd.Series(['1,50', None], index=[10, 20], name='total_brl', dtype=object)
+    r = limpar_valor_series(s)
+    assert list(r.index) == [10, 20]
+    assert r.name == 'total_brl'
+    assert r.tolist() == [1.5, 0.0]
+
+
+def test_coluna_numerica():
+    s = pd.Series([1.5, np.nan, -2.0])
+    assert limpar_valor_series(s).tolist() == [1.5, 0.0, -2.0]
@@ -0,0 +1,196 @@
+"""Normalização de devolucoes_clean (migrate_normalize_db.normalize).
+
+Rodar com: python -m pytest -q test_migrate_normalize.py
+"""
+import sqlite3
+
+import pandas as pd
+
+from etl_to_sqlite import LOAD_VERSION_TABLE, MANIFEST_TABLE, ensure_manifest, table_exists, write_rows
+from migrate_normalize_db import normalize
+from query_builder import Where
+
+
+def test_tabelas_normalizadas(tmp_path):
+    db = tmp_path / 'ml.db'
+    con = sqlite3.connect(db)
+    write_rows(con, pd.DataFrame({
+        'n_de_venda': ['1', '2', None],
+        'data_venda': pd.to_datetime(['2025-07-01 10:00:00', None, '2025-07-03 00:00:00']),
+        'sku': ['A', 'B', 'C'],
+        'total_brl': [100.0, -20.0, 5.0],
+        'tarifas_envio_brl': [-10.0, 0.0, -1.0],
+        'cancelamentos_reembolsos_brl': [None, -30.0, 0.0],
+        'dinheiro_liberado': [4.0, 50.0, 0.0],
+        'unidades': [2, None, 1],
+        'comprador': ['Ana', 'Ana', 'Bia'],
+        '_export_date': ['2025-07-05'] * 3,
+    }))
+    con.execute("CREATE TABLE actions (action_id INTEGER PRIMARY KEY, order_id TEXT, note TEXT)")
+    con.execute("INSERT INTO actions (order_id, note) VALUES ('1', 'reclamado')")
+    con.commit()
+    con.close()
+
+    normalize(db, reports=False)
+
+    con = sqlite3.connect(db)
+    assert con.execute('SELECT order_id, data_venda, _valor_passivel_extorno, _valor_pendente FROM orders ORDER BY order_id').fetchall() == [
+        ('1', '2025-07-01T10:00:00', 10.0, 6.0),
+        ('2', None, 30.0, 0.0),
+    ]
+    assert con.execute('SELECT order_id, sku, unidades FROM order_items ORDER BY id').fetchall() == [('1', 'A', 2), ('2', 'B', 1)]
+    assert con.execute('SELECT order_id, fee_type, amount FROM fees ORDER BY fee_id').fetchall() == [
+        ('1', 'tarifas_envio_brl', -10.0),
+        ('2', 'cancelamentos_reembolsos_brl', -30.0),
+    ]
+    assert con.execute('SELECT comprador FROM buyers ORDER BY buyer_id').fetchall() == [('Ana',), ('Bia',)]
+    assert con.execute('SELECT note FROM actions').fetchall() == [('reclamado',)]
+
+
+def _carga(con, arquivo, vendas, total, digest):
+    if table_exists(con, 'devolucoes_clean'):
+        con.execute('DELETE FROM devolucoes_clean WHERE "_source_file" = ?', (arquivo,))
+    write_rows(con, pd.DataFrame({
+        'n_de_venda': vendas,
+        'total_brl': total,
+        'comprador': [f'C{v}' for v in vendas],
+        'cpf': ['1'] * len(vendas),
+        '_source_file': [arquivo] * len(vendas),
+        '_export_date': ['2025-07-05'] * len(vendas),
+    }))
+    con.execute(f'INSERT OR REPLACE INTO {MANIFEST_TABLE} (file_path, content_hash, run_id) VALUES (?, ?, ?)',
+                (arquivo, digest, 'r1'))
+    con.commit()
+
+
+def _tabelas(db):
+    con = sqlite3.connect(db)
+    out = {
+        'orders': con.execute('SELECT order_id, total_brl, source_file FROM orders ORDER BY order_id').fetchall(),
+        'items': sorted(con.execute('SELECT order_id, sku FROM order_items').fetchall(), key=repr),
+        'buyers': con.execute('SELECT comprador FROM buyers ORDER BY comprador').fetchall(),
+        'summary': con.execute('SELECT * FROM summary_day_sku_motivo ORDER BY dia, sku').fetchall(),
+        'summary_motivo': con.execute('SELECT * FROM summary_day_motivo ORDER BY dia, motivo_resultado').fetchall(),
+    }
+    con.close()
+    return out
+
+
+def test_incremental_igual_ao_full(tmp_path, capsys):
+    db = tmp_path / 'ml.db'
+    con = sqlite3.connect(db)
+    ensure_manifest(con)
+    _carga(con, 'a.csv', ['1', '2'], [10.0, 20.0], 'ha')
+    _carga(con, 'b.csv', ['3', '4'], [30.0, 40.0], 'hb')
+    con.close()
+    normalize(db, reports=False)
+
+    # b.csv reimportado: venda 4 saiu, 3 mudou de valor, 5 entrou
+    con = sqlite3.connect(db)
+    _carga(con, 'b.csv', ['3', '5'], [33.0, 50.0], 'hb2')
+    con.close()
+    capsys.readouterr()
+    normalize(db, reports=False)
+    assert 'Incremental: 1 arquivo(s), 3 venda(s)' in capsys.readouterr().out
+    incremental = _tabelas(db)
+
+    normalize(db, reports=False, full=True)
+    assert incremental == _tabelas(db)
+    assert incremental['orders'] == [('1', 10.0, 'a.csv'), ('2', 20.0, 'a.csv'), ('3', 33.0, 'b.csv'), ('5', 50.0, 'b.csv')]
+    assert incremental['buyers'] == [('C1',), ('C2',), ('C3',), ('C5',)]
+    assert [r[4:7] for r in incremental['summary']] == [(4, 4, 113.0)]
+    assert [r[3:] for r in incremental['summary_motivo']] == [(4, 0)]
+
+
+def test_normalizacao_incrementa_o_contador_de_cargas(tmp_path):
+    db = tmp_path / 'ml.db'
+    con = sqlite3.connect(db)
+    ensure_manifest(con)
+    _carga(con, 'a.csv', ['1', '2'], [10.0, 20.0], 'ha')
+    con.close()
+
+    def versao():
+        con = sqlite3.connect(db)
+        try:
+            return con.execute(f'SELECT version FROM {LOAD_VERSION_TABLE}').fetchone()[0]
+        finally:
+            con.close()
+
+    normalize(db, reports=False)
+    v = versao()
+    normalize(db, reports=False)  # nada mudou
+    assert versao() == v
+    # --full sem ETL antes: manifesto e normalize_state iguais, o contador não
+    normalize(db, reports=False, full=True)
+    assert versao() == v + 1
+
+
+def _plano(con, q, params=()):
+    return ' | '.join(r[3] for r in con.execute('EXPLAIN QUERY PLAN ' + q, params))
+
+
+def test_consultas_do_app_usam_indices(tmp_path):
+    db = tmp_path / 'ml.db'
+    n = 3000
+    con = sqlite3.connect(db)
+    write_rows(con, pd.DataFrame({
+        'n_de_venda': [str(2000000 + i) for i in range(n)],
+        'data_venda': pd.to_datetime([f'20{23 + i % 3}-{1 + i % 12:02d}-{1 + i % 28:02d}' for i in range(n)]),
+        'sku': [f'SKU-{i % 300:04d}' for i in range(n)],
+        'total_brl': [float(i % 200 - 100) for i in range(n)],
+        'motivo_resultado': [f'motivo {i % 15}' for i in range(n)],
+        '_export_date': ['2025-07-05'] * n,
+    }))
+    con.close()
+    normalize(db, reports=False)
+
+    con = sqlite3.connect(db)
+    assert con.execute("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] == 1
+    # load_financials (query_builder): faixa semiaberta de data_venda + join com os itens
+    q = 'SELECT o.order_id, oi.sku FROM orders o JOIN order_items oi ON o.order_id = oi.order_id'
+    w = Where().month_range('o.data_venda', '2024-03', '2024-05')
+    assert w.params == ['2024-03-01', '2024-06-01']
+    plano = _plano(con, q + w.sql + ' ORDER BY o._valor_pendente DESC', w.params)
+    assert 'SEARCH o USING INDEX ix_orders_data_venda' in plano
+    assert 'SEARCH oi USING INDEX ix_order_items_order_id' in plano
+    n_mes = con.execute('SELECT count(*) FROM orders WHERE ano_mes BETWEEN ? AND ?', ('2024-03', '2024-05')).fetchone()[0]
+    assert con.execute('SELECT count(*) FROM orders o' + w.sql, w.params).fetchone()[0] == n_mes > 0
+    # o texto do comando não depende dos valores (só dos filtros usados)
+    w = Where().one_of('o.motivo_resultado', ['motivo 1', 'motivo 2'])
+    assert w.sql == Where().one_of('o.motivo_resultado', ['motivo 3']).sql
+    assert 'ix_orders_motivo_resultado' in _plano(con, 'SELECT count(*) FROM orders o' + w.sql, w.params)
+    for mode, esperado in [('prefix', 100), ('exact', 10)]:
+        w = Where().sku('oi.sku', 'sku-000' if mode == 'prefix' else 'sku-0001', mode)
+        assert 'SEARCH oi USING INDEX ix_order_items_sku' in _plano(con, 'SELECT oi.order_id FROM order_items oi' + w.sql, w.params)
+        assert con.execute('SELECT count(*) FROM order_items oi' + w.sql, w.params).fetchone()[0] == esperado, mode
+    # get_months e a tela de detalhe
+    assert 'ix_orders_ano_mes' in _plano(con, 'SELECT DISTINCT ano_mes FROM orders ORDER BY ano_mes DESC')
+    assert 'SEARCH order_items USING INDEX ix_order_items_order_id' in _plano(con, "SELECT * FROM order_items WHERE order_id = '2000001'")
+    assert 'SEARCH actions USING INDEX ix_actions_order_id' in _plano(con, "SELECT * FROM actions WHERE order_id = '2000001'")
+
+
+def test_reconstrucao_troca_tabelas_sem_interromper_leitura(tmp_path):
+    db = tmp_path / 'ml.db'
+    con = sqlite3.connect(db)
+    ensure_manifest(con)
+    _carga(con, 'a.csv', ['1', '2'], [10.0, 20.0], 'ha')
+    con.close()
+    normalize(db, reports=False)
+
+    # leitor com um snapshot aberto durante a reconstrução completa
+    leitor = sqlite3.connect(db, isolation_level=None)
+    leitor.execute('BEGIN')
+    assert leitor.execute('SELECT sum(total_brl) FROM orders').fetchone() == (30.0,)
+    con = sqlite3.connect(db)
+    con.execute("UPDATE devolucoes_clean SET total_brl = 15.0 WHERE n_de_venda = '1'")
+    con.commit()
+    con.close()
+    normalize(db, reports=False, full=True)
+    assert leitor.execute('SELECT sum(total_brl) FROM orders').fetchone() == (30.0,)
+    leitor.execute('COMMIT')
+    assert leitor.execute('SELECT sum(total_brl) FROM orders').fetchone() == (35.0,)
+
+    assert leitor.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    assert not leitor.execute("SELECT name FROM sqlite_master WHERE name LIKE '%\\_\\_new' ESCAPE '\\' "
+                              "OR name LIKE '%\\_\\_old' ESCAPE '\\'").fetchall()
+    leitor.close()
@@ -0,0 +1,61 @@
+"""Regra de extorno/pendente (reclaim.py): pandas, por linha e SQL dão o mesmo resultado.
+
+Rodar com: python -m pytest -q test_reclaim.py
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import reclaim
+
+
+def _frame(n=2000, seed=7):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({c: rng.normal(0, 100, n).round(2) for c in reclaim.RECLAIM_COLS + ['total_brl', 'dinheiro_liberado']})
+    df.loc[rng.random(n) < 0.1, 'tarifas_envio_brl'] = np.nan
+    df.loc[rng.random(n) < 0.1, 'dinheiro_liberado'] = np.nan
+    return df
+
+
+def _por_linha(r, cols):
+    # implementação antiga (reports.compute_reclaim com apply(axis=1))
+    s = 0.0
+    for c in cols:
+        if c in r.index and pd.notna(r[c]) and float(r[c]) < 0:
+            s += -float(r[c])
+    return s
+
+
+def test_paridade_com_implementacao_por_linha():
+    df = _frame()
+    esperado = df.apply(_por_linha, axis=1, args=(reclaim.RECLAIM_COLS,))
+    lib = df['dinheiro_liberado'].fillna(0.0)
+    out = reclaim.compute_reclaim(df.copy())
+    assert np.allclose(out['_valor_passivel_extorno'], esperado)
+    assert np.allclose(out['_valor_pendente'], (esperado - lib).clip(lower=0.0))
+
+    out = reclaim.compute_prejuizo(df.copy())
+    real = df['total_brl'].where(df['total_brl'] < 0, 0.0).abs()
+    assert np.allclose(out['prejuizo_real'], real)
+    assert np.allclose(out['prejuizo_pendente_calc'], (real - lib).clip(lower=0.0))
+    assert np.allclose(out['prejuizo_pendente_signed'], -out['prejuizo_pendente_calc'])
+
+
+def test_colunas_configuraveis_e_ausentes():
+    df = pd.DataFrame({'a': ['-1,5', '2', None], 'b': [-3.0, -1.0, np.nan]})
+    assert reclaim.passivel_extorno(df, ['a', 'b', 'nao_existe']).tolist() == [3.0, 1.0, 0.0]
+    assert reclaim.compute_reclaim(df, ['b'])['_valor_pendente'].tolist() == [3.0, 1.0, 0.0]
+
+
+def test_expressoes_sql():
+    df = _frame(500)
+    con = sqlite3.connect(':memory:')
+    df.to_sql('t', con, index=False)
+    q = (f'SELECT {reclaim.passivel_extorno_sql()}, {reclaim.pendente_sql()}, '
+         f'{reclaim.prejuizo_pendente_sql("COALESCE(total_brl, 0.0)", "COALESCE(dinheiro_liberado, 0.0)")} FROM t')
+    sql = np.array(con.execute(q).fetchall())
+    out = reclaim.compute_prejuizo(reclaim.compute_reclaim(df.copy()))
+    assert np.allclose(sql[:, 0], out['_valor_passivel_extorno'])
+    assert np.allclose(sql[:, 1], out['_valor_pendente'])
+    assert np.allclose(sql[:, 2], out['prejuizo_pendente_calc'])
@@ -0,0 +1,46 @@
+"""Cache de relatórios (report_cache.py): invalidação pelo banco e limite por bytes.
+
+Rodar com: python -m pytest -q test_report_cache.py
+"""
+import os
+import sqlite3
+
+import report_cache
+
+
+def test_chave_muda_quando_o_banco_muda(tmp_path):
+    db = tmp_path / 'x.db'
+    con = sqlite3.connect(db)
+    con.execute('CREATE TABLE t (a)')
+    con.commit()
+    k1 = report_cache.cache_key(db, 'reports', {'sku': 'A'})
+    assert k1 == report_cache.cache_key(db, 'reports', {'sku': 'A'})
+    assert k1 != report_cache.cache_key(db, 'reports', {'sku': 'B'})
+
+    out = tmp_path / 'r.csv'
+    out.write_text('a\n1\n')
+    report_cache.store(tmp_path / 'cache', k1, [out])
+    copia = tmp_path / 'copia.csv'
+    assert report_cache.fetch(tmp_path / 'cache', k1, [copia])
+    assert copia.read_text() == 'a\n1\n'
+
+    # mesmo tamanho e mtime preservado: o contador do cabeçalho ainda muda
+    st = db.stat()
+    con.execute('INSERT INTO t VALUES (1)')
+    con.commit()
+    con.close()
+    os.utime(db, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert report_cache.cache_key(db, 'reports', {'sku': 'A'}) != k1
+
+
+def test_lru_por_bytes(tmp_path):
+    cache = tmp_path / 'cache'
+    src = tmp_path / 'f.bin'
+    src.write_bytes(b'x' * 1000)
+    for i, key in enumerate(['a', 'b', 'c']):
+        report_cache.store(cache, key, [src], max_bytes=10 ** 6)
+        os.utime(cache / key / report_cache.META, ns=(i * 10 ** 9, i * 10 ** 9))
+    # 'a' acabou de ser usado: sai o 'b', o menos recente
+    assert report_cache.fetch(cache, 'a', [tmp_path / 'out.bin'])
+    report_cache.evict(cache, max_bytes=2500)
+    assert sorted(p.name for p in cache.iterdir()) == ['a', 'c']
@@ -0,0 +1,135 @@
+"""reports.py: filtros aplicados no SQLite (build_query) x filtros em pandas e modo --batch.
+
+Rodar com: python -m pytest -q test_reports.py
+"""
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import reports
+from etl_to_sqlite import DATE_INDEX, write_rows
+
+
+def _banco(path, n=600, seed=3):
+    rng = np.random.default_rng(seed)
+    dias = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 120, n), unit='D') + pd.to_timedelta(rng.integers(0, 86400, n), unit='s')
+    df = pd.DataFrame({
+        'n_de_venda': [f'2000{i:08d}' for i in range(n)],
+        'data_venda': dias,
+        'sku': rng.choice(['AB-1', 'ab_10', 'XY%2', 'CD-3'], n),
+        'total_brl': rng.normal(0, 100, n).round(2),
+        'dinheiro_liberado': rng.choice([0.0, 10.0, np.nan], n),
+        '_export_date': '2025-06-01',
+    })
+    for c in reports.RECLAIM_COLS:
+        df[c] = rng.normal(0, 50, n).round(2)
+    con = sqlite3.connect(path)
+    write_rows(con, df, replace=True)
+    con.commit()
+    con.close()
+
+
+def test_filtros_no_sql_iguais_aos_do_pandas(tmp_path):
+    db = str(tmp_path / 'r.db')
+    _banco(db)
+    base = reports.compute_reclaim(reports.load_table(db))
+    casos = [dict(date_from='2025-02-01', date_to='2025-02-28'), dict(sku='ab_1'), dict(sku='Y%'),
+             dict(only_pending=True, date_from='2025-03-15')]
+    for kw in casos:
+        esperado = reports.filter_df(base.copy(), kw.get('date_from'), kw.get('date_to'))
+        if 'sku' in kw:
+            # LIKE do SQLite: sem diferenciar maiúsculas e com % e _ literais
+            esperado = esperado[esperado['sku'].str.lower().str.contains(kw['sku'].lower(), regex=False)]
+        if kw.get('only_pending'):
+            esperado = esperado[esperado['_valor_pendente'] > 0]
+        out = reports.load_filtered(db, **kw)
+        assert out['n_de_venda'].tolist() == esperado['n_de_venda'].tolist(), kw
+        assert np.allclose(out['_valor_pendente'], esperado['_valor_pendente'])
+    for sku, mode in [('ab', 'prefix'), ('ab-1', 'exact'), ('xy%', 'prefix')]:
+        esperado = reports.filter_df(base, sku=sku, sku_mode=mode)
+        out = reports.load_filtered(db, sku=sku, sku_mode=mode)
+        assert out['n_de_venda'].tolist() == esperado['n_de_venda'].tolist() != [], mode
+
+
+def test_projecao_e_indice_de_data(tmp_path):
+    db = str(tmp_path / 'r.db')
+    _banco(db)
+    out = reports.load_filtered(db, date_from='2025-02-01', columns=['n_de_venda', 'sku'])
+    assert 'total_brl' not in out.columns
+    assert {'n_de_venda', 'sku', '_valor_pendente'} <= set(out.columns)
+
+    con = sqlite3.connect(db)
+    sql, params = reports.build_query(con, '2025-02-01', '2025-02-28', columns=['sku'])
+    plan = ' '.join(r[3] for r in con.execute('EXPLAIN QUERY PLAN ' + sql, params))
+    con.close()
+    assert DATE_INDEX in plan
+
+    # sem sku/data/n_de_venda em --columns: os resumos continuam completos
+    reports.generate_reports(db, tmp_path / 'todas.xlsx', use_cache=False)
+    reports.generate_reports(db, tmp_path / 'proj.xlsx', columns=['total_brl'], use_cache=False)
+    for aba in ['resumo_por_sku', 'resumo_por_mes']:
+        pd.testing.assert_frame_equal(pd.read_excel(tmp_path / 'proj.xlsx', sheet_name=aba),
+                                      pd.read_excel(tmp_path / 'todas.xlsx', sheet_name=aba))
+    detalhes = pd.read_excel(tmp_path / 'proj.xlsx', sheet_name='detalhes')
+    assert list(detalhes.columns) == ['total_brl', '_valor_passivel_extorno', '_valor_pendente']
+
+
+def test_batch_igual_a_execucoes_separadas(tmp_path):
+    db = str(tmp_path / 'r.db')
+    _banco(db)
+    spec = tmp_path / 'spec.json'
+    spec.write_text(json.dumps({'out_dir': str(tmp_path / 'lote'), 'reports': [
+        {'name': 'fev', 'date_from': '2025-02-01', 'date_to': '2025-02-28'},
+        {'sku': 'AB-1', 'only_pending': True}]}), encoding='utf-8')
+    indice = reports.run_batch(db, spec, workers=2)
+
+    idx = pd.read_excel(indice)
+    assert idx['arquivo'].tolist() == ['fev.xlsx', 'relatorio_002.xlsx']
+    reports.generate_reports(db, tmp_path / 'fev.xlsx', '2025-02-01', '2025-02-28')
+    for aba in ['detalhes', 'resumo_por_mes']:
+        pd.testing.assert_frame_equal(pd.read_excel(tmp_path / 'lote' / 'fev.xlsx', sheet_name=aba),
+                                      pd.read_excel(tmp_path / 'fev.xlsx', sheet_name=aba))
+    sku = pd.read_excel(tmp_path / 'lote' / 'relatorio_002.xlsx')
+    assert len(sku) == idx['linhas'][1] == idx['linhas_pendentes'][1] > 0
+    assert set(sku['sku'].str.lower()) == {'ab-1'}
+
+
+def test_batch_top_zero_nao_cai_no_padrao_do_spec(tmp_path):
+    db = str(tmp_path / 'r.db')
+    _banco(db)
+    spec = tmp_path / 'spec.json'
+    spec.write_text(json.dumps({'out_dir': str(tmp_path / 'lote'), 'top': 2, 'reports': [
+        {'name': 'sem_resumo', 'top': 0}, {'name': 'padrao'}]}), encoding='utf-8')
+    reports.run_batch(db, spec)
+    assert 'resumo_por_sku' not in pd.ExcelFile(tmp_path / 'lote' / 'sem_resumo.xlsx').sheet_names
+    assert len(pd.read_excel(tmp_path / 'lote' / 'padrao.xlsx', sheet_name='resumo_por_sku')) == 2
+
+
+def test_resumos_da_tabela_agregada_so_com_normalizacao_em_dia(tmp_path):
+    from etl_to_sqlite import ensure_manifest
+    from migrate_normalize_db import normalize
+
+    db = str(tmp_path / 'r.db')
+    _banco(db)
+    con = sqlite3.connect(db)
+    ensure_manifest(con)
+    con.execute("INSERT INTO etl_manifest (file_path, content_hash, run_id) VALUES ('a.csv', 'h1', 'r1')")
+    con.commit()
+    con.close()
+    normalize(db, reports=False)
+
+    resumos = reports.summaries_from_db(db)
+    assert resumos is not None
+    por_mes = reports.summary_by_month(reports.load_filtered(db))
+    # mesmo tipo e mesmos meses do resumo em pandas
+    assert resumos[1]['mes'].tolist() == por_mes['mes'].tolist()
+    assert resumos[1]['vendas_count'].tolist() == por_mes['vendas_count'].tolist()
+
+    # carga nova do ETL sem migração: a tabela agregada está atrasada
+    con = sqlite3.connect(db)
+    con.execute("UPDATE etl_manifest SET run_id = 'r2'")
+    con.commit()
+    con.close()
+    assert reports.summaries_from_db(db) is None
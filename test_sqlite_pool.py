@@ -0,0 +1,48 @@
+"""Pool de conexões do app (sqlite_pool.py).
+
+Rodar com: python -m pytest -q test_sqlite_pool.py
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from sqlite_pool import ConnectionPool
+
+
+def _run_in_thread(fn):
+    out = []
+    t = threading.Thread(target=lambda: out.append(fn()))
+    t.start()
+    t.join()
+    return out[0]
+
+
+def test_leituras_reaproveitam_conexao_e_escrita_serializada(tmp_path):
+    db = tmp_path / 'x.db'
+    pool = ConnectionPool(db)
+    with pool.writer() as con:
+        con.execute('CREATE TABLE t (a INTEGER)')
+        con.execute('INSERT INTO t VALUES (1)')
+
+    def count():
+        with pool.reader() as con:
+            return con.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+    # cada rerun do Streamlit roda numa thread nova: a conexão é a mesma
+    assert [_run_in_thread(count) for _ in range(5)] == [1] * 5
+    stats = pool.stats()
+    assert stats['read_connections'] == 1 and stats['write_connections'] == 1
+    assert stats['reads'] == 5 and stats['statements'] >= 7
+
+    with pool.reader() as con:
+        with pytest.raises(sqlite3.OperationalError):
+            con.execute('INSERT INTO t VALUES (2)')
+        assert con.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    with pytest.raises(ZeroDivisionError):
+        with pool.writer() as con:
+            con.execute('INSERT INTO t VALUES (3)')
+            1 / 0
+    assert count() == 1
+    pool.close()
+
@@ -0,0 +1,121 @@
+"""Daemon de ingestão (watch_ingest.py) e a versão de dados que o app usa
+para descartar o cache.
+
+Rodar com: python -m pytest -q test_watch_ingest.py
+"""
+import os
+import sqlite3
+
+import pytest
+
+import watch_ingest
+from watch_ingest import Debouncer, file_ready, run_batch
+
+CSV = 'N.º de venda;Data da venda;SKU;Total (BRL)\n1;01/07/2025 10:00;A;10,00\n2;02/07/2025 11:00;B;-5,00\n'
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(watch_ingest.time, 'monotonic', r)
+    return r
+
+
+def test_so_arquivos_de_entrada(tmp_path, relogio):
+    d = Debouncer(5)
+    for nome in ('vendas.csv', 'vendas.XLSX', '~$vendas.xlsx', 'vendas.csv.crdownload', 'notas.txt'):
+        d.touch(tmp_path / nome)
+    assert sorted(p.name for p in d.pending) == ['vendas.XLSX', 'vendas.csv']
+
+
+def test_arquivo_estavel_por_settle_segundos(tmp_path, relogio):
+    arquivo = tmp_path / 'vendas.csv'
+    arquivo.write_text('N.º de venda;Total\n', encoding='utf-8')
+    d = Debouncer(5)
+    d.touch(arquivo)
+    assert d.ready() == []  # primeira volta só registra (tamanho, mtime)
+    relogio.agora += 3
+    # ainda sendo gravado: o prazo recomeça
+    with open(arquivo, 'a', encoding='utf-8') as f:
+        f.write('1;10,00\n')
+    assert d.ready() == []
+    relogio.agora += 4
+    assert d.ready() == []
+    relogio.agora += 1
+    assert d.ready() == [arquivo]
+    assert len(d) == 0
+    # um novo evento do mesmo arquivo volta a esperar
+    d.touch(arquivo)
+    assert d.ready() == []
+
+
+def test_arquivo_vazio_ou_apagado(tmp_path, relogio):
+    vazio = tmp_path / 'vazio.csv'
+    vazio.touch()
+    apagado = tmp_path / 'apagado.csv'
+    apagado.write_text(CSV, encoding='utf-8')
+    d = Debouncer(0)
+    d.touch(vazio)
+    d.touch(apagado)
+    d.ready()
+    apagado.unlink()
+    relogio.agora += 1
+    assert d.ready() == []
+    # o vazio (download que ainda não começou a gravar) continua esperando
+    assert list(d.pending) == [vazio]
+
+
+def test_file_ready(tmp_path, relogio, monkeypatch):
+    arquivo = tmp_path / 'vendas.csv'
+    arquivo.write_text(CSV, encoding='utf-8')
+    assert file_ready(arquivo)
+    assert not file_ready(tmp_path / 'nao_existe.csv')
+    assert not file_ready(tmp_path)
+
+    # arquivo ainda aberto por outro processo (Windows): espera a próxima volta
+    monkeypatch.setattr(watch_ingest, 'file_ready', lambda path: False)
+    d = Debouncer(0)
+    d.touch(arquivo)
+    d.ready()
+    relogio.agora += 1
+    assert d.ready() == []
+    monkeypatch.setattr(watch_ingest, 'file_ready', file_ready)
+    assert d.ready() == [arquivo]
+
+
+def test_versao_de_dados_muda_a_cada_carga(tmp_path, monkeypatch):
+    app = pytest.importorskip('app_streamlit')
+    from sqlite_pool import ConnectionPool
+
+    db = tmp_path / 'ml.db'
+    entrada = tmp_path / 'in'
+    entrada.mkdir()
+    arquivo = entrada / 'vendas.csv'
+    arquivo.write_text(CSV, encoding='utf-8')
+    sqlite3.connect(db).close()
+    pool = ConnectionPool(db)
+    monkeypatch.setattr(app, 'DB_PATH', db)
+    monkeypatch.setattr(app, '_db', lambda: pool)
+
+    versoes = [app._data_version()]
+    run_batch(db, entrada, [arquivo], normalize_after=False)
+    versoes.append(app._data_version())
+    # mesmo segundo, mesmo nº de arquivos e de linhas
+    arquivo.write_text(CSV.replace('10,00', '11,00'), encoding='utf-8')
+    os.utime(arquivo, (2e9, 2e9))
+    run_batch(db, entrada, [arquivo], normalize_after=False)
+    versoes.append(app._data_version())
+    # arquivo já carregado: nada muda
+    run_batch(db, entrada, [arquivo], normalize_after=False)
+    versoes.append(app._data_version())
+    assert versoes[0] != versoes[1] != versoes[2]
+    assert versoes[3] == versoes[2]
+    pool.close()
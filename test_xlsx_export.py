@@ -0,0 +1,33 @@
+"""Planilha gravada em streaming (xlsx_export.py): valores, formatos e links.
+
+Rodar com: python -m pytest -q test_xlsx_export.py
+"""
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from xlsx_export import MONEY_FORMAT, write_xlsx
+
+
+def test_valores_formatos_e_links(tmp_path):
+    df = pd.DataFrame({
+        'Order ID': ['2000123', None, '2000"9'],
+        'Total (R$)': [10.5, np.nan, -3.0],
+        'Data': pd.to_datetime(['2025-01-02 10:00', None, '2025-03-04 00:00']).tz_localize('America/Sao_Paulo'),
+        'mes': pd.PeriodIndex(['2025-01', '2025-02', '2025-03'], freq='M'),
+    })
+    out = tmp_path / 'e.xlsx'
+    write_xlsx(out, {'Export': df, 'vazia': df.iloc[:0]}, money_cols=['Total (R$)'],
+               link_cols=['Order ID'], link_url='https://example.com/{}/detalhe', chunksize=2)
+
+    ws = openpyxl.load_workbook(out)['Export']
+    rows = [[c.value for c in r] for r in ws.iter_rows()]
+    assert rows[0] == ['Order ID', 'Total (R$)', 'Data', 'mes']
+    assert rows[1][0] == '=HYPERLINK("https://example.com/2000123/detalhe","2000123")'
+    assert rows[3][0] == '=HYPERLINK("https://example.com/2000""9/detalhe","2000""9")'
+    assert rows[2][:3] == [None, None, None]
+    assert rows[1][2] == pd.Timestamp('2025-01-02 10:00')
+    assert [r[3] for r in rows[1:]] == ['2025-01', '2025-02', '2025-03']
+    assert ws['B2'].number_format == MONEY_FORMAT and ws['B4'].value == -3.0
+    assert ws['A1'].font.b
+    assert ws.column_dimensions['A'].width > len('Order ID')
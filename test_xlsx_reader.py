@@ -0,0 +1,41 @@
+"""Leitura de .xlsx em blocos (etl_to_sqlite.iter_xlsx_chunks).
+
+Rodar com: python -m pytest -q test_xlsx_reader.py
+"""
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import etl_to_sqlite as etl
+
+
+@pytest.fixture
+def planilha(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Relatório de vendas'])
+    ws.append([])
+    ws.append(['N.º de venda', 'Data da venda', 'Total (BRL)', 'Unidades', 'Unidades', None])
+    ws.append([2000000000001, '13 de setembro de 2025 10:30 hs.', '1.234,50', 1, 2])
+    ws.append([])
+    ws.append([2000000000002, '14 de setembro de 2025 11:00 hs.', -5.0, 3.0, None, 'x'])
+    ws.append([2000000000003, None, '', 1, 1])
+    path = tmp_path / 'vendas.xlsx'
+    wb.save(path)
+    return path
+
+
+@pytest.mark.parametrize('bounded', [False, True])
+def test_cabecalho_depois_do_lixo(planilha, bounded):
+    chunks = list(etl.iter_xlsx_chunks(planilha, chunksize=2, bounded=bounded))
+    assert [len(c) for c in chunks] == [2, 1]
+    df = pd.concat(chunks, ignore_index=True)
+    assert list(df.columns) == ['N.º de venda', 'Data da venda', 'Total (BRL)', 'Unidades', 'Unidades.1', 'Unnamed: 5']
+    assert df['N.º de venda'].tolist() == [2000000000001, 2000000000002, 2000000000003]
+    assert df['Unidades'].tolist() == [1, 3, 1]
+
+
+def test_mesmo_pipeline_do_csv(planilha):
+    df = etl.transform_frame(etl.read_raw(planilha), planilha.name)
+    assert df['total_(brl)'].tolist() == [1234.5, -5.0, 0.0]
+    assert df['data_da_venda'].iloc[0] == pd.Timestamp('2025-09-13 10:30')
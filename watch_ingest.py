@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Ingestão contínua dos exports do Mercado Livre.
+
+Observa a pasta de entrada e, assim que um export novo (ou alterado) termina
+de ser gravado, roda só a carga incremental do etl_to_sqlite (parse, staging,
+upsert em devolucoes_clean) e a normalização do migrate_normalize_db. O app
+Streamlit percebe que o banco mudou e descarta o cache na próxima interação,
+sem reconstrução manual nem restart.
+
+Usa o watchdog (inotify no Linux, ReadDirectoryChangesW no Windows) se
+estiver instalado; sem ele, faz polling da pasta a cada --interval segundos.
+
+Um arquivo só é carregado depois que tamanho e mtime ficam estáveis por
+--settle segundos (downloads do navegador e cópias gravam aos poucos).
+
+Uso:
+  python watch_ingest.py --input-dir C:\\Users\\Pichau\\Downloads --db ml_devolucoes.db --map columns_map.json
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from etl_to_sqlite import (
+    INPUT_SUFFIXES,
+    ensure_manifest,
+    ensure_sniff_cache,
+    ingest,
+    list_input_files,
+    load_mapping,
+    pq,
+)
+from migrate_normalize_db import normalize
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog é opcional
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def is_input_file(path):
+    # "~$arquivo.xlsx" é o lock do Excel com o arquivo aberto
+    return path.suffix.lower() in INPUT_SUFFIXES and not path.name.startswith("~$")
+
+
+def file_ready(path):
+    """No Windows um arquivo ainda aberto para escrita não pode ser aberto."""
+    try:
+        with open(path, "rb"):
+            return True
+    except OSError:
+        return False
+
+
+class Debouncer:
+    """Arquivos vistos mudando recentemente; `ready` devolve os que ficaram
+    com (tamanho, mtime) estáveis por `settle` segundos."""
+
+    def __init__(self, settle):
+        self.settle = settle
+        self.pending = {}  # path -> ((size, mtime_ns), desde quando)
+        self.lock = threading.Lock()
+
+    def touch(self, path):
+        path = Path(path)
+        if not is_input_file(path):
+            return
+        with self.lock:
+            self.pending[path] = (None, time.monotonic())
+
+    def ready(self):
+        now = time.monotonic()
+        out = []
+        with self.lock:
+            for path, (sig, since) in list(self.pending.items()):
+                try:
+                    st = path.stat()
+                except OSError:
+                    del self.pending[path]  # apagado/renomeado antes de terminar
+                    continue
+                cur = (st.st_size, st.st_mtime_ns)
+                if cur != sig:
+                    self.pending[path] = (cur, now)
+                elif now - since >= self.settle and st.st_size > 0 and file_ready(path):
+                    out.append(path)
+                    del self.pending[path]
+        return sorted(out)
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, debouncer):
+        self.debouncer = debouncer
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.debouncer.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.debouncer.touch(event.src_path)
+
+    def on_moved(self, event):
+        # navegadores baixam em .crdownload/.part e renomeiam no fim
+        if not event.is_directory:
+            self.debouncer.touch(event.dest_path)
+
+
+class Poller:
+    """Alternativa ao watchdog: compara (tamanho, mtime) da pasta a cada volta."""
+
+    def __init__(self, input_dir, debouncer):
+        self.input_dir = input_dir
+        self.debouncer = debouncer
+        self.seen = {}
+
+    def scan(self):
+        current = {}
+        for f in list_input_files(self.input_dir):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            current[f] = (st.st_size, st.st_mtime_ns)
+            if self.seen.get(f) != current[f]:
+                self.debouncer.touch(f)
+        self.seen = current
+
+
+def run_batch(db_path, input_dir, files, mapping=None, staging_dir=None, normalize_after=True):
+    """Carga incremental só de `files` e, se algo entrou, normalização."""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        ensure_manifest(conn)
+        ensure_sniff_cache(conn)
+        parsed = ingest(conn, input_dir, mapping, staging_dir=staging_dir, files=files)
+    finally:
+        conn.close()
+    if parsed and normalize_after:
+        normalize(db_path, reports=False)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-dir", required=True)
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--map", required=False, help="path para columns_map.json")
+    parser.add_argument("--staging-dir", required=False, help="pasta do staging em Parquet (padrão: staging/ ao lado do banco)")
+    parser.add_argument("--no-staging", action="store_true", help="não lê nem grava o staging em Parquet")
+    parser.add_argument("--settle", type=float, default=5.0, help="segundos sem mudança no arquivo antes de carregá-lo (padrão: 5)")
+    parser.add_argument("--interval", type=float, default=2.0, help="intervalo de verificação em segundos (padrão: 2)")
+    parser.add_argument("--polling", action="store_true", help="usa polling mesmo com o watchdog instalado")
+    parser.add_argument("--no-normalize", action="store_true", help="só atualiza devolucoes_clean, sem rodar a normalização")
+    args = parser.parse_args()
+
+    input_dir = Path(args.input_dir)
+    db_path = Path(args.db)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    mapping = load_mapping(args.map) if args.map else None
+    staging_dir = None
+    if not args.no_staging and pq is not None:
+        staging_dir = Path(args.staging_dir) if args.staging_dir else db_path.parent / "staging"
+
+    debouncer = Debouncer(args.settle)
+    # arquivos que chegaram com o processo parado: o manifesto descarta os já
+    # carregados sem reler o conteúdo
+    for f in list_input_files(input_dir):
+        debouncer.touch(f)
+
+    observer = poller = None
+    if Observer is not None and not args.polling:
+        observer = Observer()
+        observer.schedule(_Handler(debouncer), str(input_dir), recursive=False)
+        observer.start()
+        print(f"Observando {input_dir} (watchdog)")
+    else:
+        poller = Poller(input_dir, debouncer)
+        print(f"Observando {input_dir} (polling a cada {args.interval:g}s)")
+
+    try:
+        while True:
+            if poller is not None:
+                poller.scan()
+            files = debouncer.ready()
+            if files:
+                try:
+                    parsed = run_batch(db_path, input_dir, files, mapping, staging_dir, not args.no_normalize)
+                    if parsed:
+                        print(f"Carregados: {', '.join(f.name for f, _, _, _ in parsed)}")
+                except Exception as e:
+                    # o daemon continua; o arquivo volta a ser tentado quando for salvo de novo
+                    print(f"Erro na carga de {', '.join(f.name for f in files)}: {e}")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Gravação de planilhas .xlsx em streaming (openpyxl write-only).
+
+Usado na aba `detalhes` do reports.py e no export do app: as linhas vão
+direto para o arquivo, em blocos de CHUNK_ROWS, sem montar a planilha em
+memória nem percorrer célula por célula depois.
+
+- largura das colunas estimada numa amostra de SAMPLE_ROWS linhas;
+- formato monetário e link definidos por coluna (uma célula de estilo
+  reaproveitada em todas as linhas);
+- links gravados como fórmula =HYPERLINK(...), sem objetos de hyperlink.
+"""
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+MONEY_FORMAT = '#,##0.00'
+SAMPLE_ROWS = 1000
+CHUNK_ROWS = 10000
+MAX_WIDTH = 50
+
+HEADER_FONT = Font(bold=True, color='000000')
+LINK_FONT = Font(color='0000EE', underline='single')
+CENTER = Alignment(horizontal='center')
+
+
+def column_widths(df, sample=SAMPLE_ROWS):
+    """Largura de cada coluna: maior texto (cabeçalho ou valor) numa amostra
+    das linhas, + 4, limitada a MAX_WIDTH."""
+    part = df if len(df) <= sample else df.sample(sample, random_state=0)
+    widths = []
+    for i, col in enumerate(df.columns):
+        values = part.iloc[:, i].dropna()
+        longest = int(values.astype(str).str.len().max()) if len(values) else 0
+        widths.append(min(max(longest, len(str(col))) + 4, MAX_WIDTH))
+    return widths
+
+
+def link_formula(url, text):
+    """Fórmula HYPERLINK com aspas escapadas."""
+    url = str(url).replace('"', '""')
+    text = str(text).replace('"', '""')
+    return f'=HYPERLINK("{url}","{text}")'
+
+
+def iter_rows(df, chunksize=CHUNK_ROWS):
+    """Linhas de `df` como tuplas de objetos Python (NaN/NaT viram None),
+    convertidas um bloco por vez. Períodos (mês) saem como texto e datas
+    com fuso no horário local delas (o Excel não guarda fuso)."""
+    periods = [c for c in df.columns if isinstance(df[c].dtype, pd.PeriodDtype)]
+    zoned = [c for c in df.columns if isinstance(df[c].dtype, pd.DatetimeTZDtype)]
+    for start in range(0, len(df), chunksize):
+        part = df.iloc[start:start + chunksize]
+        if periods or zoned:
+            part = part.copy()
+            for c in periods:
+                part[c] = part[c].astype(str)
+            for c in zoned:
+                part[c] = part[c].dt.tz_localize(None)
+        part = part.astype(object).where(part.notna(), None)
+        yield from part.itertuples(index=False, name=None)
+
+
+def write_sheet(wb, title, df, money_cols=(), link_cols=(), link_url=None, chunksize=CHUNK_ROWS):
+    """Acrescenta a aba `title` com `df` a um Workbook(write_only=True).
+
+    `money_cols` recebem MONEY_FORMAT; em `link_cols` cada valor vira
+    =HYPERLINK(link_url.format(valor), valor).
+    """
+    ws = wb.create_sheet(title)
+    # larguras precisam estar definidas antes da primeira linha
+    for idx, width in enumerate(column_widths(df), start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+
+    header = []
+    for col in df.columns:
+        cell = WriteOnlyCell(ws, str(col))
+        cell.font = HEADER_FONT
+        cell.alignment = CENTER
+        header.append(cell)
+    ws.append(header)
+
+    cols = list(df.columns)
+    money = [cols.index(c) for c in money_cols if c in cols]
+    links = [cols.index(c) for c in link_cols if c in cols] if link_url else []
+    styled = {}
+    for i in money:
+        styled[i] = WriteOnlyCell(ws)
+        styled[i].number_format = MONEY_FORMAT
+    for i in links:
+        styled[i] = WriteOnlyCell(ws)
+        styled[i].font = LINK_FONT
+        styled[i].alignment = CENTER
+
+    for values in iter_rows(df, chunksize):
+        if not styled:
+            ws.append(values)
+            continue
+        row = list(values)
+        for i, cell in styled.items():
+            value = row[i]
+            if value is None:
+                continue
+            if i in links:
+                text = str(value).strip()
+                if not text:
+                    continue
+                value = link_formula(link_url.format(text), text)
+            # a célula é gravada no append, então pode ser reaproveitada
+            cell.value = value
+            row[i] = cell
+        ws.append(row)
+    return ws
+
+
+def write_xlsx(path, sheets, **options):
+    """Grava {nome da aba: DataFrame} em `path`. `options` (ver write_sheet)
+    valem para todas as abas."""
+    wb = Workbook(write_only=True)
+    for title, df in sheets.items():
+        write_sheet(wb, title, df, **options)
+    wb.save(path)